@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 from abc import ABC, abstractmethod
-from typing import AsyncGenerator, Awaitable, Callable, List, Optional, Tuple, Union
+from typing import AsyncGenerator, Awaitable, Callable, List, NamedTuple, Optional, Tuple, Union
 
 from univention.provisioning.models.constants import BucketName
 from univention.provisioning.models.subscription import Subscription
@@ -11,6 +11,23 @@ from univention.provisioning.models.subscription import Subscription
 class UpdateConflict(Exception): ...
 
 
+class BucketLimits(NamedTuple):
+    """Limits of a bucket, 0 means unlimited."""
+
+    # maximum size of the bucket in bytes, the oldest entries are discarded when it is reached
+    max_bytes: int = 0
+    # number of revisions kept per key
+    history: int = 1
+    # seconds after their last change, after which entries are discarded
+    ttl: float = 0
+
+
+class BucketStats(NamedTuple):
+    # number of stored revisions, including deletion markers
+    values: int
+    bytes: int
+
+
 class KeyValueDB(ABC):
     """The base class for key-value store adapters."""
 
@@ -27,8 +44,22 @@ class KeyValueDB(ABC):
     async def close(self):
         pass
 
+    @property
     @abstractmethod
-    async def create_kv_store(self, bucket: BucketName):
+    def is_closed(self) -> bool:
+        """Whether the connection was closed and will not reconnect by itself."""
+        pass
+
+    @abstractmethod
+    async def create_kv_store(self, bucket: BucketName, limits: Optional[BucketLimits] = None):
+        """
+        Create `bucket` if it does not exist.
+        If `limits` are given, they are applied to an existing bucket too.
+        """
+        pass
+
+    @abstractmethod
+    async def get_bucket_stats(self, bucket: BucketName) -> BucketStats:
         pass
 
     @abstractmethod
@@ -51,14 +82,24 @@ class KeyValueDB(ABC):
         """
         pass
 
+    @abstractmethod
+    async def get_bytes_with_revision(self, key: str, bucket: BucketName) -> Optional[Tuple[bytes, int]]:
+        """
+        Retrieve the undecoded value and latest version (revision) at `key` in `bucket`.
+        Returns a tuple (value, revision) or None if key does not exist.
+        """
+        pass
+
     @abstractmethod
     async def put_value(
-        self, key: str, value: Union[str, dict, list], bucket: BucketName, revision: Optional[int] = None
-    ) -> None:
+        self, key: str, value: Union[str, bytes, dict, list], bucket: BucketName, revision: Optional[int] = None
+    ) -> Optional[int]:
         """
-        Store `value` at `key` in `bucket`.
+        Store `value` at `key` in `bucket`. Bytes are stored as they are, other values UTF-8 encoded.
         If `revision` is None overwrite value in DB without a further check.
         If `revision` is not None and the revision in the DB is different, raise UpdateConflict.
+        If `revision` is 0, only create `key`, raise UpdateConflict if it exists.
+        Returns the new revision of `key` or None, if `key` was deleted because `value` is empty.
         """
         pass
 
@@ -71,11 +112,33 @@ class KeyValueDB(ABC):
         pass
 
     @abstractmethod
-    async def watch_for_subscription_changes(self, callback: Callable[[str, Optional[bytes]], Awaitable[None]]) -> None:
+    async def watch_for_subscription_changes(
+        self,
+        callback: Callable[[str, Optional[bytes]], Awaitable[None]],
+        initialized: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
         """
         Call the `callback` function for any change to the Subscriptions KV bucket.
 
+        The current values of all keys are delivered first, then `initialized` is called.
+
         :param callback: Async function that accepts two arguments: the key of the changed entry (str)
             and its value (bytes). When the value is None, the key has been deleted.
+        :param initialized: Async function without arguments.
+        """
+        pass
+
+    @abstractmethod
+    async def watch_for_changes(
+        self, bucket: BucketName, callback: Callable[[str, int], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        """
+        Call the `callback` function for any change to `bucket` from now on, until the returned function is called.
+
+        Only the metadata of the changes is transferred, not the values.
+
+        :param callback: Async function that accepts two arguments: the key of the changed entry (str)
+            and its new revision (int). The key may have been updated or deleted.
+        :return: Async function that stops watching.
         """
         pass
@@ -0,0 +1,168 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, Optional
+
+from univention.provisioning.models.message import MQMessage
+
+from .message_queue import Acknowledgements, MessageAckManager
+
+logger = logging.getLogger(__name__)
+
+# Key of messages that are handled after all messages submitted before them, and before all messages submitted
+# after them, whatever their keys are.
+BARRIER = object()
+
+
+class _Submission(NamedTuple):
+    key: Hashable
+    message: MQMessage
+    acknowledgements: Acknowledgements
+    # Whether the message was handled successfully, set when `handling` is done.
+    handled: "asyncio.Future[bool]"
+    handling: "asyncio.Task[bool]"
+    ack_wait_extender: "asyncio.Task[None]"
+
+
+class KeyedMessagePipeline:
+    """
+    Handles up to `size` messages concurrently, keeping the order of the messages that have the same key.
+
+    Messages with different keys are handled in parallel, messages with the same key one after the other.
+    After a message with a key failed, the following messages with that key are not handled but negatively
+    acknowledged too, so that they are redelivered after it, in order. This applies to all messages with that key
+    whose `submit()` was called before the last of them was negatively acknowledged, even if they were still
+    waiting for capacity.
+
+    A message with the key `BARRIER` is handled alone: after all messages submitted before it were handled, and
+    before any message submitted after it. If it fails, all messages submitted until it was negatively acknowledged
+    are negatively acknowledged too.
+
+    Messages are acknowledged in the order they were submitted, after they were handled.
+
+    Use as an asynchronous context manager, leaving it waits for all submitted messages to be acknowledged.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[MQMessage], Awaitable[Any]],
+        key: Callable[[MQMessage], Hashable],
+        size: int,
+        ack_manager: Optional[MessageAckManager] = None,
+    ):
+        self.handler = handler
+        self.key = key
+        self.size = size
+        self.ack_manager = ack_manager or MessageAckManager()
+        self._capacity = asyncio.Semaphore(size)
+        self._submissions: asyncio.Queue[_Submission] = asyncio.Queue()
+        # The last submitted message of each key that is not acknowledged yet.
+        self._last_by_key: dict[Hashable, asyncio.Future[bool]] = {}
+        self._failed_keys: set[Hashable] = set()
+        # The last submitted barrier message, if it is not acknowledged yet.
+        self._barrier: Optional[asyncio.Future[bool]] = None
+        self._committer: Optional[asyncio.Task[None]] = None
+
+    async def __aenter__(self) -> "KeyedMessagePipeline":
+        self._committer = asyncio.create_task(self._commit())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> bool:
+        try:
+            if exc_type is None:
+                await self.join()
+        finally:
+            self._committer.cancel()
+            while not self._submissions.empty():
+                submission = self._submissions.get_nowait()
+                submission.handling.cancel()
+                submission.ack_wait_extender.cancel()
+        return False
+
+    async def submit(self, message: MQMessage, acknowledgements: Acknowledgements) -> None:
+        """Start handling a message, waiting while `size` messages are not acknowledged yet."""
+        # The message takes its place in the order of its key now, not after waiting for capacity.
+        key = self.key(message)
+        handled: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        barrier = self._barrier
+        if key is BARRIER:
+            previous = [*self._last_by_key.values()]
+            self._barrier = handled
+        else:
+            previous = [self._last_by_key[key]] if key in self._last_by_key else []
+            self._last_by_key[key] = handled
+        try:
+            await self._capacity.acquire()
+        except BaseException:
+            handled.set_result(False)
+            self._forget(key, handled)
+            raise
+        handling = asyncio.create_task(self._handle(key, message, previous, barrier))
+        handling.add_done_callback(
+            lambda task: handled.done() or handled.set_result(not task.cancelled() and task.result())
+        )
+        ack_wait_extender = asyncio.create_task(
+            self.ack_manager.extend_ack_wait(acknowledgements.acknowledge_message_in_progress)
+        )
+        self._submissions.put_nowait(_Submission(key, message, acknowledgements, handled, handling, ack_wait_extender))
+
+    async def join(self) -> None:
+        """Wait until all submitted messages were acknowledged."""
+        await self._submissions.join()
+
+    async def _handle(
+        self,
+        key: Hashable,
+        message: MQMessage,
+        previous: list[asyncio.Future[bool]],
+        barrier: Optional[asyncio.Future[bool]],
+    ) -> bool:
+        if barrier:
+            previous.append(barrier)
+        if previous:
+            await asyncio.wait(previous)
+        if key in self._failed_keys:
+            logger.warning("Not handling message %r, a previous message with the key %r failed.", message, key)
+            return False
+        if barrier and not barrier.result():
+            logger.warning("Not handling message %r, the previous barrier message was not handled.", message)
+            return False
+        try:
+            await self.handler(message)
+        except Exception as exc:
+            logger.error("Failed to handle message with the key %r: %r", key, exc)
+            self._failed_keys.add(key)
+            return False
+        return True
+
+    async def _commit(self) -> None:
+        while True:
+            submission = await self._submissions.get()
+            try:
+                if await submission.handled:
+                    await submission.acknowledgements.acknowledge_message()
+                else:
+                    await submission.acknowledgements.acknowledge_message_negatively()
+            except Exception:
+                logger.error("Failed to acknowledge message: %s", submission.message)
+            finally:
+                # Only now the failed message will be redelivered before any newer message with the same key.
+                if self._forget(submission.key, submission.handled):
+                    self._failed_keys.discard(submission.key)
+                submission.ack_wait_extender.cancel()
+                self._capacity.release()
+                self._submissions.task_done()
+
+    def _forget(self, key: Hashable, handled: asyncio.Future[bool]) -> bool:
+        """Forget the message of `key` that is `handled`, if it is still the last one. Return whether it was."""
+        if key is BARRIER:
+            if self._barrier is not handled:
+                return False
+            self._barrier = None
+        elif self._last_by_key.get(key) is handled:
+            del self._last_by_key[key]
+        else:
+            return False
+        return True
@@ -6,7 +6,7 @@ import json
 import logging
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Callable, Coroutine, NamedTuple, Tuple
+from typing import Any, AsyncIterable, Callable, Coroutine, NamedTuple, Optional, Tuple
 
 from typing_extensions import Self
 
@@ -75,6 +75,12 @@ class MessageQueue(ABC):
     async def close(self):
         pass
 
+    @property
+    @abstractmethod
+    def is_closed(self) -> bool:
+        """Whether the connection was closed and will not reconnect by itself."""
+        pass
+
     @abstractmethod
     async def add_message(
         self,
@@ -85,6 +91,17 @@ class MessageQueue(ABC):
         """Publish a message to a NATS subject."""
         pass
 
+    @abstractmethod
+    async def add_messages(
+        self,
+        queue,
+        messages: AsyncIterable[BaseMessage],
+        window: int = 256,
+        binary_encoder: Callable[[Any], bytes] = json_encoder,
+    ) -> int:
+        """Publish messages in order, with up to `window` messages not acknowledged yet. Returns their number."""
+        pass
+
     @abstractmethod
     async def initialize_subscription(self, queue, migrate_stream: bool = False) -> QueueStatus:
         """Initialize a subscription to a queue.
@@ -103,6 +120,31 @@ class MessageQueue(ABC):
         """Retrieve multiple messages from a NATS subject."""
         pass
 
+    @abstractmethod
+    async def get_messages(self, queue, timeout: float, max_messages: int, pop: bool, after: int = 0):
+        """Retrieve up to `max_messages` messages following sequence number `after` from a NATS stream, in order."""
+        pass
+
+    @abstractmethod
+    async def read_stream(self, queue, sequence_number: int, max_messages: int, pop: bool):
+        """Read up to `max_messages` messages following `sequence_number` directly from the stream, in order."""
+        pass
+
+    @abstractmethod
+    async def watch_for_messages(
+        self, queue, callback: Callable[[], Coroutine[Any, Any, None]]
+    ) -> Callable[[], Coroutine[Any, Any, None]]:
+        """
+        Call the `callback` function whenever a message is published to the queue, until the returned function is
+        called.
+        """
+        pass
+
+    @abstractmethod
+    async def get_num_ack_pending(self, queue) -> int:
+        """Number of messages delivered by the queue's consumer that were not acknowledged yet."""
+        pass
+
     @abstractmethod
     async def get_one_message(
         self,
@@ -111,10 +153,29 @@ class MessageQueue(ABC):
     ) -> Tuple[MQMessage, Acknowledgements]:
         pass
 
+    @abstractmethod
+    async def get_message_batch(
+        self,
+        max_messages: int,
+        timeout: float = 10,
+        binary_decoder: Callable[[bytes], Any] = json_decoder,
+    ) -> list[Tuple[MQMessage, Acknowledgements]]:
+        """Returns up to `max_messages` messages, each with the callables that acknowledge it."""
+        pass
+
     @abstractmethod
     async def delete_message(self, queue, seq_num: int):
         pass
 
+    @abstractmethod
+    async def delete_messages(self, queue, seq_nums: list[int]) -> dict[int, Optional[str]]:
+        """
+        Delete multiple messages.
+
+        Returns the error description for each sequence number, or None if the message was deleted.
+        """
+        pass
+
     @abstractmethod
     async def delete_stream(self, queue):
         pass
@@ -1,29 +1,56 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
+import asyncio
 import json
 import logging
-from typing import AsyncGenerator, Awaitable, Callable, List, Optional, Tuple, Union
+from collections import Counter
+from typing import AsyncGenerator, Awaitable, Callable, List, Optional, Tuple, TypeVar, Union
 
 from nats.aio.client import Client as NATS
-from nats.js.errors import BucketNotFoundError, KeyNotFoundError, KeyWrongLastSequenceError, NoKeysError
-from nats.js.kv import KV_DEL, KV_PURGE
+from nats.aio.msg import Msg
+from nats.js.api import DeliverPolicy, DiscardPolicy, StreamConfig
+from nats.js.errors import (
+    BucketNotFoundError,
+    KeyNotFoundError,
+    KeyWrongLastSequenceError,
+    NoKeysError,
+    NoStreamResponseError,
+    NotFoundError,
+)
+from nats.js.kv import KV_DEL, KV_PURGE, KeyValue
 
 from univention.provisioning.models.constants import BucketName
 from univention.provisioning.models.subscription import Subscription
 
-from .key_value_db import KeyValueDB, UpdateConflict
+from .key_value_db import BucketLimits, BucketStats, KeyValueDB, UpdateConflict
 
 logger = logging.getLogger(__name__)
 
+# JetStream API error code: stream not found
+STREAM_NOT_FOUND = 10059
+# NATS default of the time in seconds in which messages with the same ID are discarded as duplicates
+DUPLICATE_WINDOW = 2 * 60
+
+T = TypeVar("T")
+
 
 class NatsKeyValueDB(KeyValueDB):
-    """A key-value store using NATS as backend."""
+    """
+    A key-value store using NATS as backend.
+
+    The handles of the buckets are looked up once and kept, until the connection to NATS is reestablished or a
+    bucket turns out to be missing. `round_trips` counts the requests to the NATS server by type.
+    """
 
     def __init__(self, server: str, user: str, password: str):
         super().__init__(server=server, user=user, password=password)
         self._nats = NATS()
         self._js = self._nats.jetstream()
+        self._buckets: dict[BucketName, KeyValue] = {}
+        # The limits applied to each bucket, to apply them again if the bucket is recreated.
+        self._limits: dict[BucketName, BucketLimits] = {}
+        self.round_trips: Counter[str] = Counter()
 
     async def init(self, buckets: List[BucketName]):
         await self._nats.connect(
@@ -31,24 +58,95 @@ class NatsKeyValueDB(KeyValueDB):
             user=self._user,
             password=self._password,
             max_reconnect_attempts=1,
+            reconnected_cb=self.reconnected_callback,
         )
         for bucket in buckets:
             await self.create_kv_store(bucket)
 
+    async def reconnected_callback(self):
+        logger.debug("Reconnected to NATS, looking up buckets again.")
+        self._buckets.clear()
+
     async def close(self):
+        self._buckets.clear()
         await self._nats.close()
 
+    @property
+    def is_closed(self) -> bool:
+        return self._nats.is_closed
+
     # TODO: Rename to ensure_kv_store()
-    async def create_kv_store(self, bucket: BucketName):
+    async def create_kv_store(self, bucket: BucketName, limits: Optional[BucketLimits] = None):
+        """
+        Create `bucket` if it does not exist.
+        If `limits` are given, they are applied to an existing bucket too.
+        """
         try:
-            await self._js.key_value(bucket.value)
+            await self._bucket(bucket)
         except BucketNotFoundError:
             logger.info("Creating bucket with the name: %r", bucket)
-            await self._js.create_key_value(bucket=bucket.value)
+            self.round_trips["create_bucket"] += 1
+            self._buckets[bucket] = await self._js.create_key_value(bucket=bucket.value)
+        if limits:
+            await self.apply_bucket_limits(bucket, limits)
+
+    async def apply_bucket_limits(self, bucket: BucketName, limits: BucketLimits) -> None:
+        """
+        Update the configuration of the stream of `bucket`, if it differs from `limits`.
+
+        When `max_bytes` is reached, the oldest entries are discarded, instead of rejecting new ones.
+        The limits are applied again when the bucket is recreated, after it was deleted.
+        """
+        self._limits[bucket] = limits
+        self.round_trips["stream_info"] += 1
+        config: StreamConfig = (await self._js.stream_info(self.stream_name(bucket))).config
+        wanted = {
+            "max_bytes": limits.max_bytes or -1,
+            "max_msgs_per_subject": limits.history,
+            "max_age": limits.ttl,
+            "duplicate_window": min(DUPLICATE_WINDOW, limits.ttl or DUPLICATE_WINDOW),
+            "discard": DiscardPolicy.OLD if limits.max_bytes else config.discard,
+        }
+        if all(getattr(config, name) == value for name, value in wanted.items()):
+            return
+        logger.info("Updating the limits of the bucket %r: %r", bucket, limits)
+        self.round_trips["update_stream"] += 1
+        await self._js.update_stream(config.evolve(**wanted))
+
+    async def get_bucket_stats(self, bucket: BucketName) -> BucketStats:
+        self.round_trips["stream_info"] += 1
+        state = (await self._js.stream_info(self.stream_name(bucket))).state
+        return BucketStats(values=state.messages, bytes=state.bytes)
+
+    @staticmethod
+    def stream_name(bucket: BucketName) -> str:
+        return f"KV_{bucket.value}"
+
+    async def _bucket(self, bucket: BucketName) -> KeyValue:
+        """Get the handle of `bucket`, looking it up on the server only the first time."""
+        if bucket not in self._buckets:
+            self.round_trips["bucket_info"] += 1
+            self._buckets[bucket] = await self._js.key_value(bucket.value)
+        return self._buckets[bucket]
+
+    async def _call(self, bucket: BucketName, request: str, func: Callable[[KeyValue], Awaitable[T]]) -> T:
+        """Call `func` with the handle of `bucket`, recreating the bucket and retrying once, if it was deleted."""
+        kv_store = await self._bucket(bucket)
+        self.round_trips[request] += 1
+        try:
+            return await func(kv_store)
+        except (NoStreamResponseError, NotFoundError) as exc:
+            if isinstance(exc, NotFoundError) and getattr(exc, "err_code", None) != STREAM_NOT_FOUND:
+                raise
+            logger.warning("Bucket %r not found, recreating it.", bucket)
+        self._buckets.pop(bucket, None)
+        await self.create_kv_store(bucket, self._limits.get(bucket))
+        kv_store = await self._bucket(bucket)
+        self.round_trips[request] += 1
+        return await func(kv_store)
 
     async def delete_kv_pair(self, key: str, bucket: BucketName):
-        kv_store = await self._js.key_value(bucket.value)
-        await kv_store.delete(key)
+        await self._call(bucket, "delete", lambda kv_store: kv_store.delete(key))
 
     async def get_value(self, key: str, bucket: BucketName) -> Optional[str]:
         """
@@ -63,51 +161,74 @@ class NatsKeyValueDB(KeyValueDB):
         Retrieve value and latest version (revision) at `key` in `bucket`.
         Returns a tuple (value, revision) or None if key does not exist.
         """
-        kv_store = await self._js.key_value(bucket.value)
+        result = await self.get_bytes_with_revision(key, bucket)
+        return (result[0].decode("utf-8"), result[1]) if result else None
+
+    async def get_bytes_with_revision(self, key: str, bucket: BucketName) -> Optional[Tuple[bytes, int]]:
+        """
+        Retrieve the undecoded value and latest version (revision) at `key` in `bucket`.
+        Returns a tuple (value, revision) or None if key does not exist.
+        """
         try:
-            result = await kv_store.get(key)
-            return result.value.decode("utf-8"), result.revision if result else None
+            result = await self._call(bucket, "get", lambda kv_store: kv_store.get(key))
+            return result.value, result.revision if result else None
         except KeyNotFoundError:
             pass
 
     async def put_value(
-        self, key: str, value: Union[str, dict, list], bucket: BucketName, revision: Optional[int] = None
-    ) -> None:
+        self, key: str, value: Union[str, bytes, dict, list], bucket: BucketName, revision: Optional[int] = None
+    ) -> Optional[int]:
         """
-        Store `value` at `key` in `bucket`.
+        Store `value` at `key` in `bucket`. Bytes are stored as they are, other values UTF-8 encoded.
         If `revision` is None overwrite value in DB without a further check.
         If `revision` is not None and the revision in the DB is different, raise UpdateConflict.
+        If `revision` is 0, only create `key`, raise UpdateConflict if it exists.
+        Returns the new revision of `key` or None, if `key` was deleted because `value` is empty.
         """
-        kv_store = await self._js.key_value(bucket.value)
-
         if not value:
             # Avoid creating a pair with an empty value
             await self.delete_kv_pair(key, bucket)
-            return
+            return None
 
-        if not isinstance(value, str):
-            value = json.dumps(value)
+        if isinstance(value, bytes):
+            data = value
+        elif isinstance(value, str):
+            data = value.encode("utf-8")
+        else:
+            data = json.dumps(value).encode("utf-8")
 
-        if revision:
+        if revision == 0:
             try:
-                await kv_store.update(key, value.encode("utf-8"), revision)
+                return await self._call(bucket, "create", lambda kv_store: kv_store.create(key, data))
+            except KeyWrongLastSequenceError as exc:
+                raise UpdateConflict(str(exc)) from exc
+        elif revision:
+            try:
+                return await self._call(bucket, "update", lambda kv_store: kv_store.update(key, data, revision))
             except KeyWrongLastSequenceError as exc:
                 raise UpdateConflict(str(exc)) from exc
         else:
-            await kv_store.put(key, value.encode("utf-8"))
-            return
+            return await self._call(bucket, "put", lambda kv_store: kv_store.put(key, data))
 
     async def get_keys(self, bucket: BucketName) -> List[str]:
-        kv_store = await self._js.key_value(bucket.value)
         try:
-            return await kv_store.keys()
+            return await self._call(bucket, "keys", lambda kv_store: kv_store.keys())
         except NoKeysError:
             return []
 
     async def get_all_subscriptions(self) -> AsyncGenerator[Subscription, None]:
-        kv_store = await self._js.key_value(BucketName.subscriptions.value)
-        for key in await self.get_keys(BucketName.subscriptions):
-            entry = await kv_store.get(key)
+        keys = await self.get_keys(BucketName.subscriptions)
+        # Request all subscriptions at once, instead of waiting for each response before sending the next request.
+        entries = await asyncio.gather(
+            *(self._call(BucketName.subscriptions, "get", lambda kv_store, key=key: kv_store.get(key)) for key in keys),
+            return_exceptions=True,
+        )
+        for key, entry in zip(keys, entries):
+            if isinstance(entry, KeyNotFoundError):
+                # deleted since listing the keys
+                continue
+            if isinstance(entry, BaseException):
+                raise entry
             try:
                 subscription_dict = json.loads(entry.value)
                 subscription = Subscription.model_validate(subscription_dict)
@@ -116,14 +237,22 @@ class NatsKeyValueDB(KeyValueDB):
                 raise
             yield subscription
 
-    async def watch_for_subscription_changes(self, callback: Callable[[str, Optional[bytes]], Awaitable[None]]) -> None:
+    async def watch_for_subscription_changes(
+        self,
+        callback: Callable[[str, Optional[bytes]], Awaitable[None]],
+        initialized: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
         """
         Call the `callback` function for any change to the Subscriptions KV bucket.
 
+        The current values of all keys are delivered first, then `initialized` is called.
+
         :param callback: Async function that accepts two arguments: the key of the changed entry (str)
             and its value (bytes). When the value is None, the key has been deleted.
+        :param initialized: Async function without arguments.
         """
-        kv_store = await self._js.key_value(BucketName.subscriptions.value)
+        kv_store = await self._bucket(BucketName.subscriptions)
+        self.round_trips["watch"] += 1
         watcher = await kv_store.watchall()
 
         while True:
@@ -134,8 +263,45 @@ class NatsKeyValueDB(KeyValueDB):
                 # update.values is the JSON dump of a Subscription object or None when the key was deleted/purged
                 # update.operation is the type of operation that triggered this
                 if not update:
+                    # Marks the end of the current values.
+                    if initialized:
+                        await initialized()
                     continue
                 try:
                     await callback(update.key, None if update.operation in {KV_DEL, KV_PURGE} else update.value)
                 except Exception as e:
                     logger.error("Error occurred while processing subscription change. key=%r exc=%s", update.key, e)
+
+    async def watch_for_changes(
+        self, bucket: BucketName, callback: Callable[[str, int], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        """
+        Call the `callback` function for any change to `bucket` from now on, until the returned function is called.
+
+        Only the metadata of the changes is transferred, not the values.
+        Unlike `KeyValue.watch()`, the current values of all keys are not delivered first.
+
+        :param callback: Async function that accepts two arguments: the key of the changed entry (str)
+            and its new revision (int). The key may have been updated or deleted.
+        :return: Async function that stops watching.
+        """
+        subject_prefix = f"$KV.{bucket.value}."
+
+        async def on_change(msg: Msg) -> None:
+            key = msg.subject[len(subject_prefix) :]
+            try:
+                await callback(key, msg.metadata.sequence.stream)
+            except Exception as exc:
+                logger.error("Error occurred while processing change. bucket=%r key=%r exc=%s", bucket, key, exc)
+
+        # An ordered consumer recreates itself after gaps and reconnects, so no change is missed.
+        self.round_trips["watch"] += 1
+        sub = await self._js.subscribe(
+            f"{subject_prefix}>",
+            stream=self.stream_name(bucket),
+            cb=on_change,
+            ordered_consumer=True,
+            deliver_policy=DeliverPolicy.NEW,
+            headers_only=True,
+        )
+        return sub.unsubscribe
@@ -9,12 +9,13 @@
 import asyncio
 import json
 import logging
-from typing import Any, Callable, Optional, Tuple
+from typing import Any, AsyncIterable, Awaitable, Callable, Optional, Tuple
 
 from nats.aio.client import Client as NATS
 from nats.aio.msg import Msg
 from nats.js.api import ConsumerConfig, DeliverPolicy, RetentionPolicy, StreamConfig
-from nats.js.errors import NotFoundError, ServerError
+from nats.js.client import JetStreamContext
+from nats.js.errors import APIError, NotFoundError, ServerError
 from typing_extensions import Self
 
 from univention.provisioning.models.message import BaseMessage, MQMessage, ProvisioningMessage
@@ -23,6 +24,9 @@ from .message_queue import Acknowledgements, Empty, MessageQueue, QueueStatus, j
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for the acknowledgement of an asynchronously published message, like `JetStreamContext.publish()`.
+PUBLISH_ACK_TIMEOUT = 5
+
 
 class BaseQueue:
     # the base queue name.
@@ -43,6 +47,9 @@ class BaseQueue:
     # Don't lower this on queues whose consumers rely on MessageAckManager
     # (LdapQueue, IncomingQueue, PrefillQueue): its extension cadence is 30s/5s.
     ack_wait: int | None = None
+    # Maximum number of messages delivered to the consumer but not acknowledged yet.
+    # Values above 1 allow pipelined processing, but give up the total order of redeliveries.
+    max_ack_pending: int = 1
 
     @property
     def queue_name(self) -> str:
@@ -68,7 +75,7 @@ class BaseQueue:
     def consumer_config(self) -> ConsumerConfig:
         kwargs: dict[str, Any] = dict(
             durable_name=self.consumer_name,
-            max_ack_pending=1,
+            max_ack_pending=self.max_ack_pending,
             deliver_policy=self.deliver_policy,
         )
         if self.ack_wait is not None:
@@ -121,6 +128,9 @@ class LdapQueue(BaseQueue):
 
     name = "ldap-producer"
 
+    def __init__(self, max_ack_pending: int = 1):
+        self.max_ack_pending = max_ack_pending
+
 
 class IncomingQueue(BaseQueue):
     """
@@ -133,9 +143,10 @@ class IncomingQueue(BaseQueue):
     retention_policy = RetentionPolicy.INTEREST
     deliver_policy = DeliverPolicy.NEW
 
-    def __init__(self, consumer_name: str):
+    def __init__(self, consumer_name: str, max_ack_pending: int = 1):
         self.name = "incoming"
         self._consumer_name = consumer_name
+        self.max_ack_pending = max_ack_pending
 
 
 class PrefillQueue(BaseQueue):
@@ -170,6 +181,10 @@ class NatsMessageQueue(MessageQueue):
         self._nats = NATS()
         self._js = self._nats.jetstream()
         self.pull_subscription = None
+        # Pull subscriptions used by get_message(), keyed by (stream, durable consumer).
+        # They belong to this object's connection and are dropped with it. The instances are long-lived,
+        # e.g. one per connection of the REST API's pool, so each consumer is looked up once per connection.
+        self._pull_subscriptions: dict[tuple[str, str], JetStreamContext.PullSubscription] = {}
 
     async def __aenter__(self) -> Self:
         await self.connect()
@@ -213,8 +228,13 @@ class NatsMessageQueue(MessageQueue):
         logger.debug("Reconnected to NATS")
 
     async def close(self):
+        self._pull_subscriptions.clear()
         await self._nats.close()
 
+    @property
+    def is_closed(self) -> bool:
+        return self._nats.is_closed
+
     async def add_message(
         self,
         queue: BaseQueue,
@@ -234,6 +254,58 @@ class NatsMessageQueue(MessageQueue):
             queue.message_subject,
         )
 
+    async def add_messages(
+        self,
+        queue: BaseQueue,
+        messages: AsyncIterable[BaseMessage],
+        window: int = 256,
+        binary_encoder: Callable[[Any], bytes] = json_encoder,
+    ) -> int:
+        """
+        Publish messages to a NATS subject, in order, without waiting for each acknowledgement.
+
+        Up to `window` messages are published but not acknowledged by the server yet. When the window is full,
+        all acknowledgements received in the meantime are collected at once.
+        Raises the first publishing error, or `asyncio.TimeoutError` if no acknowledgement arrives in time.
+
+        :return: The number of published messages.
+        """
+        pending: set[asyncio.Future] = set()
+        published = 0
+        try:
+            async for message in messages:
+                while len(pending) >= window:
+                    pending = await self._collect_acks(pending, asyncio.FIRST_COMPLETED)
+                pending.add(
+                    await self._js.publish_async(
+                        subject=queue.message_subject,
+                        payload=binary_encoder(message.model_dump()),
+                        stream=queue.queue_name,
+                    )
+                )
+                published += 1
+            while pending:
+                pending = await self._collect_acks(pending, asyncio.ALL_COMPLETED)
+        finally:
+            for future in pending:
+                future.cancel()
+        logger.debug(
+            "%d messages were published to the stream: %r with the subject: %r",
+            published,
+            queue.queue_name,
+            queue.message_subject,
+        )
+        return published
+
+    async def _collect_acks(self, pending: set[asyncio.Future], return_when: str) -> set[asyncio.Future]:
+        """Wait for acknowledgements of published messages, return the futures still pending."""
+        done, pending = await asyncio.wait(pending, timeout=PUBLISH_ACK_TIMEOUT, return_when=return_when)
+        if not done:
+            raise asyncio.TimeoutError(f"No acknowledgement for {len(pending)} published messages.")
+        for future in done:
+            future.result()
+        return pending
+
     async def initialize_subscription(self, queue: BaseQueue, migrate_stream: bool = False) -> QueueStatus:
         """Initializes a stream for a pull consumer.
 
@@ -257,6 +329,117 @@ class NatsMessageQueue(MessageQueue):
 
     async def get_message(self, queue: BaseQueue, timeout: float, pop: bool) -> Optional[ProvisioningMessage]:
         """Retrieve messages from a NATS subject."""
+        sub = await self._pull_subscription(queue)
+        try:
+            msgs = await sub.fetch(1, timeout)
+        except asyncio.TimeoutError:
+            return None
+        except APIError:
+            await self._forget_pull_subscriptions(queue.queue_name, queue.consumer_name)
+            raise
+
+        if pop:
+            await msgs[0].ack()
+
+        return self.provisioning_message_from(msgs[0])
+
+    async def get_messages(
+        self, queue: BaseQueue, timeout: float, max_messages: int, pop: bool, after: int = 0
+    ) -> list[ProvisioningMessage]:
+        """
+        Retrieve up to `max_messages` messages following sequence number `after` from a NATS stream, in stream order.
+
+        Only the first message is delivered through the durable consumer.
+        It allows a single unacknowledged message, so that redeliveries keep their order.
+        The messages following it are read directly from the stream, see `read_stream()`.
+        If they are not deleted before, the consumer delivers them again later.
+
+        The message delivered by the consumer is returned even if it does not follow `after`,
+        so that callers can tell an empty queue from one holding only messages they already know.
+        """
+        first = await self.get_message(queue, timeout, pop)
+        if first is None:
+            return []
+
+        new = first.sequence_number > after
+        stream_messages = await self.read_stream(queue, max(first.sequence_number, after), max_messages - new, pop)
+        return [first, *stream_messages]
+
+    async def read_stream(
+        self, queue: BaseQueue, sequence_number: int, max_messages: int, pop: bool
+    ) -> list[ProvisioningMessage]:
+        """
+        Read up to `max_messages` messages of the queue following `sequence_number` directly from the stream.
+
+        The messages are requested concurrently, each as the next message from one of the following sequence
+        numbers on. Sequence numbers of deleted messages, or messages of other subjects, yield the same message
+        more than once. Those gaps are filled by another round of requests.
+        The consumer does not know about these reads, so their number of deliveries is unknown (None).
+        """
+        found: dict[int, bytes] = {}
+        end_of_stream = False
+        while len(found) < max_messages and not end_of_stream:
+            start = max(found, default=sequence_number)
+            results = await asyncio.gather(
+                *(
+                    self._js.get_msg(queue.queue_name, start + offset, subject=queue.message_subject, next=True)
+                    for offset in range(1, max_messages - len(found) + 1)
+                ),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, NotFoundError):
+                    end_of_stream = True
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    found[result.seq] = result.data
+
+        if pop and found:
+            await asyncio.gather(*(self._js.delete_msg(queue.queue_name, seq_num) for seq_num in found))
+        return [self._provisioning_message(found[seq_num], seq_num, None) for seq_num in sorted(found)]
+
+    async def watch_for_messages(
+        self, queue: BaseQueue, callback: Callable[[], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        """
+        Call the `callback` function whenever a message is published to the queue's subject, until the returned
+        function is called.
+
+        Uses a core NATS subscription: nothing is consumed from the stream and no pull request is kept open.
+        """
+
+        async def on_message(msg: Msg) -> None:
+            try:
+                await callback()
+            except Exception as exc:
+                logger.error("Error occurred while processing a published message. subject=%r exc=%s", msg.subject, exc)
+
+        sub = await self._nats.subscribe(queue.message_subject, cb=on_message)
+        # The server must know the subscription before the caller looks for messages published earlier.
+        await self._nats.flush()
+        return sub.unsubscribe
+
+    async def get_num_ack_pending(self, queue: BaseQueue) -> int:
+        """
+        Number of messages delivered by the queue's consumer that were not acknowledged yet.
+
+        Messages deleted from the stream instead of being acknowledged count until their `ack_wait` passed.
+        """
+        return (await self._js.consumer_info(queue.queue_name, queue.consumer_name)).num_ack_pending
+
+    async def _pull_subscription(self, queue: BaseQueue) -> JetStreamContext.PullSubscription:
+        """
+        Return the pull subscription for the queue's stream and durable consumer.
+
+        The stream and consumer are looked up only when no subscription exists yet in this process.
+        Subscriptions are dropped again when the stream or consumer is deleted through this object.
+        A consumer that is deleted elsewhere does not break a cached subscription:
+        fetching from it times out, and its credentials are deleted together with it.
+        """
+        key = (queue.queue_name, queue.consumer_name)
+        if sub := self._pull_subscriptions.get(key):
+            return sub
 
         try:
             await self._js.stream_info(queue.queue_name)
@@ -274,15 +457,24 @@ class NatsMessageQueue(MessageQueue):
         sub = await self._js.pull_subscribe(
             queue.message_subject, durable=queue.consumer_name, stream=queue.queue_name, config=consumer
         )
-        try:
-            msgs = await sub.fetch(1, timeout)
-        except asyncio.TimeoutError:
-            return None
+        # Another coroutine may have subscribed while we were waiting for the server.
+        if existing := self._pull_subscriptions.get(key):
+            await self._unsubscribe(sub)
+            return existing
+        self._pull_subscriptions[key] = sub
+        return sub
+
+    async def _forget_pull_subscriptions(self, stream: str, durable: Optional[str] = None) -> None:
+        """Unsubscribe and drop cached pull subscriptions of a stream, or only of one of its consumers."""
+        for key in [k for k in self._pull_subscriptions if k[0] == stream and durable in (None, k[1])]:
+            await self._unsubscribe(self._pull_subscriptions.pop(key))
 
-        if pop:
-            await msgs[0].ack()
-
-        return self.provisioning_message_from(msgs[0])
+    @staticmethod
+    async def _unsubscribe(sub: JetStreamContext.PullSubscription) -> None:
+        try:
+            await sub.unsubscribe()
+        except Exception as exc:
+            logger.debug("Ignoring error while unsubscribing a pull subscription: %s", exc)
 
     async def get_one_message(
         self,
@@ -307,13 +499,46 @@ class NatsMessageQueue(MessageQueue):
             acknowledgements,
         )
 
-    @staticmethod
-    def provisioning_message_from(msg: Msg) -> ProvisioningMessage:
-        data = json.loads(msg.data)
+    async def get_message_batch(
+        self,
+        max_messages: int,
+        timeout: float = 10,
+        binary_decoder: Callable[[bytes], Any] = json_decoder,
+    ) -> list[Tuple[MQMessage, Acknowledgements]]:
+        """
+        Returns up to `max_messages` messages, each with the callables that acknowledge it.
+
+        Waits up to `timeout` seconds for the first message, and returns the messages available at that point.
+        The number of messages is further limited by the `max_ack_pending` setting of the consumer.
+        """
+        if not self.pull_subscription:
+            raise ValueError(
+                "Subscription class attribute is empty, ensure that initialize_subscription() has been called."
+            )
+
+        try:
+            messages = await self.pull_subscription.fetch(max_messages, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise Empty()
+
+        return [
+            (self.mq_message_from(message, binary_decoder=binary_decoder), self.build_acknowledgements(message))
+            for message in messages
+        ]
+
+    @classmethod
+    def provisioning_message_from(cls, msg: Msg) -> ProvisioningMessage:
         sequence_number = int(msg.reply.split(".")[-4])
+        return cls._provisioning_message(msg.data, sequence_number, msg.metadata.num_delivered)
+
+    @staticmethod
+    def _provisioning_message(
+        payload: bytes, sequence_number: int, num_delivered: Optional[int]
+    ) -> ProvisioningMessage:
+        data = json.loads(payload)
         message = ProvisioningMessage(
             sequence_number=sequence_number,
-            num_delivered=msg.metadata.num_delivered,
+            num_delivered=num_delivered,
             publisher_name=data["publisher_name"],
             ts=data["ts"],
             realm=data["realm"],
@@ -349,12 +574,14 @@ class NatsMessageQueue(MessageQueue):
 
     async def delete_stream(self, queue: BaseQueue):
         """Delete the entire stream for a given name in NATS JetStream."""
+        await self._forget_pull_subscriptions(queue.queue_name)
         try:
             await self._js.delete_stream(queue.queue_name)
         except NotFoundError:
             return None
 
     async def delete_consumer(self, queue: BaseQueue):
+        await self._forget_pull_subscriptions(queue.queue_name, queue.consumer_name)
         try:
             await self._js.delete_consumer(queue.queue_name, queue.consumer_name)
         except NotFoundError:
@@ -394,7 +621,7 @@ class NatsMessageQueue(MessageQueue):
         except ServerError as e:
             if not migrate_stream:
                 logger.error(
-                    "Stream %r update failed but migration not enabled. " "See docs/queue-migration.md. Error: %s",
+                    "Stream %r update failed but migration not enabled. See docs/queue-migration.md. Error: %s",
                     queue.queue_name,
                     str(e),
                 )
@@ -442,8 +669,17 @@ class NatsMessageQueue(MessageQueue):
 
     async def ensure_consumer(self, queue: BaseQueue):
         try:
-            await self._js.consumer_info(queue.queue_name, queue.consumer_name)
+            info = await self._js.consumer_info(queue.queue_name, queue.consumer_name)
             logger.info("A consumer with the name %r already exists", queue.consumer_name)
+            if info.config.max_ack_pending != queue.max_ack_pending:
+                # Creating a durable consumer with the same name updates its (editable) configuration.
+                await self._js.add_consumer(queue.queue_name, queue.consumer_config())
+                logger.info(
+                    "Changed max_ack_pending of the consumer %r from %r to %r",
+                    queue.consumer_name,
+                    info.config.max_ack_pending,
+                    queue.max_ack_pending,
+                )
         except NotFoundError:
             await self._js.add_consumer(
                 queue.queue_name,
@@ -479,5 +715,28 @@ class NatsMessageQueue(MessageQueue):
         except (ServerError, NotFoundError) as exc:
             raise ValueError(exc.description)
 
+    async def delete_messages(self, queue: BaseQueue, seq_nums: list[int]) -> dict[int, Optional[str]]:
+        """
+        Delete multiple messages, sending all requests before waiting for the responses.
+
+        Returns the error description for each sequence number, or None if the message was deleted.
+        """
+        logger.info("Deleting %d messages from the stream: %r", len(seq_nums), queue.queue_name)
+        results = await asyncio.gather(
+            *(self._js.delete_msg(queue.queue_name, seq_num) for seq_num in seq_nums), return_exceptions=True
+        )
+        errors: dict[int, Optional[str]] = {}
+        for seq_num, result in zip(seq_nums, results):
+            if isinstance(result, APIError):
+                errors[seq_num] = result.description or str(result)
+            elif isinstance(result, Exception):
+                errors[seq_num] = str(result) or type(result).__name__
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                errors[seq_num] = None
+        logger.info("%d messages were deleted", sum(error is None for error in errors.values()))
+        return errors
+
     async def purge_stream(self, queue: BaseQueue) -> None:
         await self._js.purge_stream(queue.queue_name, subject=queue.message_subject)
@@ -0,0 +1,201 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from univention.provisioning.backends.message_pipeline import BARRIER, KeyedMessagePipeline
+from univention.provisioning.backends.message_queue import Acknowledgements
+from univention.provisioning.models.message import MQMessage
+
+
+def mq_message(sequence_number: int, key: str) -> MQMessage:
+    return MQMessage(
+        subject="incoming",
+        reply="",
+        data={"key": key},
+        headers=None,
+        num_delivered=1,
+        sequence_number=sequence_number,
+    )
+
+
+def message_key(message: MQMessage) -> str:
+    return message.data["key"]
+
+
+class Recorder:
+    """Records the acknowledgements of all messages, in the order they happen."""
+
+    def __init__(self):
+        self.events: list[tuple[str, int]] = []
+
+    def acknowledgements(self, message: MQMessage) -> Acknowledgements:
+        async def ack():
+            self.events.append(("ack", message.sequence_number))
+
+        async def nak():
+            self.events.append(("nak", message.sequence_number))
+
+        return Acknowledgements(ack, nak, AsyncMock())
+
+
+@pytest.mark.anyio
+class TestKeyedMessagePipeline:
+    async def test_messages_with_different_keys_are_handled_concurrently(self):
+        recorder = Recorder()
+        both_started = asyncio.Barrier(2)
+
+        async def handler(message: MQMessage):
+            await asyncio.wait_for(both_started.wait(), timeout=1)
+
+        async with KeyedMessagePipeline(handler, message_key, size=2) as pipeline:
+            for message in (mq_message(1, "a"), mq_message(2, "b")):
+                await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert recorder.events == [("ack", 1), ("ack", 2)]
+
+    async def test_messages_with_the_same_key_are_handled_in_order(self):
+        recorder = Recorder()
+        handled = []
+
+        async def handler(message: MQMessage):
+            # The first message takes the longest.
+            await asyncio.sleep(0.01 * (4 - message.sequence_number))
+            handled.append(message.sequence_number)
+
+        async with KeyedMessagePipeline(handler, message_key, size=4) as pipeline:
+            for message in (mq_message(1, "a"), mq_message(2, "b"), mq_message(3, "a"), mq_message(4, "b")):
+                await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert handled.index(1) < handled.index(3)
+        assert handled.index(2) < handled.index(4)
+        assert handled.index(2) < handled.index(1)
+        # Acknowledged in the order of submission, although handled in another order.
+        assert recorder.events == [("ack", 1), ("ack", 2), ("ack", 3), ("ack", 4)]
+
+    async def test_failure_negatively_acknowledges_later_messages_with_the_same_key(self):
+        recorder = Recorder()
+        handled = []
+
+        async def handler(message: MQMessage):
+            if message.sequence_number == 1:
+                raise RuntimeError("failed")
+            handled.append(message.sequence_number)
+
+        async with KeyedMessagePipeline(handler, message_key, size=3) as pipeline:
+            for message in (mq_message(1, "a"), mq_message(2, "b"), mq_message(3, "a")):
+                await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert handled == [2]
+        assert recorder.events == [("nak", 1), ("ack", 2), ("nak", 3)]
+
+    async def test_failed_key_stays_blocked_until_negatively_acknowledged(self):
+        recorder = Recorder()
+        release_slow = asyncio.Event()
+        handled = []
+
+        async def handler(message: MQMessage):
+            if message.sequence_number == 1:
+                await release_slow.wait()
+            elif message.sequence_number == 2:
+                raise RuntimeError("failed")
+            handled.append(message.sequence_number)
+
+        async with KeyedMessagePipeline(handler, message_key, size=3) as pipeline:
+            for message in (mq_message(1, "slow"), mq_message(2, "a")):
+                await pipeline.submit(message, recorder.acknowledgements(message))
+            # Message 2 failed, its negative acknowledgement waits for message 1.
+            await asyncio.sleep(0.01)
+            assert recorder.events == []
+            message = mq_message(3, "a")
+            await pipeline.submit(message, recorder.acknowledgements(message))
+            await asyncio.sleep(0.01)
+            release_slow.set()
+
+        assert handled == [1]
+        assert recorder.events == [("ack", 1), ("nak", 2), ("nak", 3)]
+
+    async def test_failed_key_is_handled_again_later(self):
+        recorder = Recorder()
+        handler = AsyncMock(side_effect=[RuntimeError("failed"), None])
+
+        async with KeyedMessagePipeline(handler, message_key, size=2) as pipeline:
+            message = mq_message(1, "a")
+            await pipeline.submit(message, recorder.acknowledgements(message))
+            await pipeline.join()
+            message = mq_message(2, "a")
+            await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert recorder.events == [("nak", 1), ("ack", 2)]
+
+    async def test_barrier_is_handled_alone(self):
+        recorder = Recorder()
+        handling = set()
+        handled = []
+
+        async def handler(message: MQMessage):
+            handling.add(message.sequence_number)
+            if message.sequence_number == 3:
+                assert handling == {3}
+            # The messages before the barrier take the longest.
+            await asyncio.sleep(0.01 * (6 - message.sequence_number))
+            handling.remove(message.sequence_number)
+            handled.append(message.sequence_number)
+
+        def key(message: MQMessage):
+            return BARRIER if message.data["key"] == "barrier" else message_key(message)
+
+        async with KeyedMessagePipeline(handler, key, size=5) as pipeline:
+            for message in (mq_message(1, "a"), mq_message(2, "b"), mq_message(3, "barrier"), mq_message(4, "c")):
+                await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert handled.index(3) == 2
+        assert recorder.events == [("ack", 1), ("ack", 2), ("ack", 3), ("ack", 4)]
+
+    async def test_failed_barrier_negatively_acknowledges_later_messages(self):
+        recorder = Recorder()
+        handled = []
+
+        async def handler(message: MQMessage):
+            if message.sequence_number == 2:
+                raise RuntimeError("failed")
+            handled.append(message.sequence_number)
+
+        def key(message: MQMessage):
+            return BARRIER if message.data["key"] == "barrier" else message_key(message)
+
+        async with KeyedMessagePipeline(handler, key, size=3) as pipeline:
+            for message in (mq_message(1, "a"), mq_message(2, "barrier"), mq_message(3, "b")):
+                await pipeline.submit(message, recorder.acknowledgements(message))
+            await pipeline.join()
+            message = mq_message(4, "b")
+            await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert handled == [1, 4]
+        assert recorder.events == [("ack", 1), ("nak", 2), ("nak", 3), ("ack", 4)]
+
+    async def test_size_limits_unacknowledged_messages(self):
+        recorder = Recorder()
+        release = asyncio.Event()
+        in_flight = 0
+        max_in_flight = 0
+
+        async def handler(message: MQMessage):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await release.wait()
+            in_flight -= 1
+
+        async with KeyedMessagePipeline(handler, message_key, size=2) as pipeline:
+            for sequence_number in range(1, 4):
+                message = mq_message(sequence_number, str(sequence_number))
+                if sequence_number == 3:
+                    asyncio.get_running_loop().call_later(0.01, release.set)
+                await pipeline.submit(message, recorder.acknowledgements(message))
+
+        assert max_in_flight == 2
+        assert recorder.events == [("ack", 1), ("ack", 2), ("ack", 3)]
@@ -3,7 +3,6 @@
 
 import json
 from contextlib import nullcontext
-from unittest.mock import call
 
 try:
     from unittest.mock import AsyncMock
@@ -11,10 +10,11 @@ except ImportError:
     from mock import AsyncMock
 
 import pytest
-from nats.js.errors import BucketNotFoundError
+from nats.js.api import DiscardPolicy, StreamConfig
+from nats.js.errors import BucketNotFoundError, KeyWrongLastSequenceError, NoStreamResponseError, NotFoundError
 from test_helpers.mock_data import SUBSCRIPTION_NAME, SUBSCRIPTION_INFO_dumpable
 
-from univention.provisioning.backends.key_value_db import UpdateConflict
+from univention.provisioning.backends.key_value_db import BucketLimits, BucketStats, UpdateConflict
 from univention.provisioning.backends.mocks import FakeKvStore, MockNatsKVAdapter, kv_sub_info
 from univention.provisioning.models.constants import BucketName
 
@@ -50,6 +50,7 @@ class TestNatsKVAdapter:
             user=nats_credentials["username"],
             password=nats_credentials["password"],
             max_reconnect_attempts=1,
+            reconnected_cb=mock_nats_kv_adapter.reconnected_callback,
         )
         mock_nats_kv_adapter._js.create_key_value.assert_called_once_with(bucket=BucketName.subscriptions)
         assert result is None
@@ -104,7 +105,7 @@ class TestNatsKVAdapter:
         mock_nats_kv_adapter._js.key_value.assert_called_once_with(BucketName.subscriptions)
         mock_kv.delete.assert_not_called()
         mock_kv.put.assert_called_once_with("test_put_value", kv_sub_info.value)
-        assert result is None
+        assert result == 43
 
     @pytest.mark.parametrize("revision,expectation", ((12, nullcontext(None)), (13, pytest.raises(UpdateConflict))))
     async def test_put_value_with_revision(self, mock_nats_kv_adapter, mock_kv, revision, expectation):
@@ -120,7 +121,7 @@ class TestNatsKVAdapter:
         mock_kv.delete.assert_not_called()
         mock_kv.put.assert_not_called()
         mock_kv.update.assert_called_once_with(SUBSCRIPTION_NAME, kv_sub_info.value, revision)
-        assert result is None
+        assert result == 43
 
     async def test_put_empty_value(self, mock_nats_kv_adapter, mock_kv):
         await mock_nats_kv_adapter.put_value(
@@ -131,9 +132,126 @@ class TestNatsKVAdapter:
 
         result = await mock_nats_kv_adapter.put_value("test_put_empty_value", "", BucketName.subscriptions)
 
-        mock_nats_kv_adapter._js.key_value.assert_has_calls(
-            [call(BucketName.subscriptions), call(BucketName.subscriptions)]
-        )
+        mock_nats_kv_adapter._js.key_value.assert_called_once_with(BucketName.subscriptions)
         mock_kv.delete.assert_called_once_with("test_put_empty_value")
         mock_kv.put.assert_not_called()
         assert result is None
+
+    async def test_watch_for_changes(self, mock_nats_kv_adapter):
+        callback = AsyncMock()
+        sub = AsyncMock()
+        mock_nats_kv_adapter._js.subscribe = AsyncMock(return_value=sub)
+
+        stop = await mock_nats_kv_adapter.watch_for_changes(BucketName.cache, callback)
+
+        kwargs = mock_nats_kv_adapter._js.subscribe.call_args.kwargs
+        assert mock_nats_kv_adapter._js.subscribe.call_args.args == ("$KV.CACHE.>",)
+        assert kwargs["stream"] == "KV_CACHE"
+        assert kwargs["headers_only"] is True
+        msg = AsyncMock(subject="$KV.CACHE.1234-uuid")
+        msg.metadata.sequence.stream = 7
+        await kwargs["cb"](msg)
+        callback.assert_called_once_with("1234-uuid", 7)
+
+        await stop()
+        sub.unsubscribe.assert_called_once_with()
+
+    async def test_bucket_handles_are_kept(self, mock_nats_kv_adapter, mock_kv):
+        await mock_nats_kv_adapter.get_value(SUBSCRIPTION_NAME, BucketName.subscriptions)
+        await mock_nats_kv_adapter.put_value("key", "value", BucketName.subscriptions)
+        await mock_nats_kv_adapter.get_keys(BucketName.subscriptions)
+
+        mock_nats_kv_adapter._js.key_value.assert_called_once_with(BucketName.subscriptions)
+        assert mock_nats_kv_adapter.round_trips == {"bucket_info": 1, "put": 1, "get": 1, "keys": 1}
+
+        await mock_nats_kv_adapter.reconnected_callback()
+        await mock_nats_kv_adapter.get_value(SUBSCRIPTION_NAME, BucketName.subscriptions)
+
+        assert mock_nats_kv_adapter._js.key_value.call_count == 2
+
+    @pytest.mark.parametrize("error", (NoStreamResponseError(), NotFoundError(err_code=10059)))
+    async def test_deleted_bucket_is_recreated(self, mock_nats_kv_adapter, mock_kv, error):
+        new_kv = AsyncMock()
+        new_kv.put.return_value = 1
+        mock_kv.put = AsyncMock(side_effect=error)
+        mock_nats_kv_adapter._js.key_value = AsyncMock(side_effect=[mock_kv, BucketNotFoundError()])
+        mock_nats_kv_adapter._js.create_key_value = AsyncMock(return_value=new_kv)
+
+        result = await mock_nats_kv_adapter.put_value("key", "value", BucketName.subscriptions)
+
+        assert result == 1
+        mock_nats_kv_adapter._js.create_key_value.assert_called_once_with(bucket=BucketName.subscriptions)
+        new_kv.put.assert_called_once_with("key", b"value")
+        await mock_nats_kv_adapter.put_value("key", "value", BucketName.subscriptions)
+        assert new_kv.put.call_count == 2
+
+    async def test_recreated_bucket_gets_its_limits_again(self, mock_nats_kv_adapter, mock_kv):
+        config = StreamConfig(
+            name="KV_CACHE", max_bytes=-1, max_msgs_per_subject=1, max_age=0, duplicate_window=120, discard="new"
+        )
+        mock_nats_kv_adapter._js.stream_info = AsyncMock(return_value=AsyncMock(config=config))
+        mock_nats_kv_adapter._js.update_stream = AsyncMock()
+        limits = BucketLimits(max_bytes=1024)
+        await mock_nats_kv_adapter.create_kv_store(BucketName.cache, limits)
+        mock_kv.put = AsyncMock(side_effect=NoStreamResponseError())
+        mock_nats_kv_adapter._js.key_value = AsyncMock(side_effect=BucketNotFoundError())
+        mock_nats_kv_adapter._js.create_key_value = AsyncMock(return_value=AsyncMock())
+
+        await mock_nats_kv_adapter.put_value("key", b"value", BucketName.cache)
+
+        mock_nats_kv_adapter._js.create_key_value.assert_called_once_with(bucket=BucketName.cache)
+        assert mock_nats_kv_adapter._js.update_stream.call_count == 2
+        mock_nats_kv_adapter._js.update_stream.assert_called_with(
+            config.evolve(max_bytes=1024, discard=DiscardPolicy.OLD)
+        )
+
+    async def test_put_and_get_bytes(self, mock_nats_kv_adapter, mock_kv):
+        mock_kv.get = AsyncMock(return_value=AsyncMock(value=b"\x01\x80", revision=3))
+
+        await mock_nats_kv_adapter.put_value("key", b"\x01\x80", BucketName.cache)
+        result = await mock_nats_kv_adapter.get_bytes_with_revision("key", BucketName.cache)
+
+        mock_kv.put.assert_called_once_with("key", b"\x01\x80")
+        assert result == (b"\x01\x80", 3)
+
+    @pytest.mark.parametrize("exists", (False, True))
+    async def test_put_value_create_only(self, mock_nats_kv_adapter, mock_kv, exists):
+        mock_kv.create = AsyncMock(side_effect=KeyWrongLastSequenceError() if exists else None, return_value=1)
+
+        with pytest.raises(UpdateConflict) if exists else nullcontext():
+            assert await mock_nats_kv_adapter.put_value("key", b"value", BucketName.cache, revision=0) == 1
+
+        mock_kv.create.assert_called_once_with("key", b"value")
+        mock_kv.put.assert_not_called()
+
+    async def test_create_kv_store_applies_limits(self, mock_nats_kv_adapter):
+        config = StreamConfig(
+            name="KV_CACHE", max_bytes=-1, max_msgs_per_subject=1, max_age=0, duplicate_window=120, discard="new"
+        )
+        mock_nats_kv_adapter._js.stream_info = AsyncMock(return_value=AsyncMock(config=config))
+        mock_nats_kv_adapter._js.update_stream = AsyncMock()
+
+        await mock_nats_kv_adapter.create_kv_store(BucketName.cache, BucketLimits(max_bytes=1024, ttl=60))
+
+        mock_nats_kv_adapter._js.stream_info.assert_called_once_with("KV_CACHE")
+        mock_nats_kv_adapter._js.update_stream.assert_called_once_with(
+            config.evolve(max_bytes=1024, max_age=60, duplicate_window=60, discard=DiscardPolicy.OLD)
+        )
+
+        mock_nats_kv_adapter._js.stream_info.return_value.config = config.evolve(max_age=60, duplicate_window=60)
+        await mock_nats_kv_adapter.create_kv_store(BucketName.cache, BucketLimits(ttl=60))
+        mock_nats_kv_adapter._js.update_stream.assert_called_once()
+
+    async def test_get_bucket_stats(self, mock_nats_kv_adapter):
+        mock_nats_kv_adapter._js.stream_info = AsyncMock(return_value=AsyncMock(state=AsyncMock(messages=3, bytes=42)))
+
+        assert await mock_nats_kv_adapter.get_bucket_stats(BucketName.cache) == BucketStats(values=3, bytes=42)
+
+    async def test_get_all_subscriptions(self, mock_nats_kv_adapter, mock_kv):
+        # The second subscription was deleted after listing the keys.
+        mock_kv.keys = AsyncMock(return_value=[SUBSCRIPTION_NAME, "deleted"])
+
+        result = [sub async for sub in mock_nats_kv_adapter.get_all_subscriptions()]
+
+        assert [sub.name for sub in result] == [SUBSCRIPTION_NAME]
+        assert mock_nats_kv_adapter.round_trips["get"] == 2
@@ -2,8 +2,9 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import asyncio
-from unittest.mock import Mock
+from unittest.mock import Mock, call
 
+from univention.provisioning.backends.message_queue import Empty
 from univention.provisioning.backends.nats_mq import (
     ConsumerQueue,
     IncomingQueue,
@@ -109,6 +110,66 @@ class TestNatsMQAdapter:
         MSG.ack.assert_called_with()
         assert result == PROVISIONING_MESSAGE
 
+    async def test_add_messages(self, mock_nats_mq_adapter):
+        in_flight = []
+
+        async def publish_async(**kwargs):
+            assert len([future for future in in_flight if not future.done()]) < 2
+            future = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().call_soon(future.set_result, Mock())
+            in_flight.append(future)
+            return future
+
+        async def messages():
+            for _ in range(5):
+                yield MESSAGE
+
+        mock_nats_mq_adapter._js.publish_async = AsyncMock(side_effect=publish_async)
+
+        result = await mock_nats_mq_adapter.add_messages(self.consumer_queue, messages(), window=2)
+
+        assert result == 5
+        assert all(future.done() for future in in_flight)
+        mock_nats_mq_adapter._js.publish_async.assert_called_with(
+            subject=self.consumer_queue.message_subject,
+            payload=FLAT_MESSAGE_ENCODED,
+            stream=self.consumer_queue.queue_name,
+        )
+
+    async def test_add_messages_raises_publishing_errors(self, mock_nats_mq_adapter):
+        future = asyncio.get_running_loop().create_future()
+        future.set_exception(NotFoundError())
+        mock_nats_mq_adapter._js.publish_async = AsyncMock(return_value=future)
+
+        async def messages():
+            yield MESSAGE
+
+        with pytest.raises(NotFoundError):
+            await mock_nats_mq_adapter.add_messages(self.consumer_queue, messages())
+
+    async def test_watch_for_messages(self, mock_nats_mq_adapter):
+        callback = AsyncMock()
+        sub = AsyncMock()
+        mock_nats_mq_adapter._nats.subscribe = AsyncMock(return_value=sub)
+
+        stop = await mock_nats_mq_adapter.watch_for_messages(self.consumer_queue, callback)
+
+        assert mock_nats_mq_adapter._nats.subscribe.call_args.args == (f"{SUBSCRIPTION_NAME}.main",)
+        mock_nats_mq_adapter._nats.flush.assert_called_once_with()
+        await mock_nats_mq_adapter._nats.subscribe.call_args.kwargs["cb"](Mock(subject=f"{SUBSCRIPTION_NAME}.main"))
+        callback.assert_called_once_with()
+
+        await stop()
+        sub.unsubscribe.assert_called_once_with()
+
+    async def test_get_num_ack_pending(self, mock_nats_mq_adapter):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock(num_ack_pending=2))
+
+        assert await mock_nats_mq_adapter.get_num_ack_pending(self.consumer_queue) == 2
+        mock_nats_mq_adapter._js.consumer_info.assert_called_once_with(
+            self.consumer_queue.queue_name, self.consumer_queue.consumer_name
+        )
+
     async def test_get_messages_without_stream(self, mock_nats_mq_adapter, mock_fetch):
         mock_nats_mq_adapter._js.stream_info = AsyncMock(side_effect=NotFoundError)
         mock_nats_mq_adapter.delete_message = AsyncMock()
@@ -161,6 +222,142 @@ class TestNatsMQAdapter:
         mock_nats_mq_adapter.delete_message.assert_not_called()
         assert result is None
 
+    async def test_get_messages_reuses_pull_subscription(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+
+        await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+        result = await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+
+        mock_nats_mq_adapter._js.stream_info.assert_called_once_with(self.consumer_queue.queue_name)
+        mock_nats_mq_adapter._js.consumer_info.assert_called_once()
+        mock_nats_mq_adapter._js.pull_subscribe.assert_called_once()
+        assert mock_fetch.call_count == 2
+        assert result == PROVISIONING_MESSAGE
+
+    async def test_delete_consumer_drops_pull_subscription(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+        sub = mock_nats_mq_adapter._js.pull_subscribe.return_value
+
+        await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+        await mock_nats_mq_adapter.delete_consumer(self.consumer_queue)
+        await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+
+        sub.unsubscribe.assert_called_once_with()
+        assert mock_nats_mq_adapter._js.pull_subscribe.call_count == 2
+
+    async def test_delete_stream_drops_pull_subscription(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+
+        await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+        await mock_nats_mq_adapter.delete_stream(self.consumer_queue)
+        await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+
+        assert mock_nats_mq_adapter._js.stream_info.call_count == 2
+        assert mock_nats_mq_adapter._js.pull_subscribe.call_count == 2
+
+    async def test_get_messages_api_error_drops_pull_subscription(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+        mock_fetch.side_effect = NotFoundError
+
+        with pytest.raises(NotFoundError):
+            await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+        mock_fetch.side_effect = None
+        await mock_nats_mq_adapter.get_message(self.consumer_queue, timeout=5, pop=False)
+
+        assert mock_nats_mq_adapter._js.pull_subscribe.call_count == 2
+
+    @staticmethod
+    def stream_get_msg(seq_nums: list[int]):
+        async def get_msg(stream_name, seq, subject, next):
+            if (found := min((seq_num for seq_num in seq_nums if seq_num >= seq), default=None)) is None:
+                raise NotFoundError
+            return Mock(seq=found, data=MSG.data)
+
+        return AsyncMock(side_effect=get_msg)
+
+    async def test_get_messages_batch(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+        mock_nats_mq_adapter._js.get_msg = self.stream_get_msg([2, 5])
+
+        result = await mock_nats_mq_adapter.get_messages(self.consumer_queue, timeout=5, max_messages=4, pop=False)
+
+        mock_fetch.assert_called_once_with(1, 5)
+        mock_nats_mq_adapter._js.get_msg.assert_has_calls(
+            [
+                call(self.consumer_queue.queue_name, seq, subject=self.consumer_queue.message_subject, next=True)
+                for seq in (2, 3, 4)
+            ]
+        )
+        assert [message.sequence_number for message in result] == [1, 2, 5]
+        assert [message.num_delivered for message in result] == [MSG.metadata.num_delivered, None, None]
+        mock_nats_mq_adapter._js.delete_msg.assert_not_called()
+
+    async def test_get_messages_batch_fills_gaps(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+        mock_nats_mq_adapter._js.get_msg = self.stream_get_msg([2, 5, 6, 9])
+
+        result = await mock_nats_mq_adapter.get_messages(self.consumer_queue, timeout=5, max_messages=4, pop=False)
+
+        assert [message.sequence_number for message in result] == [1, 2, 5, 6]
+        assert mock_nats_mq_adapter._js.get_msg.call_args_list[3:] == [
+            call(self.consumer_queue.queue_name, 6, subject=self.consumer_queue.message_subject, next=True)
+        ]
+
+    async def test_get_messages_batch_limit_and_pop(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+        mock_nats_mq_adapter._js.get_msg = self.stream_get_msg([2, 3, 4])
+
+        result = await mock_nats_mq_adapter.get_messages(self.consumer_queue, timeout=5, max_messages=3, pop=True)
+
+        assert [message.sequence_number for message in result] == [1, 2, 3]
+        assert mock_nats_mq_adapter._js.get_msg.call_count == 2
+        mock_nats_mq_adapter._js.delete_msg.assert_has_calls(
+            [call(self.consumer_queue.queue_name, 2), call(self.consumer_queue.queue_name, 3)], any_order=True
+        )
+        assert mock_nats_mq_adapter._js.delete_msg.call_count == 2
+
+    async def test_get_messages_batch_empty(self, mock_nats_mq_adapter, mock_fetch):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock())
+        mock_fetch.side_effect = asyncio.TimeoutError
+
+        result = await mock_nats_mq_adapter.get_messages(self.consumer_queue, timeout=5, max_messages=10, pop=False)
+
+        assert result == []
+        mock_nats_mq_adapter._js.get_msg.assert_not_called()
+
+    async def test_get_message_batch(self, mock_nats_mq_adapter, mock_fetch):
+        await mock_nats_mq_adapter.initialize_subscription(self.incoming_queue)
+        mock_fetch.return_value = [MSG, MSG]
+
+        result = await mock_nats_mq_adapter.get_message_batch(5, timeout=3)
+
+        mock_fetch.assert_called_once_with(5, timeout=3)
+        assert len(result) == 2
+        assert result[0][0] == mock_nats_mq_adapter.mq_message_from(MSG)
+        assert result[0][1].acknowledge_message == MSG.ack
+
+    async def test_get_message_batch_empty(self, mock_nats_mq_adapter, mock_fetch):
+        await mock_nats_mq_adapter.initialize_subscription(self.incoming_queue)
+        mock_fetch.side_effect = asyncio.TimeoutError
+
+        with pytest.raises(Empty):
+            await mock_nats_mq_adapter.get_message_batch(5, timeout=3)
+
+    async def test_ensure_consumer_updates_max_ack_pending(self, mock_nats_mq_adapter):
+        queue = IncomingQueue(SUBSCRIPTION_NAME, max_ack_pending=8)
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock(config=Mock(max_ack_pending=1)))
+
+        await mock_nats_mq_adapter.ensure_consumer(queue)
+
+        mock_nats_mq_adapter._js.add_consumer.assert_called_once_with(queue.queue_name, queue.consumer_config())
+
+    async def test_ensure_consumer_keeps_unchanged_consumer(self, mock_nats_mq_adapter):
+        mock_nats_mq_adapter._js.consumer_info = AsyncMock(return_value=Mock(config=Mock(max_ack_pending=1)))
+
+        await mock_nats_mq_adapter.ensure_consumer(self.incoming_queue)
+
+        mock_nats_mq_adapter._js.add_consumer.assert_not_called()
+
     async def test_delete_message(self, mock_nats_mq_adapter):
         result = await mock_nats_mq_adapter.delete_message(self.consumer_queue, 1)
 
@@ -179,6 +376,19 @@ class TestNatsMQAdapter:
         mock_nats_mq_adapter._js.get_msg.assert_called_once_with(self.consumer_queue.queue_name, 1)
         mock_nats_mq_adapter._js.delete_msg.assert_not_called()
 
+    async def test_delete_messages(self, mock_nats_mq_adapter):
+        error = NotFoundError()
+        error.description = "no message found"
+        mock_nats_mq_adapter._js.delete_msg = AsyncMock(side_effect=[True, error, True])
+
+        result = await mock_nats_mq_adapter.delete_messages(self.consumer_queue, [1, 2, 3])
+
+        mock_nats_mq_adapter._js.delete_msg.assert_has_calls(
+            [call(self.consumer_queue.queue_name, seq_num) for seq_num in (1, 2, 3)]
+        )
+        mock_nats_mq_adapter._js.get_msg.assert_not_called()
+        assert result == {1: None, 2: "no message found", 3: None}
+
     async def test_delete_stream(self, mock_nats_mq_adapter):
         result = await mock_nats_mq_adapter.delete_stream(self.consumer_queue)
 
@@ -224,3 +434,6 @@ class TestConsumerConfig:
     )
     def test_all_queues_limit_in_flight_messages(self, queue):
         assert queue.consumer_config().max_ack_pending == 1
+
+    def test_incoming_queue_max_ack_pending(self):
+        assert IncomingQueue(SUBSCRIPTION_NAME, max_ack_pending=8).consumer_config().max_ack_pending == 8
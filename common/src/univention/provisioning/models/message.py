@@ -8,7 +8,7 @@ from pydantic import BaseModel, Field, field_serializer, model_validator
 from typing_extensions import Literal, Self
 
 from .constants import PublisherName
-from .subscription import RealmTopic
+from .subscription import RealmTopic, SubscriptionFilter, SubscriptionProjection
 
 LDAP_OBJECT_TYPE_FIELD = "univentionObjectType"
 UDM_OBJECT_TYPE_FIELD = "objectType"
@@ -114,7 +114,11 @@ class MQMessage(BaseModel):
 
 class ProvisioningMessage(Message):
     sequence_number: int = Field(description="The sequence number associated with the message.")
-    num_delivered: int = Field(description="The number of times that this message has been delivered.")
+    num_delivered: Optional[int] = Field(
+        None,
+        description="The number of times that this message has been delivered. "
+        "Unknown (null) for the messages following the first one in a batch.",
+    )
 
 
 class PrefillMessage(BaseMessage):
@@ -125,6 +129,12 @@ class PrefillMessage(BaseMessage):
         description="A list of realm-topic combinations that this subscriber subscribes to, "
         'e.g. [{"realm": "udm", "topic": "users/user"}].'
     )
+    filter: Optional[SubscriptionFilter] = Field(
+        default=None, description="The criteria the content of the messages of the subscription must meet."
+    )
+    projection: Optional[SubscriptionProjection] = Field(
+        default=None, description="The selection of the UDM properties in the messages of the subscription."
+    )
 
 
 class Event(BaseModel):
@@ -144,3 +154,50 @@ class MessageProcessingStatusReport(BaseModel):
     """A subscriber reporting whether a message was processed."""
 
     status: MessageProcessingStatus = Field(description="Whether the message was processed by the subscriber.")
+
+
+# Upper limit for the number of messages in a single bulk status report.
+MAX_MESSAGES_PER_STATUS_REPORT = 1000
+
+
+class MessagesProcessingStatusReport(BaseModel):
+    """A subscriber reporting whether multiple messages were processed."""
+
+    status: MessageProcessingStatus = Field(description="Whether the messages were processed by the subscriber.")
+    sequence_numbers: List[int] = Field(
+        default_factory=list, description="The sequence numbers of the messages the report is about."
+    )
+    first_sequence_number: Optional[int] = Field(
+        default=None, ge=1, description="The first sequence number of a range of messages the report is about."
+    )
+    last_sequence_number: Optional[int] = Field(
+        default=None, ge=1, description="The last sequence number (inclusive) of a range of messages."
+    )
+
+    @model_validator(mode="after")
+    def check_sequence_numbers(self) -> Self:
+        if (self.first_sequence_number is None) != (self.last_sequence_number is None):
+            raise ValueError("'first_sequence_number' and 'last_sequence_number' must be used together.")
+        if self.first_sequence_number is not None:
+            if self.last_sequence_number < self.first_sequence_number:
+                raise ValueError("'last_sequence_number' must not be lower than 'first_sequence_number'.")
+            if self.last_sequence_number - self.first_sequence_number >= MAX_MESSAGES_PER_STATUS_REPORT:
+                raise ValueError(f"A report can cover at most {MAX_MESSAGES_PER_STATUS_REPORT} messages.")
+        if len(self.all_sequence_numbers()) > MAX_MESSAGES_PER_STATUS_REPORT:
+            raise ValueError(f"A report can cover at most {MAX_MESSAGES_PER_STATUS_REPORT} messages.")
+        return self
+
+    def all_sequence_numbers(self) -> List[int]:
+        """The sequence numbers from the list and the range, sorted and without duplicates."""
+        sequence_numbers = set(self.sequence_numbers)
+        if self.first_sequence_number is not None:
+            sequence_numbers.update(range(self.first_sequence_number, self.last_sequence_number + 1))
+        return sorted(sequence_numbers)
+
+
+class MessageProcessingStatusResult(BaseModel):
+    """The outcome of reporting the processing status of one message."""
+
+    sequence_number: int = Field(description="The sequence number of the message.")
+    ok: bool = Field(description="Whether the status was applied to the message.")
+    detail: Optional[str] = Field(default=None, description="The reason, if the status could not be applied.")
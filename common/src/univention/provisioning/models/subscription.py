@@ -1,7 +1,7 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 import enum
-from typing import List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
@@ -24,6 +24,110 @@ class RealmTopic(BaseModel):
     topic: str = Field(description="The topic of the message, e.g. `users/user`.")
 
 
+def normalize_dn(dn: str) -> str:
+    """Lowercase `dn` and remove spaces around its RDNs, to compare DNs of LDAP/UDM objects."""
+    return ",".join(rdn.strip() for rdn in dn.split(",")).lower()
+
+
+class SubscriptionFilter(BaseModel):
+    """
+    Restricts the messages of a subscription, in addition to its realms and topics.
+
+    All given criteria must be met. Position, object type and property values are checked against the object
+    before and after the change, either one meeting them is sufficient (e.g., a user moved out of the position).
+    """
+
+    position: Optional[str] = Field(
+        default=None, description="Only objects at or below this DN, e.g. `ou=school1,dc=example,dc=com`."
+    )
+    object_types: Optional[List[str]] = Field(
+        default=None, description="Only objects of these UDM object types, e.g. `users/user`."
+    )
+    changed_properties: Optional[List[str]] = Field(
+        default=None,
+        description="Only changes of at least one of these properties, e.g. `groups`. "
+        "Creating and removing an object always matches.",
+    )
+    properties: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Only objects whose properties have these values, e.g. {`disabled`: false}. "
+        "The value of a multi-value property must contain the given value.",
+    )
+
+    def matcher(self) -> Callable[[Dict[str, Any], Dict[str, Any]], bool]:
+        """
+        Compile the filter to a function that returns whether a change of an object from `old` to `new` matches.
+
+        `old` and `new` are UDM objects, like in the body of a message.
+        """
+        checks: List[Callable[[Dict[str, Any]], bool]] = []
+        if self.position is not None:
+            position = normalize_dn(self.position)
+            suffix = f",{position}"
+
+            def check_position(obj: Dict[str, Any]) -> bool:
+                dn = normalize_dn(obj.get("dn") or "")
+                return dn == position or dn.endswith(suffix)
+
+            checks.append(check_position)
+        if self.object_types is not None:
+            object_types = frozenset(self.object_types)
+            checks.append(lambda obj: obj.get("objectType") in object_types)
+        if self.properties is not None:
+            expected = list(self.properties.items())
+
+            def check_properties(obj: Dict[str, Any]) -> bool:
+                properties = obj.get("properties") or {}
+                for name, value in expected:
+                    actual = properties.get(name)
+                    if actual != value and not (isinstance(actual, list) and value in actual):
+                        return False
+                return True
+
+            checks.append(check_properties)
+        changed_properties = tuple(self.changed_properties) if self.changed_properties is not None else None
+
+        def matches(old: Dict[str, Any], new: Dict[str, Any]) -> bool:
+            for check in checks:
+                if not ((old and check(old)) or (new and check(new))):
+                    return False
+            if changed_properties is not None and old and new:
+                old_properties = old.get("properties") or {}
+                new_properties = new.get("properties") or {}
+                return any(old_properties.get(name) != new_properties.get(name) for name in changed_properties)
+            return True
+
+        return matches
+
+
+class SubscriptionProjection(BaseModel):
+    """Restricts the properties of the UDM objects in the messages of a subscription."""
+
+    include: Optional[List[str]] = Field(
+        default=None, description="Only these properties are kept, e.g. `username`. All properties, if not set."
+    )
+    exclude: Optional[List[str]] = Field(default=None, description="These properties are removed, e.g. `users`.")
+
+    def key(self) -> Tuple[Optional[Tuple[str, ...]], Optional[Tuple[str, ...]]]:
+        """A hashable value that is the same for projections with the same result."""
+        exclude = set(self.exclude or ())
+        if self.include is not None:
+            return tuple(sorted(set(self.include) - exclude)), None
+        return None, tuple(sorted(exclude))
+
+    def project(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of the UDM object `obj` with only the selected properties (not a deep copy)."""
+        if not obj or not isinstance(obj.get("properties"), dict):
+            return obj
+        properties = obj["properties"]
+        if self.include is not None:
+            properties = {name: properties[name] for name in self.include if name in properties}
+        if self.exclude:
+            exclude = set(self.exclude)
+            properties = {name: value for name, value in properties.items() if name not in exclude}
+        return {**obj, "properties": properties}
+
+
 class BaseSubscription(BaseModel):
     """Common subscription fields."""
 
@@ -33,10 +137,18 @@ class BaseSubscription(BaseModel):
         'e.g. [{"realm": "udm", "topic": "users/user"}].'
     )
     request_prefill: bool = Field(description="Whether pre-filling of the queue was requested.")
+    filter: Optional[SubscriptionFilter] = Field(
+        default=None, description="Optional criteria the content of the messages must meet."
+    )
+    projection: Optional[SubscriptionProjection] = Field(
+        default=None, description="Optional selection of the UDM properties in the messages."
+    )
 
     def __eq__(self, other: "BaseSubscription") -> bool:
         if self.name != other.name or self.request_prefill != other.request_prefill:
             return False
+        if self.filter != other.filter or self.projection != other.projection:
+            return False
         if len(self.realms_topics) != len(other.realms_topics):
             return False
         return all(realm_topic in other.realms_topics for realm_topic in self.realms_topics)
@@ -56,6 +168,14 @@ class Subscription(BaseSubscription):
         return hash(self.name)
 
 
+class AccessToken(BaseModel):
+    """A short-lived bearer token to access the messages of a subscription."""
+
+    access_token: str = Field(description="The token, to be sent in the `Authorization: Bearer` header.")
+    token_type: str = Field(default="bearer", description="The type of the token, always `bearer`.")
+    expires_in: int = Field(description="Number of seconds the token is valid.")
+
+
 class FillQueueStatusReport(BaseModel):
     """Update a subscription's prefill queue status."""
 
@@ -2,8 +2,15 @@
 # SPDX-FileCopyrightText: 2025 Univention GmbH
 
 import pytest
+from pydantic import ValidationError
 
-from univention.provisioning.models.message import EmptyBodyError, Message, NoUDMTypeError
+from univention.provisioning.models.message import (
+    MAX_MESSAGES_PER_STATUS_REPORT,
+    EmptyBodyError,
+    Message,
+    MessagesProcessingStatusReport,
+    NoUDMTypeError,
+)
 
 
 def test_empty_body_error():
@@ -53,3 +60,25 @@ def test_no_udm_type_error():
         Message.model_validate(data)
 
     assert err
+
+
+def test_messages_status_report_sequence_numbers():
+    report = MessagesProcessingStatusReport(
+        status="ok", sequence_numbers=[7, 3, 12], first_sequence_number=5, last_sequence_number=8
+    )
+
+    assert report.all_sequence_numbers() == [3, 5, 6, 7, 8, 12]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"first_sequence_number": 5},
+        {"first_sequence_number": 5, "last_sequence_number": 4},
+        {"first_sequence_number": 1, "last_sequence_number": MAX_MESSAGES_PER_STATUS_REPORT + 1},
+        {"sequence_numbers": list(range(1, MAX_MESSAGES_PER_STATUS_REPORT + 2))},
+    ],
+)
+def test_messages_status_report_invalid(data):
+    with pytest.raises(ValidationError):
+        MessagesProcessingStatusReport(status="ok", **data)
@@ -1,7 +1,13 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
-from univention.provisioning.models.subscription import FillQueueStatus, RealmTopic, Subscription
+from univention.provisioning.models.subscription import (
+    FillQueueStatus,
+    RealmTopic,
+    Subscription,
+    SubscriptionFilter,
+    SubscriptionProjection,
+)
 
 
 def test_subscription_eq():
@@ -55,3 +61,61 @@ def test_subscription_hash():
 
     assert sub1 in subs
     assert sub2 in subs
+
+
+def test_subscription_filter_position_and_object_types():
+    matches = SubscriptionFilter(position="ou=School1, dc=example,dc=com", object_types=["users/user"]).matcher()
+    user = {"dn": "uid=u1,cn=users,ou=school1,dc=example,dc=com", "objectType": "users/user", "properties": {}}
+    moved = {**user, "dn": "uid=u1,cn=users,ou=school2,dc=example,dc=com"}
+
+    assert matches({}, user)
+    assert matches({}, {**user, "dn": "ou=school1,dc=example,dc=com"})
+    assert not matches({}, {**user, "dn": "uid=u1,cn=users,ou=otherschool1,dc=example,dc=com"})
+    assert not matches({}, {**user, "objectType": "groups/group"})
+    # Moving an object out of (or into) the position matches.
+    assert matches(user, moved)
+    assert matches(moved, user)
+    assert not matches(moved, moved)
+
+
+def test_subscription_filter_properties_and_changed_properties():
+    matches = SubscriptionFilter(
+        properties={"disabled": False, "groups": "cn=g1"}, changed_properties=["groups"]
+    ).matcher()
+    old = {"dn": "uid=u1", "properties": {"disabled": False, "groups": ["cn=g1"], "description": "a"}}
+
+    assert matches({}, old)
+    assert matches(old, {})
+    assert not matches({}, {**old, "properties": {**old["properties"], "disabled": True}})
+    assert not matches({}, {**old, "properties": {**old["properties"], "groups": ["cn=g2"]}})
+    assert not matches(old, {**old, "properties": {**old["properties"], "description": "b"}})
+    assert matches(old, {**old, "properties": {**old["properties"], "groups": ["cn=g1", "cn=g2"]}})
+
+
+def test_subscription_filter_eq():
+    sub1 = Subscription(
+        name="foo",
+        realms_topics=[RealmTopic(realm="r1", topic="t1")],
+        request_prefill=True,
+        prefill_queue_status=FillQueueStatus.done,
+    )
+    sub2 = sub1.model_copy(update={"filter": SubscriptionFilter(object_types=["users/user"])})
+
+    assert sub1 != sub2
+    assert sub2 == Subscription.model_validate_json(sub2.model_dump_json())
+
+
+def test_subscription_projection():
+    obj = {"dn": "cn=g1", "properties": {"name": "g1", "users": ["uid=u1"], "description": "d"}}
+
+    assert SubscriptionProjection(include=["name", "missing"]).project(obj) == {
+        "dn": "cn=g1",
+        "properties": {"name": "g1"},
+    }
+    assert SubscriptionProjection(exclude=["users"]).project(obj)["properties"] == {"name": "g1", "description": "d"}
+    assert SubscriptionProjection(include=["name", "users"], exclude=["users"]).project(obj)["properties"] == {
+        "name": "g1"
+    }
+    assert SubscriptionProjection(exclude=["users"]).project({}) == {}
+    assert obj["properties"]["users"] == ["uid=u1"]
+    assert SubscriptionProjection(include=["b", "a", "a"]).key() == SubscriptionProjection(include=["a", "b"]).key()
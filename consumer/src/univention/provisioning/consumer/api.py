@@ -6,19 +6,29 @@ import inspect
 import logging
 import ssl
 import time
-from typing import Any, Callable, Coroutine, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional
 
 import aiohttp
+from aiohttp import hdrs
 from jsondiff import diff
 
 from univention.provisioning.models.message import (
     Event,
     Message,
     MessageProcessingStatus,
+    MessageProcessingStatusResult,
+    MessagesProcessingStatusReport,
     ProvisioningMessage,
     RealmTopic,
 )
-from univention.provisioning.models.subscription import NewSubscription, Subscription
+from univention.provisioning.models.subscription import (
+    AccessToken,
+    NewSubscription,
+    Subscription,
+    SubscriptionFilter,
+    SubscriptionProjection,
+)
 
 from .config import (
     MessageHandlerSettings,
@@ -30,11 +40,40 @@ from .config import (
 logger = logging.getLogger(__name__)
 
 
+class MessageStream:
+    """Messages pushed by the Provisioning API over a WebSocket, acknowledged in-band."""
+
+    def __init__(self, ws: aiohttp.ClientWebSocketResponse):
+        self.ws = ws
+
+    def __aiter__(self) -> "MessageStream":
+        return self
+
+    async def __anext__(self) -> ProvisioningMessage:
+        msg = await self.ws.receive()
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            return ProvisioningMessage.model_validate_json(msg.data)
+        if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED):
+            raise StopAsyncIteration
+        if msg.type == aiohttp.WSMsgType.ERROR:
+            raise aiohttp.ClientConnectionError(f"Message stream failed: {self.ws.exception()!r}")
+        raise aiohttp.ClientPayloadError(f"Unexpected frame on the message stream: {msg.type!r}")
+
+    async def acknowledge(self, seq_nums: list[int]) -> None:
+        report = MessagesProcessingStatusReport(status=MessageProcessingStatus.ok, sequence_numbers=seq_nums)
+        await self.ws.send_str(report.model_dump_json())
+
+
 # TODO: the subscription part will be delegated to an admin using an admin API
 class ProvisioningConsumerClient:
     def __init__(self, settings: Optional[ProvisioningConsumerClientSettings] = None, concurrency_limit: int = 10):
         self.settings = settings or provisioning_consumer_client_settings()
-        auth = aiohttp.BasicAuth(self.settings.provisioning_api_username, self.settings.provisioning_api_password)
+        self.auth = aiohttp.BasicAuth(self.settings.provisioning_api_username, self.settings.provisioning_api_password)
+        # Cleared when the Provisioning API turns out not to issue access tokens.
+        self.use_access_tokens = self.settings.provisioning_api_use_access_tokens
+        self._access_token: Optional[str] = None
+        self._access_token_renew_at = 0.0
+        self._access_token_lock = asyncio.Lock()
 
         ssl_context = None
         if self.settings.subscriptions_url.startswith("https://"):
@@ -43,11 +82,72 @@ class ProvisioningConsumerClient:
             ssl_context.load_verify_locations(cafile=cacert)
 
         connector = aiohttp.TCPConnector(limit=concurrency_limit, ssl=ssl_context)
-        self.session = aiohttp.ClientSession(auth=auth, connector=connector, raise_for_status=True)
+        self.session = aiohttp.ClientSession(
+            connector=connector, raise_for_status=True, middlewares=(self._authenticate,)
+        )
 
     async def close(self):
         await self.session.close()
 
+    async def _authenticate(
+        self, request: aiohttp.ClientRequest, handler: aiohttp.ClientHandlerType
+    ) -> aiohttp.ClientResponse:
+        """
+        Authenticate requests for the messages of the own subscription with an access token (verified by the
+        Provisioning API without a password check), all other requests with HTTP Basic auth.
+        """
+        token = None
+        if str(request.url).startswith(self.settings.subscriptions_messages_url(self.auth.login)):
+            token = await self.access_token()
+        if not token:
+            request.headers[hdrs.AUTHORIZATION] = self.auth.encode()
+            return await handler(request)
+
+        request.headers[hdrs.AUTHORIZATION] = f"Bearer {token}"
+        response = await handler(request)
+        if response.status == 401:
+            # E.g., the token was issued by another instance of the Provisioning API with another secret.
+            logger.debug("Access token was rejected, requesting a new one.")
+            response.release()
+            token = await self.access_token(rejected=token)
+            request.headers[hdrs.AUTHORIZATION] = f"Bearer {token}" if token else self.auth.encode()
+            response = await handler(request)
+        return response
+
+    async def access_token(self, rejected: Optional[str] = None) -> Optional[str]:
+        """
+        Return a valid access token of the subscription, requesting a new one shortly before it expires.
+
+        :returns: None, if the Provisioning API does not issue access tokens.
+        """
+        if self._access_token_valid(rejected):
+            return self._access_token
+        async with self._access_token_lock:
+            if self.use_access_tokens and not self._access_token_valid(rejected):
+                self._access_token = await self._request_access_token()
+        return self._access_token if self.use_access_tokens else None
+
+    def _access_token_valid(self, rejected: Optional[str]) -> bool:
+        return (
+            self._access_token is not None
+            and self._access_token != rejected
+            and time.monotonic() < self._access_token_renew_at
+        )
+
+    async def _request_access_token(self) -> Optional[str]:
+        url = f"{self.settings.subscriptions_url}/{self.auth.login}/token"
+        headers = {hdrs.AUTHORIZATION: self.auth.encode()}
+        async with self.session.post(url, headers=headers, middlewares=(), raise_for_status=False) as response:
+            if response.status in (404, 405):
+                logger.warning("The Provisioning API does not issue access tokens, using HTTP Basic auth.")
+                self.use_access_tokens = False
+                return None
+            response.raise_for_status()
+            token = AccessToken.model_validate(await response.json())
+        # Renew the token when 80% of its lifetime has passed.
+        self._access_token_renew_at = time.monotonic() + token.expires_in * 0.8
+        return token.access_token
+
     async def __aenter__(self):
         return self
 
@@ -61,12 +161,16 @@ class ProvisioningConsumerClient:
         password: str,
         realms_topics: list[RealmTopic],
         request_prefill: bool = False,
+        filter: Optional[SubscriptionFilter] = None,
+        projection: Optional[SubscriptionProjection] = None,
     ):
         logger.info("Creating subscription for %r", realms_topics)
         subscription = NewSubscription(
             name=name,
             realms_topics=realms_topics,
             request_prefill=request_prefill,
+            filter=filter,
+            projection=projection,
             password=password,
         )
 
@@ -94,11 +198,50 @@ class ProvisioningConsumerClient:
         msg = await response.json()
         return ProvisioningMessage.model_validate(msg) if msg else msg
 
+    async def get_subscription_messages(
+        self,
+        name: str,
+        max_messages: Optional[int] = None,
+        timeout: Optional[float] = None,
+        pop: Optional[bool] = None,
+    ) -> list[ProvisioningMessage]:
+        _params = {"max": max_messages, "timeout": timeout, "pop": pop}
+        params = {k: v for k, v in _params.items() if v is not None}
+
+        response = await self.session.get(self.settings.subscriptions_messages_url(name), params=params)
+        msgs = await response.json()
+        return [ProvisioningMessage.model_validate(msg) for msg in msgs]
+
+    @asynccontextmanager
+    async def stream_subscription_messages(
+        self, name: str, window: Optional[int] = None
+    ) -> AsyncIterator[MessageStream]:
+        """
+        Open a WebSocket on which the Provisioning API pushes the subscription's messages as they arrive.
+
+        At most `window` messages are sent before they are acknowledged with `MessageStream.acknowledge()`.
+        """
+        params = {"window": window} if window else {}
+        async with self.session.ws_connect(
+            f"{self.settings.subscriptions_messages_url(name)}/stream", params=params, heartbeat=30
+        ) as ws:
+            yield MessageStream(ws)
+
     async def set_message_status(self, name: str, seq_num: int, status: MessageProcessingStatus):
         return await self.session.patch(
             f"{self.settings.subscriptions_messages_url(name)}/{seq_num}/status", json={"status": status.value}
         )
 
+    async def set_messages_status(
+        self, name: str, seq_nums: list[int], status: MessageProcessingStatus
+    ) -> list[MessageProcessingStatusResult]:
+        response = await self.session.patch(
+            f"{self.settings.subscriptions_messages_url(name)}/status",
+            json={"status": status.value, "sequence_numbers": seq_nums},
+        )
+        results = await response.json()
+        return [MessageProcessingStatusResult.model_validate(result) for result in results]
+
     # TODO: move this method to the AdminClient
     async def get_subscriptions(self) -> list[Subscription]:
         response = await self.session.get(self.settings.subscriptions_url)
@@ -120,6 +263,8 @@ class MessageHandler:
         settings: Optional[MessageHandlerSettings] = None,
         pop_after_handling: bool = True,
         message_limit: Optional[int] = None,
+        batch_size: int = 1,
+        streaming: bool = False,
     ):
         """
         Each callback should be an asynchronous function to facilitate downstream asynchronous operations.
@@ -134,6 +279,10 @@ class MessageHandler:
                 primarily to facilitate testing.
             pop_after_handling: If False, messages are acknowledged immediately upon reception
                 rather than after all callbacks for the message have been successfully executed.
+            batch_size: The maximum number of messages to retrieve per request.
+                Messages are still handled one after the other, in order.
+            streaming: If True, messages are pushed by the Provisioning API over a WebSocket instead of being polled.
+                `batch_size` then is the maximum number of messages received but not acknowledged yet.
         """
         if not callbacks:
             raise ValueError("Callback functions can't be empty")
@@ -143,6 +292,8 @@ class MessageHandler:
         self.callbacks = callbacks
         self.pop_after_handling = pop_after_handling
         self.message_limit = message_limit
+        self.batch_size = batch_size
+        self.streaming = streaming
 
     async def acknowledge_message(self, message_seq_num: int) -> bool:
         logger.debug("Acknowledging message with sequence number: %r", message_seq_num)
@@ -173,6 +324,45 @@ class MessageHandler:
             self.settings.max_acknowledgement_retries,
         )
 
+    async def acknowledge_messages(self, messages: list[ProvisioningMessage]) -> bool:
+        seq_nums = [message.sequence_number for message in messages]
+        logger.debug("Acknowledging messages with sequence numbers: %r", seq_nums)
+        try:
+            results = await self.client.set_messages_status(
+                self.subscription_name, seq_nums, MessageProcessingStatus.ok
+            )
+        except (
+            aiohttp.ClientError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientResponseError,
+        ) as exc:
+            logger.error("Failed to acknowledge messages. - %s", repr(exc))
+            return False
+        for result in results:
+            if not result.ok:
+                logger.warning("Message %r was not acknowledged: %s", result.sequence_number, result.detail)
+        return True
+
+    async def acknowledge_messages_with_retries(self, messages: list[ProvisioningMessage]):
+        """Acknowledge the messages with a single request, or with the per-message endpoint if there is only one."""
+        if len(messages) == 1:
+            return await self.acknowledge_message_with_retries(messages[0])
+
+        for retries in range(self.settings.max_acknowledgement_retries + 1):
+            if await self.acknowledge_messages(messages):
+                logger.info("%d messages were acknowledged.", len(messages))
+                return
+
+            logger.warning("Failed to acknowledge messages. Retries: %d", retries)
+            if retries != self.settings.max_acknowledgement_retries:
+                timeout = min(2**retries / 10, 30)
+                await asyncio.sleep(timeout)
+
+        logger.error(
+            "Maximum retries of %s reached. The messages will be redelivered later",
+            self.settings.max_acknowledgement_retries,
+        )
+
     async def run(
         self,
     ):
@@ -182,34 +372,77 @@ class MessageHandler:
         It continuously listens for messages, either indefinitely or until a specified message limit is reached, and
         invokes a series of callbacks for each message.
         """
+        if self.streaming:
+            return await self.run_streaming()
+
         counter = 0
 
         while True:
-            message = await self.client.get_subscription_message(
+            # Messages of a batch are acknowledged together, after they were handled.
+            handled = []
+            try:
+                for message in await self.get_messages():
+                    await self.handle_message(message)
+                    handled.append(message)
+
+                    if self.message_limit:
+                        counter += 1
+                        if counter >= self.message_limit:
+                            return
+            finally:
+                if self.pop_after_handling and handled:
+                    await self.acknowledge_messages_with_retries(handled)
+
+    async def run_streaming(self):
+        """Handle the messages pushed over a WebSocket, reconnecting when the connection is lost."""
+        counter = 0
+
+        while True:
+            try:
+                async with self.client.stream_subscription_messages(
+                    self.subscription_name, window=self.batch_size
+                ) as stream:
+                    async for message in stream:
+                        await self.handle_message(message)
+                        if self.pop_after_handling:
+                            await stream.acknowledge([message.sequence_number])
+
+                        if self.message_limit:
+                            counter += 1
+                            if counter >= self.message_limit:
+                                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                logger.error("Message stream was interrupted. - %s", repr(exc))
+            logger.info("Reconnecting the message stream.")
+            await asyncio.sleep(1)
+
+    async def handle_message(self, message: ProvisioningMessage):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(self.debug_msg(message))
+        for callback in self.callbacks:
+            t0 = time.perf_counter()
+            await callback(message)
+            logger.debug(
+                "%r finished handling message in %.1f ms.",
+                getattr(inspect.getmodule(callback).__spec__, "name", "__main__"),
+                (time.perf_counter() - t0) * 1000,
+            )
+
+    async def get_messages(self) -> list[ProvisioningMessage]:
+        if self.batch_size > 1:
+            return await self.client.get_subscription_messages(
                 self.subscription_name,
+                max_messages=self.batch_size,
                 timeout=10,
-                # TODO: pop is broken serverside at the moment
-                # pop= not pop_after_handling,
             )
-            if not message:
-                continue
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(self.debug_msg(message))
-            for callback in self.callbacks:
-                t0 = time.perf_counter()
-                await callback(message)
-                logger.debug(
-                    "%r finished handling message in %.1f ms.",
-                    getattr(inspect.getmodule(callback).__spec__, "name", "__main__"),
-                    (time.perf_counter() - t0) * 1000,
-                )
-            if self.pop_after_handling:
-                await self.acknowledge_message_with_retries(message)
-
-            if self.message_limit:
-                counter += 1
-                if counter >= self.message_limit:
-                    return
+
+        message = await self.client.get_subscription_message(
+            self.subscription_name,
+            timeout=10,
+            # TODO: pop is broken serverside at the moment
+            # pop= not pop_after_handling,
+        )
+        return [message] if message else []
 
     @staticmethod
     def debug_msg(message: Message) -> str:
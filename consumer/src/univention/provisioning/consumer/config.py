@@ -16,6 +16,8 @@ class ProvisioningConsumerClientSettings(BaseSettings):
     provisioning_api_username: str
     provisioning_api_password: str
     log_level: Loglevel
+    # Authenticate requests for messages with short-lived access tokens instead of the password
+    provisioning_api_use_access_tokens: bool = True
 
     @cached_property
     def subscriptions_url(self) -> str:
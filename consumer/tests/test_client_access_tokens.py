@@ -0,0 +1,90 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from univention.provisioning.consumer.api import ProvisioningConsumerClient
+from univention.provisioning.consumer.config import ProvisioningConsumerClientSettings
+
+NAME = "consumer"
+
+
+class FakeProvisioningAPI:
+    """Issues tokens "token-1", "token-2", ... and records the authorization of the message requests."""
+
+    def __init__(self, issue_tokens: bool = True, accepted_tokens: int = 1):
+        self.issue_tokens = issue_tokens
+        self.accepted_tokens = accepted_tokens
+        self.issued = 0
+        self.authorizations: list[str] = []
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(f"/v1/subscriptions/{NAME}/token", self.token)
+        app.router.add_get(f"/v1/subscriptions/{NAME}/messages", self.messages)
+        return app
+
+    async def token(self, request: web.Request) -> web.Response:
+        if not self.issue_tokens:
+            raise web.HTTPNotFound()
+        assert request.headers["Authorization"].startswith("Basic ")
+        self.issued += 1
+        return web.json_response({"access_token": f"token-{self.issued}", "token_type": "bearer", "expires_in": 60})
+
+    async def messages(self, request: web.Request) -> web.Response:
+        authorization = request.headers["Authorization"]
+        self.authorizations.append(authorization)
+        if authorization.startswith("Bearer ") and int(authorization.rpartition("-")[2]) < self.accepted_tokens:
+            raise web.HTTPUnauthorized()
+        return web.json_response([])
+
+
+@pytest.fixture
+async def serve():
+    servers = []
+
+    async def serve(api: FakeProvisioningAPI) -> ProvisioningConsumerClient:
+        server = TestServer(api.app())
+        await server.start_server()
+        servers.append(server)
+        settings = ProvisioningConsumerClientSettings(
+            provisioning_api_base_url=str(server.make_url("/")),
+            provisioning_api_username=NAME,
+            provisioning_api_password="password",
+            log_level="DEBUG",
+        )
+        return ProvisioningConsumerClient(settings)
+
+    yield serve
+    for server in servers:
+        await server.close()
+
+
+@pytest.mark.anyio
+class TestAccessTokens:
+    async def test_token_is_requested_once_and_reused(self, serve):
+        api = FakeProvisioningAPI()
+        async with await serve(api) as client:
+            for _ in range(3):
+                await client.get_subscription_messages(NAME)
+
+        assert api.issued == 1
+        assert api.authorizations == ["Bearer token-1"] * 3
+
+    async def test_rejected_token_is_renewed(self, serve):
+        api = FakeProvisioningAPI(accepted_tokens=2)
+        async with await serve(api) as client:
+            await client.get_subscription_messages(NAME)
+
+        assert api.authorizations == ["Bearer token-1", "Bearer token-2"]
+
+    async def test_falls_back_to_basic_auth(self, serve):
+        api = FakeProvisioningAPI(issue_tokens=False)
+        async with await serve(api) as client:
+            await client.get_subscription_messages(NAME)
+            await client.get_subscription_messages(NAME)
+
+        assert [authorization.split()[0] for authorization in api.authorizations] == ["Basic", "Basic"]
+        assert client.use_access_tokens is False
@@ -1,14 +1,14 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
-from unittest.mock import AsyncMock, call, patch
+from unittest.mock import AsyncMock, Mock, call, patch
 
 import aiohttp
 import pytest
 from test_helpers.mock_data import PROVISIONING_MESSAGE, SUBSCRIPTION_NAME
 
 from univention.provisioning.consumer.api import MessageHandler, ProvisioningConsumerClient
-from univention.provisioning.models.message import Message
+from univention.provisioning.models.message import Message, MessageProcessingStatus
 
 
 @pytest.fixture
@@ -89,3 +89,94 @@ class TestMessageHandler:
         assert async_client.set_message_status.call_count == 4
         assert len(result) == 1
         assert mock_sleep.call_count == 3
+
+    async def test_get_messages_in_batches(self, async_client: ProvisioningConsumerClient):
+        async_client.get_subscription_messages = AsyncMock(
+            side_effect=[
+                [PROVISIONING_MESSAGE, PROVISIONING_MESSAGE],
+                [],
+                [PROVISIONING_MESSAGE, PROVISIONING_MESSAGE],
+            ]
+        )
+        async_client.set_message_status = AsyncMock()
+        async_client.set_messages_status = AsyncMock(return_value=[])
+        result = []
+
+        async_client.settings.provisioning_api_username = SUBSCRIPTION_NAME
+        await MessageHandler(
+            async_client,
+            [lambda message: self.callback(result, message)],
+            message_limit=3,
+            batch_size=10,
+        ).run()
+
+        async_client.get_subscription_messages.assert_has_calls(
+            [call(SUBSCRIPTION_NAME, max_messages=10, timeout=10)] * 3
+        )
+        async_client.get_subscription_message.assert_not_called()
+        async_client.set_messages_status.assert_called_once_with(
+            SUBSCRIPTION_NAME, [PROVISIONING_MESSAGE.sequence_number] * 2, MessageProcessingStatus.ok
+        )
+        async_client.set_message_status.assert_called_once()
+        assert len(result) == 3
+
+    async def test_handled_messages_of_a_batch_are_acknowledged_on_error(
+        self, async_client: ProvisioningConsumerClient
+    ):
+        async_client.get_subscription_messages = AsyncMock(return_value=[PROVISIONING_MESSAGE] * 3)
+        async_client.set_messages_status = AsyncMock(return_value=[])
+        result = []
+
+        async def callback(message: Message):
+            if len(result) == 2:
+                raise RuntimeError("callback failed")
+            result.append(message)
+
+        async_client.settings.provisioning_api_username = SUBSCRIPTION_NAME
+        with pytest.raises(RuntimeError):
+            await MessageHandler(async_client, [callback], batch_size=10).run()
+
+        async_client.set_messages_status.assert_called_once_with(
+            SUBSCRIPTION_NAME, [PROVISIONING_MESSAGE.sequence_number] * 2, MessageProcessingStatus.ok
+        )
+
+    @patch("asyncio.sleep", return_value=None)
+    async def test_failed_to_acknowledge_messages(self, mock_sleep, async_client: ProvisioningConsumerClient):
+        async_client.get_subscription_messages = AsyncMock(return_value=[PROVISIONING_MESSAGE] * 2)
+        async_client.set_messages_status = AsyncMock(side_effect=aiohttp.ClientError)
+
+        async_client.settings.provisioning_api_username = SUBSCRIPTION_NAME
+        await MessageHandler(
+            async_client,
+            [lambda message: self.callback([], message)],
+            message_limit=2,
+            batch_size=10,
+        ).run()
+
+        assert async_client.set_messages_status.call_count == 4
+        assert mock_sleep.call_count == 3
+
+    @patch("asyncio.sleep", return_value=None)
+    async def test_streaming_reconnects_and_acknowledges_in_band(
+        self, mock_sleep, async_client: ProvisioningConsumerClient
+    ):
+        stream = AsyncMock()
+        stream.__aiter__.return_value = [PROVISIONING_MESSAGE] * 3
+        connection = AsyncMock()
+        connection.__aenter__.side_effect = [aiohttp.ClientConnectionError, stream]
+        async_client.stream_subscription_messages = Mock(return_value=connection)
+        result = []
+
+        async_client.settings.provisioning_api_username = SUBSCRIPTION_NAME
+        await MessageHandler(
+            async_client,
+            [lambda message: self.callback(result, message)],
+            message_limit=2,
+            batch_size=5,
+            streaming=True,
+        ).run()
+
+        async_client.stream_subscription_messages.assert_has_calls([call(SUBSCRIPTION_NAME, window=5)] * 2)
+        stream.acknowledge.assert_has_calls([call([PROVISIONING_MESSAGE.sequence_number])] * 2)
+        assert len(result) == 2
+        assert mock_sleep.call_count == 1
@@ -16,6 +16,11 @@ class BaseDispatcherSettings(BaseSettings):
     nats_max_reconnect_attempts: int
     # Nats consumer name. Needs to be unique for every UCS host.
     nats_consumer_name: str
+    # Maximum number of consumer queues a message is published to concurrently
+    max_concurrent_publishes: int = 16
+    # Maximum number of incoming messages dispatched concurrently.
+    # Messages about the same object are still dispatched in order. 1 dispatches strictly one after the other.
+    pipeline_size: int = 1
 
 
 class DispatcherSettings(BaseDispatcherSettings):
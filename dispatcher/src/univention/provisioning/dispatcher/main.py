@@ -22,7 +22,12 @@ async def main(settings_pull: DispatcherSettings, settings_push: DispatcherSetti
         NatsSubscriptionsAdapter(settings_push) as subscriptions,
     ):
         service = DispatcherService(
-            ack_manager=MessageAckManager(), mq_pull=mq_pull, mq_push=mq_push, subscriptions=subscriptions
+            ack_manager=MessageAckManager(),
+            mq_pull=mq_pull,
+            mq_push=mq_push,
+            subscriptions=subscriptions,
+            max_concurrent_publishes=settings_push.max_concurrent_publishes,
+            pipeline_size=settings_pull.pipeline_size,
         )
         await service.run()
 
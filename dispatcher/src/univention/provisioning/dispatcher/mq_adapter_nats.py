@@ -42,6 +42,9 @@ class NatsMessageQueueAdapter(MessageQueuePort):
     async def get_one_message(self, timeout: float) -> tuple[MQMessage, Acknowledgements]:
         return await self.mq.get_one_message(timeout=timeout)
 
+    async def get_message_batch(self, max_messages: int, timeout: float) -> list[tuple[MQMessage, Acknowledgements]]:
+        return await self.mq.get_message_batch(max_messages, timeout=timeout)
+
     async def enqueue_message(self, queue: BaseQueue, message: Message) -> None:
         await self.mq.add_message(queue, message)
 
@@ -36,5 +36,10 @@ class MessageQueuePort(abc.ABC):
     @abc.abstractmethod
     async def get_one_message(self, timeout: float) -> tuple[MQMessage, Acknowledgements]: ...
 
+    @abc.abstractmethod
+    async def get_message_batch(
+        self, max_messages: int, timeout: float
+    ) -> list[tuple[MQMessage, Acknowledgements]]: ...
+
     @abc.abstractmethod
     async def stream_exists(self, queue: BaseQueue) -> bool: ...
@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import logging
+import re
+from typing import Any, Callable, Iterable, Optional
+
+from univention.provisioning.models.subscription import Subscription
+
+logger = logging.getLogger(__name__)
+
+# Prefix topics, like "users/.*", are matched without a regular expression.
+PREFIX_TOPIC = re.compile(r"(?P<prefix>[^\\.^$*+?{}\[\]|()]*)\.\*")
+# Maximum number of (realm, topic) combinations whose subscriptions are remembered.
+MAX_RESOLVED = 10_000
+
+
+class RoutingIndex:
+    """
+    Finds the subscriptions for the realm and topic of a message.
+
+    The topic of a subscription is a regular expression that must match the whole topic of a message, like when
+    pre-filling the queue of a subscription. Topics without special characters are looked up directly, topics like
+    "users/.*" are compared as prefixes, and only the remaining ones are matched as (compiled) regular expressions.
+    The result is remembered per realm and topic, until the subscriptions change.
+
+    The filters of the subscriptions, checking the content of the messages, are compiled once too.
+    """
+
+    def __init__(self, subscriptions: Iterable[Subscription] = ()):
+        self._subscriptions: dict[str, Subscription] = {}
+        self._exact: dict[tuple[str, str], set[Subscription]] = {}
+        self._prefixes: dict[str, list[tuple[str, Subscription]]] = {}
+        self._patterns: dict[str, list[tuple[re.Pattern, Subscription]]] = {}
+        self._resolved: dict[tuple[str, str], frozenset[Subscription]] = {}
+        self._filters: dict[str, Callable[[dict[str, Any], dict[str, Any]], bool]] = {}
+        for subscription in subscriptions:
+            self.add(subscription)
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._subscriptions
+
+    def add(self, subscription: Subscription) -> None:
+        """Add `subscription`, replacing a subscription with the same name."""
+        self.remove(subscription.name)
+        self._subscriptions[subscription.name] = subscription
+        if subscription.filter:
+            self._filters[subscription.name] = subscription.filter.matcher()
+        for realm_topic in subscription.realms_topics:
+            realm, topic = realm_topic.realm, realm_topic.topic
+            if re.escape(topic) == topic:
+                self._exact.setdefault((realm, topic), set()).add(subscription)
+            elif match := PREFIX_TOPIC.fullmatch(topic):
+                self._prefixes.setdefault(realm, []).append((match["prefix"], subscription))
+            else:
+                try:
+                    pattern = re.compile(topic)
+                except re.error as exc:
+                    logger.warning(
+                        "Topic %r of subscription %r is no regular expression: %s", topic, subscription.name, exc
+                    )
+                    self._exact.setdefault((realm, topic), set()).add(subscription)
+                    continue
+                self._patterns.setdefault(realm, []).append((pattern, subscription))
+        self._resolved.clear()
+
+    def remove(self, name: str) -> Optional[Subscription]:
+        """Remove the subscription `name` and return it, if it exists."""
+        subscription = self._subscriptions.pop(name, None)
+        if not subscription:
+            return None
+        self._filters.pop(name, None)
+        for key in [key for key, subscriptions in self._exact.items() if subscription in subscriptions]:
+            self._exact[key].discard(subscription)
+            if not self._exact[key]:
+                del self._exact[key]
+        for entries in (self._prefixes, self._patterns):
+            for realm in list(entries):
+                entries[realm] = [entry for entry in entries[realm] if entry[1].name != name]
+                if not entries[realm]:
+                    del entries[realm]
+        self._resolved.clear()
+        return subscription
+
+    def resolve(self, realm: str, topic: str) -> frozenset[Subscription]:
+        """Return the subscriptions that receive messages with `realm` and `topic`."""
+        key = (realm, topic)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        subscriptions = set(self._exact.get(key, ()))
+        subscriptions.update(sub for prefix, sub in self._prefixes.get(realm, ()) if topic.startswith(prefix))
+        subscriptions.update(sub for pattern, sub in self._patterns.get(realm, ()) if pattern.fullmatch(topic))
+        if len(self._resolved) >= MAX_RESOLVED:
+            self._resolved.clear()
+        result = self._resolved[key] = frozenset(subscriptions)
+        return result
+
+    def accepts(self, subscription: Subscription, old: dict[str, Any], new: dict[str, Any]) -> bool:
+        """Return whether the change from `old` to `new` in a message meets the filter of `subscription`."""
+        matches = self._filters.get(subscription.name)
+        return matches is None or matches(old, new)
+
+    def as_dict(self) -> dict[str, dict[str, set[str]]]:
+        """The names of the subscriptions by realm and topic (pattern)."""
+        result: dict[str, dict[str, set[str]]] = {}
+        for subscription in self._subscriptions.values():
+            for realm_topic in subscription.realms_topics:
+                result.setdefault(realm_topic.realm, {}).setdefault(realm_topic.topic, set()).add(subscription.name)
+        return result
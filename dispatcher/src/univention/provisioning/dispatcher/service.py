@@ -2,13 +2,16 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 import asyncio
 import logging
+from typing import Hashable, Optional
 
+from univention.provisioning.backends.message_pipeline import KeyedMessagePipeline
 from univention.provisioning.backends.message_queue import Empty, MessageAckManager, QueueStatus
 from univention.provisioning.backends.nats_mq import ConsumerQueue, IncomingQueue
 from univention.provisioning.models.message import Message, MQMessage
-from univention.provisioning.models.subscription import Subscription
+from univention.provisioning.models.subscription import Subscription, SubscriptionProjection
 
 from .mq_port import MessageQueuePort
+from .routing import RoutingIndex
 from .subscriptions_port import SubscriptionsPort
 
 logger = logging.getLogger(__name__)
@@ -21,16 +24,22 @@ class DispatcherService:
         mq_pull: MessageQueuePort,
         mq_push: MessageQueuePort,
         subscriptions: SubscriptionsPort,
+        max_concurrent_publishes: int = 16,
+        pipeline_size: int = 1,
     ):
         self.ack_manager = ack_manager
         self.mq_pull = mq_pull
         self.mq_push = mq_push
         self.subscriptions_db = subscriptions
-        self._subscriptions: dict[str, dict[str, set[Subscription]]] = {}  # {realm: {topic: {Subscription, ..}}}
+        self._subscriptions = RoutingIndex()
+        # Limits the publish requests to consumer queues that wait for an acknowledgement at the same time.
+        self._publish_semaphore = asyncio.Semaphore(max_concurrent_publishes)
+        # Number of incoming messages dispatched concurrently. 1 dispatches them strictly one after the other.
+        self.pipeline_size = pipeline_size
 
     async def run(self):
         logger.info("Storing event in consumer queues")
-        queue_type = IncomingQueue(self.mq_pull.settings.nats_consumer_name)
+        queue_type = IncomingQueue(self.mq_pull.settings.nats_consumer_name, max_ack_pending=self.pipeline_size)
         status = await self.mq_pull.initialize_subscription(queue_type, migrate_stream=True)
 
         # Initially fill self._subscriptions before starting to handle messages.
@@ -41,7 +50,10 @@ class DispatcherService:
             task_group.create_task(
                 self.subscriptions_db.watch_for_subscription_changes(self.update_subscriptions_mapping)
             )
-            task_group.create_task(self.dispatch_events(queue_type, status))
+            if self.pipeline_size > 1:
+                task_group.create_task(self.dispatch_events_pipelined(queue_type, status))
+            else:
+                task_group.create_task(self.dispatch_events(queue_type, status))
 
     async def dispatch_events(self, queue_type: IncomingQueue, migration_status: QueueStatus):
         while True:
@@ -49,15 +61,7 @@ class DispatcherService:
             try:
                 message, acknowledgements = await self.mq_pull.get_one_message(timeout=10)
             except Empty:
-                if migration_status == QueueStatus.READY:
-                    logger.debug("No new dispatcher messages found in the incoming queue, continuing to wait.")
-                    continue
-
-                # Stream is sealed for migration - attempt to complete
-                logger.info("No messages in sealed stream, completing migration")
-                migration_status = await self.mq_pull.initialize_subscription(queue_type, migrate_stream=True)
-                if migration_status == QueueStatus.READY:
-                    logger.info("Stream migration completed, resuming normal operation")
+                migration_status = await self.incoming_queue_empty(queue_type, migration_status)
                 continue
 
             message_handler = self.handle_message(message)
@@ -72,6 +76,51 @@ class DispatcherService:
                 except Exception:
                     logger.error("Failed to negatively acknowledge message: %s", message)
 
+    async def dispatch_events_pipelined(self, queue_type: IncomingQueue, migration_status: QueueStatus):
+        """Dispatch up to `pipeline_size` events concurrently, keeping the order of events about the same object."""
+        async with KeyedMessagePipeline(
+            self.handle_message, self.message_key, self.pipeline_size, self.ack_manager
+        ) as pipeline:
+            while True:
+                logger.debug("Waiting for events...")
+                try:
+                    batch = await self.mq_pull.get_message_batch(self.pipeline_size, timeout=10)
+                except Empty:
+                    # The incoming stream can only be migrated after all its messages were acknowledged.
+                    await pipeline.join()
+                    migration_status = await self.incoming_queue_empty(queue_type, migration_status)
+                    continue
+
+                for message, acknowledgements in batch:
+                    await pipeline.submit(message, acknowledgements)
+
+    async def incoming_queue_empty(self, queue_type: IncomingQueue, migration_status: QueueStatus) -> QueueStatus:
+        if migration_status == QueueStatus.READY:
+            logger.debug("No new dispatcher messages found in the incoming queue, continuing to wait.")
+            return migration_status
+
+        # Stream is sealed for migration - attempt to complete
+        logger.info("No messages in sealed stream, completing migration")
+        migration_status = await self.mq_pull.initialize_subscription(queue_type, migrate_stream=True)
+        if migration_status == QueueStatus.READY:
+            logger.info("Stream migration completed, resuming normal operation")
+        return migration_status
+
+    @staticmethod
+    def message_key(message: MQMessage) -> Hashable:
+        """
+        Events with the same key are dispatched in order.
+
+        For UDM events it identifies the object: its `id` (univentionObjectIdentifier) or else its DN.
+        Events of other realms keep their order per topic.
+        """
+        data = message.data
+        if data.get("realm") == "udm":
+            old = data.get("body", {}).get("old") or {}
+            new = data.get("body", {}).get("new") or {}
+            return new.get("id") or old.get("id") or new.get("dn") or old.get("dn")
+        return data.get("realm"), data.get("topic")
+
     async def handle_message(self, message: MQMessage):
         data = message.data
         if data.get("realm") == "udm":
@@ -93,39 +142,98 @@ class DispatcherService:
 
         validated_msg = Message.model_validate(data)
 
-        subscriptions = self._subscriptions.get(validated_msg.realm, {}).get(validated_msg.topic, [])
+        subscriptions = self._subscriptions.resolve(validated_msg.realm, validated_msg.topic)
 
         logger.debug("Found subscriptions: %r", subscriptions)
 
-        for sub in subscriptions:
-            logger.info("Sending message to %r", sub.name)
-            try:
-                await self.mq_push.enqueue_message(ConsumerQueue(sub.name), validated_msg)
-            except Exception:
-                logger.fatal("Failed to send message to %r", sub.name)
-                await asyncio.sleep(1)
-                raise
+        old, new = validated_msg.body.old, validated_msg.body.new
+        accepted = [sub for sub in subscriptions if self._subscriptions.accepts(sub, old, new)]
+        if len(accepted) < len(subscriptions):
+            logger.debug(
+                "Message filtered out for subscriptions: %r", [sub.name for sub in subscriptions if sub not in accepted]
+            )
+
+        # Each distinct projection is applied once, for all subscriptions that use it.
+        projected: dict[Hashable, Message] = {}
+        messages: list[Message] = []
+        for sub in accepted:
+            if not sub.projection:
+                messages.append(validated_msg)
+                continue
+            key = sub.projection.key()
+            if key not in projected:
+                projected[key] = self.project_message(validated_msg, sub.projection)
+            messages.append(projected[key])
+
+        # Publish to all consumer queues concurrently. If any of them fails, the incoming message
+        # is negatively acknowledged and redelivered (like before, to all subscriptions).
+        subscriptions = accepted
+        results = await asyncio.gather(
+            *(self.enqueue_message(sub, msg) for sub, msg in zip(subscriptions, messages)), return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for sub, result in zip(subscriptions, results):
+            if isinstance(result, BaseException):
+                logger.fatal("Failed to send message to %r: %s", sub.name, result)
+        if errors:
+            await asyncio.sleep(1)
+            raise errors[0]
 
         if not subscriptions:
             logger.info("No consumers for message with realm: %r topic: %r.", validated_msg.realm, validated_msg.topic)
 
-    async def update_subscriptions_mapping(self, *args, **kwargs) -> None:
-        logger.info("Updating subscriptions mapping...")
+    @staticmethod
+    def project_message(message: Message, projection: SubscriptionProjection) -> Message:
+        """Return a copy of `message` with only the UDM properties selected by `projection`."""
+        body = message.body.model_copy(
+            update={"old": projection.project(message.body.old), "new": projection.project(message.body.new)}
+        )
+        return message.model_copy(update={"body": body})
 
-        new_subscriptions_mapping: dict[str, dict[str, set[Subscription]]] = {}
-        async for sub in self.subscriptions_db.get_all_subscriptions():
+    async def enqueue_message(self, sub: Subscription, message: Message) -> None:
+        async with self._publish_semaphore:
+            logger.info("Sending message to %r", sub.name)
+            await self.mq_push.enqueue_message(ConsumerQueue(sub.name), message)
+
+    async def update_subscriptions_mapping(self, name: Optional[str] = None, value: Optional[bytes] = None) -> None:
+        """
+        Update the mapping of realms and topics to subscriptions.
+
+        Called without arguments, all subscriptions are loaded. Called as callback of
+        `watch_for_subscription_changes()`, only the changed subscription `name` is updated from `value`.
+        """
+        if name is None:
+            await self.load_subscriptions_mapping()
+            return
+
+        logger.info("Updating subscription %r in the subscriptions mapping...", name)
+        subscription = Subscription.model_validate_json(value) if value else None
+        if subscription and not await self.mq_push.stream_exists(ConsumerQueue(subscription.name)):
+            logger.debug("Stream does not exist for subscription %r. Ignoring subscription", subscription.name)
+            subscription = None
+
+        self._subscriptions.remove(name)
+        if subscription:
+            self._subscriptions.add(subscription)
+        self.log_subscriptions_mapping()
+
+    async def load_subscriptions_mapping(self) -> None:
+        logger.info("Loading subscriptions mapping...")
+        subscriptions = [sub async for sub in self.subscriptions_db.get_all_subscriptions()]
+        streams_exist = await asyncio.gather(
+            *(self.mq_push.stream_exists(ConsumerQueue(sub.name)) for sub in subscriptions)
+        )
+
+        new_subscriptions = RoutingIndex()
+        for sub, stream_exists in zip(subscriptions, streams_exist):
             logger.debug("Processing subscription: %r", sub.name)
-            if not await self.mq_push.stream_exists(ConsumerQueue(sub.name)):
+            if not stream_exists:
                 logger.debug("Stream does not exist for subscription %r. Ignoring subscription", sub.name)
                 continue
-            for realm_topic in sub.realms_topics:
-                new_subscriptions_mapping.setdefault(realm_topic.realm, {}).setdefault(realm_topic.topic, set()).add(
-                    sub
-                )
+            new_subscriptions.add(sub)
 
-        self._subscriptions = new_subscriptions_mapping
+        self._subscriptions = new_subscriptions
+        self.log_subscriptions_mapping()
 
-        logger.info(
-            "Subscriptions mapping updated: %r",
-            {r: {t: {_s.name for _s in s} for t, s in v.items()} for r, v in self._subscriptions.items()},
-        )
+    def log_subscriptions_mapping(self) -> None:
+        logger.info("Subscriptions mapping updated: %r", self._subscriptions.as_dict())
@@ -1,17 +1,29 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
+import asyncio
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, call
+from unittest.mock import AsyncMock, call, patch
 
 import pytest
-from test_helpers.mock_data import MESSAGE, MQMESSAGE, SUBSCRIPTION_INFO, SUBSCRIPTION_NAME, SUBSCRIPTIONS
-
-from univention.provisioning.backends.message_queue import MessageAckManager
+from test_helpers.mock_data import (
+    GROUPS_TOPIC,
+    MESSAGE,
+    MQMESSAGE,
+    REALM,
+    SUBSCRIPTION_INFO,
+    SUBSCRIPTION_NAME,
+    SUBSCRIPTIONS,
+    USERS_TOPIC,
+)
+
+from univention.provisioning.backends.message_queue import Empty, MessageAckManager, QueueStatus
 from univention.provisioning.backends.nats_mq import ConsumerQueue, IncomingQueue
 from univention.provisioning.dispatcher.mq_adapter_nats import NatsMessageQueueAdapter
+from univention.provisioning.dispatcher.routing import RoutingIndex
 from univention.provisioning.dispatcher.service import DispatcherService
 from univention.provisioning.dispatcher.subscriptions_port import SubscriptionsPort
 from univention.provisioning.models.constants import DISPATCHER_SUBJECT_TEMPLATE
+from univention.provisioning.models.subscription import Subscription
 
 
 class EscapeLoopException(Exception): ...
@@ -33,6 +45,10 @@ def dispatcher_service() -> DispatcherService:
     )
 
 
+def subscriptions_mapping(count: int) -> RoutingIndex:
+    return RoutingIndex(Subscription.model_validate({**SUBSCRIPTION_INFO, "name": f"sub-{i}"}) for i in range(count))
+
+
 async def get_all_subscriptions():
     for i in SUBSCRIPTIONS.values():
         for j in i.values():
@@ -68,3 +84,153 @@ class TestDispatcherService:
 
         dispatcher_service.mq_push.enqueue_message.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME), MESSAGE)
         fake_ack.acknowledge_message.assert_called_once_with()
+
+    async def test_handle_message_publishes_concurrently(self, dispatcher_service: DispatcherService):
+        dispatcher_service._subscriptions = subscriptions_mapping(40)
+        dispatcher_service._publish_semaphore = asyncio.Semaphore(4)
+        in_flight = []
+        max_in_flight = 0
+
+        async def enqueue_message(queue, message):
+            nonlocal max_in_flight
+            in_flight.append(queue)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            await asyncio.sleep(0)
+            in_flight.remove(queue)
+
+        dispatcher_service.mq_push.enqueue_message = AsyncMock(side_effect=enqueue_message)
+
+        await dispatcher_service.handle_message(MQMESSAGE)
+
+        assert dispatcher_service.mq_push.enqueue_message.call_count == 40
+        assert max_in_flight == 4
+
+    @patch("asyncio.sleep", new_callable=AsyncMock)
+    async def test_handle_message_fails_if_any_publish_fails(self, mock_sleep, dispatcher_service: DispatcherService):
+        dispatcher_service._subscriptions = subscriptions_mapping(3)
+        dispatcher_service.mq_push.enqueue_message = AsyncMock(side_effect=[None, RuntimeError("publish failed"), None])
+
+        with pytest.raises(RuntimeError, match="publish failed"):
+            await dispatcher_service.handle_message(MQMESSAGE)
+
+        assert dispatcher_service.mq_push.enqueue_message.call_count == 3
+        mock_sleep.assert_called_once_with(1)
+
+    async def test_handle_message_applies_subscription_filters(self, dispatcher_service: DispatcherService):
+        dispatcher_service._subscriptions = RoutingIndex(
+            Subscription.model_validate({**SUBSCRIPTION_INFO, "name": name, "filter": subscription_filter})
+            for name, subscription_filter in (
+                ("in-position", {"position": "DC=bar"}),
+                ("other-type", {"object_types": ["users/user"]}),
+                ("unfiltered", None),
+            )
+        )
+
+        await dispatcher_service.handle_message(MQMESSAGE)
+
+        dispatcher_service.mq_push.enqueue_message.assert_has_calls(
+            [call(ConsumerQueue("in-position"), MESSAGE), call(ConsumerQueue("unfiltered"), MESSAGE)], any_order=True
+        )
+        assert dispatcher_service.mq_push.enqueue_message.call_count == 2
+
+    async def test_handle_message_applies_projections_once(self, dispatcher_service: DispatcherService):
+        message = MQMESSAGE.model_copy(deep=True)
+        for obj in message.data["body"].values():
+            obj["properties"] = {"name": "g1", "users": ["uid=u1", "uid=u2"], "description": "d"}
+        dispatcher_service._subscriptions = RoutingIndex(
+            Subscription.model_validate({**SUBSCRIPTION_INFO, "name": name, "projection": projection})
+            for name, projection in (
+                ("names-1", {"include": ["name", "description"], "exclude": ["description"]}),
+                ("names-2", {"include": ["name"]}),
+                ("no-users", {"exclude": ["users"]}),
+                ("everything", None),
+            )
+        )
+
+        with patch.object(DispatcherService, "project_message", wraps=DispatcherService.project_message) as project:
+            await dispatcher_service.handle_message(message)
+
+        assert project.call_count == 2
+        sent = {
+            queue.name: msg.body.new["properties"]
+            for queue, msg in (c.args for c in dispatcher_service.mq_push.enqueue_message.mock_calls)
+        }
+        assert sent == {
+            "names-1": {"name": "g1"},
+            "names-2": {"name": "g1"},
+            "no-users": {"name": "g1", "description": "d"},
+            "everything": {"name": "g1", "users": ["uid=u1", "uid=u2"], "description": "d"},
+        }
+
+    async def test_dispatch_events_pipelined(self, dispatcher_service: DispatcherService):
+        dispatcher_service.pipeline_size = 4
+        dispatcher_service.mq_pull.initialize_subscription.return_value = QueueStatus.READY
+        fake_acks = [AsyncMock(), AsyncMock()]
+        dispatcher_service.mq_pull.get_message_batch = AsyncMock(
+            side_effect=[
+                [(MQMESSAGE, fake_acks[0]), (MQMESSAGE, fake_acks[1])],
+                Empty(),
+                EscapeLoopException("Stop waiting for the new event"),
+            ]
+        )
+        dispatcher_service.subscriptions_db.get_all_subscriptions = get_all_subscriptions
+
+        with pytest.raises(ExceptionGroup) as exception:
+            await dispatcher_service.run()
+
+        assert str(exception.value.exceptions[0]) == "Stop waiting for the new event"
+        dispatcher_service.mq_pull.initialize_subscription.assert_called_once_with(
+            IncomingQueue("dispatcher_consumer_name", max_ack_pending=4), migrate_stream=True
+        )
+        dispatcher_service.mq_pull.get_message_batch.assert_has_calls([call(4, timeout=10)] * 3)
+        dispatcher_service.mq_pull.get_one_message.assert_not_called()
+        dispatcher_service.mq_push.enqueue_message.assert_has_calls(
+            [call(ConsumerQueue(SUBSCRIPTION_NAME), MESSAGE)] * 2
+        )
+        for fake_ack in fake_acks:
+            fake_ack.acknowledge_message.assert_called_once_with()
+
+    def test_message_key(self):
+        udm_message = MQMESSAGE.model_copy(deep=True)
+        assert DispatcherService.message_key(udm_message) == "uid=foo,dc=bar"
+
+        udm_message.data["body"]["new"]["id"] = "e7b5a3f0"
+        assert DispatcherService.message_key(udm_message) == "e7b5a3f0"
+
+        udm_message.data["realm"] = "foo"
+        assert DispatcherService.message_key(udm_message) == ("foo", GROUPS_TOPIC)
+
+    async def test_load_subscriptions_mapping(self, dispatcher_service: DispatcherService):
+        subscriptions = [
+            Subscription.model_validate({**SUBSCRIPTION_INFO, "name": name}) for name in ("sub-1", "no-stream")
+        ]
+
+        async def get_all_subscriptions():
+            for sub in subscriptions:
+                yield sub
+
+        dispatcher_service.subscriptions_db.get_all_subscriptions = get_all_subscriptions
+        dispatcher_service.mq_push.stream_exists.side_effect = lambda queue: queue.name != "no-stream"
+
+        await dispatcher_service.update_subscriptions_mapping()
+
+        assert dispatcher_service._subscriptions.as_dict() == {REALM: {GROUPS_TOPIC: {"sub-1"}}}
+
+    async def test_update_subscriptions_mapping_incrementally(self, dispatcher_service: DispatcherService):
+        dispatcher_service._subscriptions = subscriptions_mapping(2)
+        dispatcher_service.mq_push.stream_exists.return_value = True
+        changed = Subscription.model_validate(
+            {**SUBSCRIPTION_INFO, "name": "sub-0", "realms_topics": [{"realm": REALM, "topic": USERS_TOPIC}]}
+        )
+
+        await dispatcher_service.update_subscriptions_mapping("sub-0", changed.model_dump_json().encode())
+
+        assert dispatcher_service._subscriptions.as_dict() == {REALM: {GROUPS_TOPIC: {"sub-1"}, USERS_TOPIC: {"sub-0"}}}
+        dispatcher_service.mq_push.stream_exists.assert_called_once_with(ConsumerQueue("sub-0"))
+        dispatcher_service.subscriptions_db.get_all_subscriptions.assert_not_called()
+
+        await dispatcher_service.update_subscriptions_mapping("sub-0", None)
+        await dispatcher_service.update_subscriptions_mapping("sub-1", None)
+
+        assert len(dispatcher_service._subscriptions) == 0
+        assert dispatcher_service._subscriptions.resolve(REALM, GROUPS_TOPIC) == frozenset()
@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+from test_helpers.mock_data import GROUPS_TOPIC, REALM, SUBSCRIPTION_INFO, USERS_TOPIC
+
+from univention.provisioning.dispatcher.routing import RoutingIndex
+from univention.provisioning.models.subscription import Subscription
+
+
+def subscription(name: str, *topics: str) -> Subscription:
+    return Subscription.model_validate(
+        {**SUBSCRIPTION_INFO, "name": name, "realms_topics": [{"realm": REALM, "topic": topic} for topic in topics]}
+    )
+
+
+def names(subscriptions) -> set[str]:
+    return {sub.name for sub in subscriptions}
+
+
+def test_resolve_exact_prefix_and_regex_topics():
+    index = RoutingIndex(
+        [
+            subscription("exact", GROUPS_TOPIC),
+            subscription("prefix", "users/.*"),
+            subscription("regex", "(users|groups)/(user|group)"),
+            subscription("all", ".*"),
+        ]
+    )
+
+    assert names(index.resolve(REALM, GROUPS_TOPIC)) == {"exact", "regex", "all"}
+    assert names(index.resolve(REALM, USERS_TOPIC)) == {"prefix", "regex", "all"}
+    assert names(index.resolve(REALM, "users/contact")) == {"prefix", "all"}
+    assert names(index.resolve(REALM, "dns/dns")) == {"all"}
+    assert index.resolve("other-realm", GROUPS_TOPIC) == frozenset()
+
+
+def test_regex_topics_match_the_whole_topic():
+    index = RoutingIndex([subscription("regex", "users/(user|contact)")])
+
+    assert names(index.resolve(REALM, "users/user")) == {"regex"}
+    assert index.resolve(REALM, "users/users") == frozenset()
+    assert index.resolve(REALM, "x-users/user") == frozenset()
+
+
+def test_invalid_regex_topic_is_matched_literally():
+    index = RoutingIndex([subscription("invalid", "users/(user")])
+
+    assert names(index.resolve(REALM, "users/(user")) == {"invalid"}
+
+
+def test_add_and_remove_invalidate_resolved_topics():
+    index = RoutingIndex([subscription("sub-1", GROUPS_TOPIC)])
+    assert names(index.resolve(REALM, GROUPS_TOPIC)) == {"sub-1"}
+
+    index.add(subscription("sub-2", "groups/.*"))
+    assert names(index.resolve(REALM, GROUPS_TOPIC)) == {"sub-1", "sub-2"}
+
+    index.add(subscription("sub-1", USERS_TOPIC))
+    assert names(index.resolve(REALM, GROUPS_TOPIC)) == {"sub-2"}
+    assert names(index.resolve(REALM, USERS_TOPIC)) == {"sub-1"}
+
+    assert index.remove("sub-2").name == "sub-2"
+    assert index.remove("sub-2") is None
+    assert index.resolve(REALM, GROUPS_TOPIC) == frozenset()
+    assert len(index) == 1
+    assert index.as_dict() == {REALM: {USERS_TOPIC: {"sub-1"}}}
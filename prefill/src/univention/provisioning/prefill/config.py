@@ -31,6 +31,10 @@ class PrefillSettings(BaseSettings):
     # Prefill: maximum number of retries of a prefill request
     # -1 means infinite retries.
     max_prefill_attempts: conint(ge=-1)
+    # Prefill: maximum number of UDM objects fetched but not published yet
+    prefill_queue_size: conint(ge=1) = 1000
+    # Prefill: maximum number of messages published but not acknowledged by NATS yet
+    prefill_publish_window: conint(ge=1) = 256
 
     # UDM REST API: host
     udm_host: str
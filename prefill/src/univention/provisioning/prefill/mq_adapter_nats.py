@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import logging
-from typing import Optional, Tuple
+from typing import AsyncIterable, Optional, Tuple
 
 from univention.provisioning.backends import message_queue
 from univention.provisioning.backends.message_queue import Acknowledgements, QueueStatus
@@ -47,6 +47,9 @@ class NatsMessageQueue(MessageQueuePort):
     async def add_message(self, queue: BaseQueue, message: BaseMessage) -> None:
         await self.mq.add_message(queue, message)
 
+    async def add_messages(self, queue: BaseQueue, messages: AsyncIterable[BaseMessage], window: int) -> int:
+        return await self.mq.add_messages(queue, messages, window)
+
     async def get_one_message(self) -> Tuple[MQMessage, Acknowledgements]:
         return await self.mq.get_one_message()
 
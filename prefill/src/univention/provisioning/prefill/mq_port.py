@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import abc
-from typing import Optional, Self, Tuple
+from typing import AsyncIterable, Optional, Self, Tuple
 
 from univention.provisioning.backends.message_queue import Acknowledgements, QueueStatus
 from univention.provisioning.backends.nats_mq import BaseQueue
@@ -30,6 +30,9 @@ class MessageQueuePort(abc.ABC):
     @abc.abstractmethod
     async def add_message(self, queue: BaseQueue, message: BaseMessage) -> None: ...
 
+    @abc.abstractmethod
+    async def add_messages(self, queue: BaseQueue, messages: AsyncIterable[BaseMessage], window: int) -> int: ...
+
     @abc.abstractmethod
     async def get_one_message(self) -> Tuple[MQMessage, Acknowledgements]: ...
 
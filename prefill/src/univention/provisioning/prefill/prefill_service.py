@@ -1,9 +1,10 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
+import asyncio
 import logging
 import re
 from datetime import datetime
-from typing import Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 
 from pydantic import ValidationError
 
@@ -124,27 +125,64 @@ class PrefillService:
 
     async def _handle_message(self, message: PrefillMessage):
         await self.mq.purge_queue(PrefillConsumerQueue(message.subscription_name))
+        matches = message.filter.matcher() if message.filter else None
+        project = message.projection.project if message.projection else None
+
+        # Fetching the objects from UDM and publishing them run concurrently, decoupled by a bounded queue.
+        objects: asyncio.Queue[Optional[Message]] = asyncio.Queue(maxsize=self.settings.prefill_queue_size)
+
+        async def fetch() -> None:
+            for realm_topic in message.realms_topics:
+                if realm_topic.realm != "udm":
+                    # FIXME: unhandled realm
+                    logger.error("Unhandled realm: %r", realm_topic.realm)
+                    continue
+
+                logger.info(
+                    "Started the prefill for the subscriber %r with the topic %r",
+                    message.subscription_name,
+                    realm_topic.topic,
+                )
+                await self.update_sub_q_status.update_subscription_queue_status(
+                    message.subscription_name, FillQueueStatus.running
+                )
+                await self.fetch_udm(message.subscription_name, realm_topic.topic, matches, project, objects.put)
+            await objects.put(None)
 
-        for realm_topic in message.realms_topics:
-            if realm_topic.realm != "udm":
-                # FIXME: unhandled realm
-                logger.error("Unhandled realm: %r", realm_topic.realm)
-                continue
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(fetch())
+                published = tg.create_task(
+                    self.mq.add_messages(
+                        PrefillConsumerQueue(message.subscription_name),
+                        self._dequeue(objects),
+                        self.settings.prefill_publish_window,
+                    )
+                )
+        except ExceptionGroup as exc:
+            # The callers handle the errors of fetching or publishing, not the group wrapping them.
+            raise exc.exceptions[0] from exc
+        logger.info("Published %d objects for the subscriber %r.", published.result(), message.subscription_name)
 
-            logger.info(
-                "Started the prefill for the subscriber %r with the topic %r",
-                message.subscription_name,
-                realm_topic.topic,
-            )
-            await self.update_sub_q_status.update_subscription_queue_status(
-                message.subscription_name, FillQueueStatus.running
-            )
-            await self.fetch_udm(message.subscription_name, realm_topic.topic)
+    @staticmethod
+    async def _dequeue(objects: asyncio.Queue[Optional[Message]]) -> AsyncIterator[Message]:
+        while (message := await objects.get()) is not None:
+            yield message
 
-    async def fetch_udm(self, subscription_name: str, topic: str) -> None:
+    async def fetch_udm(
+        self,
+        subscription_name: str,
+        topic: str,
+        matches: Optional[Callable[[dict[str, Any], dict[str, Any]], bool]] = None,
+        project: Optional[Callable[[dict[str, Any]], dict[str, Any]]] = None,
+        publish: Optional[Callable[[Message], Awaitable[None]]] = None,
+    ) -> None:
         """
         Start fetching all data for the given topic.
         Find all UDM object types that match the given topic.
+        Only objects for which `matches(old={}, new=obj)` returns True are added, if given (the subscription filter).
+        Objects are added as returned by `project(obj)`, if given (the subscription projection).
+        Messages are passed to `publish(message)`, if given, instead of being added to the prefill queue one by one.
         """
 
         udm_modules = await self.udm.get_object_types()
@@ -157,7 +195,7 @@ class PrefillService:
         for module in udm_match:
             this_topic = module["name"]
             logger.info("Grabbing %r objects.", this_topic)
-            await self._fill_udm_topic(this_topic, subscription_name)
+            await self._fill_udm_topic(this_topic, subscription_name, matches, project, publish)
 
     @staticmethod
     def match_topic(sub_topic: str, module_name: str) -> bool:
@@ -165,17 +203,37 @@ class PrefillService:
 
         return re.fullmatch(sub_topic, module_name) is not None
 
-    async def _fill_udm_topic(self, object_type: str, subscription_name: str):
+    async def _fill_udm_topic(
+        self,
+        object_type: str,
+        subscription_name: str,
+        matches: Optional[Callable[[dict[str, Any], dict[str, Any]], bool]] = None,
+        project: Optional[Callable[[dict[str, Any]], dict[str, Any]]] = None,
+        publish: Optional[Callable[[Message], Awaitable[None]]] = None,
+    ):
         """Find the DNs of all UDM objects for an object_type."""
 
         urls = await self.udm.list_objects(object_type)
         for url in urls:
             logger.info("Grabbing object from: %r", url)
-            await self._fill_object(url, object_type, subscription_name)
+            await self._fill_object(url, object_type, subscription_name, matches, project, publish)
 
-    async def _fill_object(self, url: str, object_type: str, subscription_name: str):
+    async def _fill_object(
+        self,
+        url: str,
+        object_type: str,
+        subscription_name: str,
+        matches: Optional[Callable[[dict[str, Any], dict[str, Any]], bool]] = None,
+        project: Optional[Callable[[dict[str, Any]], dict[str, Any]]] = None,
+        publish: Optional[Callable[[Message], Awaitable[None]]] = None,
+    ):
         """Retrieve the object for the given DN."""
         obj = await self.udm.get_object(url)
+        if matches and not matches({}, obj):
+            logger.debug("Object does not match the filter of the subscription: %r", url)
+            return
+        if project:
+            obj = project(obj)
 
         message = Message(
             publisher_name=PublisherName.udm_pre_fill,
@@ -185,7 +243,10 @@ class PrefillService:
             body=Body(old={}, new=obj),
         )
         logger.info("Sending to the consumer prefill queue from: %r", url)
-        await self.mq.add_message(PrefillConsumerQueue(subscription_name), message)
+        if publish:
+            await publish(message)
+        else:
+            await self.mq.add_message(PrefillConsumerQueue(subscription_name), message)
 
     async def add_to_failure_queue(self, data: dict) -> None:
         logger.info("Adding request to the prefill failures queue")
@@ -21,6 +21,7 @@ from univention.provisioning.backends.message_queue import MessageAckManager, Qu
 from univention.provisioning.backends.nats_mq import PrefillConsumerQueue, PrefillFailuresQueue, PrefillQueue
 from univention.provisioning.models.constants import PublisherName
 from univention.provisioning.models.message import Body, Message
+from univention.provisioning.models.subscription import FillQueueStatus
 from univention.provisioning.prefill.config import PrefillSettings
 from univention.provisioning.prefill.mq_port import MessageQueuePort
 from univention.provisioning.prefill.prefill_service import PrefillService
@@ -36,9 +37,21 @@ class PrefillSettingsFactory(ModelFactory[PrefillSettings]): ...
 
 
 @pytest.fixture
-def udm_prefill(prefill_settings_factory: ModelFactory[PrefillSettings]) -> PrefillService:
+def published() -> list[tuple[PrefillConsumerQueue, Message]]:
+    """The messages published with `MessageQueuePort.add_messages()`."""
+    return []
+
+
+@pytest.fixture
+def udm_prefill(prefill_settings_factory: ModelFactory[PrefillSettings], published) -> PrefillService:
     mq_mock = AsyncMock(spec_set=MessageQueuePort)
     mq_mock.initialize_subscription.return_value = QueueStatus.READY
+
+    async def add_messages(queue, messages, window):
+        published.extend([(queue, message) async for message in messages])
+        return len(published)
+
+    mq_mock.add_messages.side_effect = add_messages
     udm_prefill = PrefillService(
         ack_manager=MessageAckManager(),
         mq=mq_mock,
@@ -86,7 +99,7 @@ class TestUDMPreFill:
     msg2.body.new = obj_2
 
     @patch("univention.provisioning.prefill.prefill_service.datetime")
-    async def test_handle_requests_to_prefill(self, mock_datetime, udm_prefill: PrefillService):
+    async def test_handle_requests_to_prefill(self, mock_datetime, udm_prefill: PrefillService, published):
         mock_datetime.now.return_value = self.mocked_date
         mock_acknowledgements = AsyncMock()
         udm_prefill.mq.get_one_message = AsyncMock(
@@ -109,11 +122,16 @@ class TestUDMPreFill:
         udm_prefill.udm.list_objects.assert_called_once_with(GROUPS_TOPIC)
         udm_prefill.udm.get_object.assert_called_once_with(self.url)
         mock_acknowledgements.acknowledge_message.assert_called_once()
-        udm_prefill.mq.add_message.assert_called_once_with(PrefillConsumerQueue(SUBSCRIPTION_NAME), self.msg)
-        udm_prefill.mq.add_message.assert_called_once()
+        udm_prefill.mq.add_messages.assert_called_once_with(
+            PrefillConsumerQueue(SUBSCRIPTION_NAME), ANY, udm_prefill.settings.prefill_publish_window
+        )
+        assert published == [(PrefillConsumerQueue(SUBSCRIPTION_NAME), self.msg)]
+        udm_prefill.mq.add_message.assert_not_called()
 
     @patch("univention.provisioning.prefill.prefill_service.datetime")
-    async def test_handle_requests_to_prefill_multiple_topics(self, mock_datetime, udm_prefill: PrefillService):
+    async def test_handle_requests_to_prefill_multiple_topics(
+        self, mock_datetime, udm_prefill: PrefillService, published
+    ):
         mock_datetime.now.return_value = self.mocked_date
         mock_acknowledgements = AsyncMock()
         udm_prefill.mq.get_one_message = AsyncMock(
@@ -136,12 +154,10 @@ class TestUDMPreFill:
         udm_prefill.udm.list_objects.assert_has_calls([call(GROUPS_TOPIC), call(USERS_TOPIC)])
         udm_prefill.udm.get_object.assert_has_calls([call(self.url), call(self.url_2)])
         mock_acknowledgements.acknowledge_message.assert_called_once()
-        udm_prefill.mq.add_message.assert_has_calls(
-            [
-                call(PrefillConsumerQueue(SUBSCRIPTION_NAME), self.msg),
-                call(PrefillConsumerQueue(SUBSCRIPTION_NAME), self.msg2),
-            ]
-        )
+        assert published == [
+            (PrefillConsumerQueue(SUBSCRIPTION_NAME), self.msg),
+            (PrefillConsumerQueue(SUBSCRIPTION_NAME), self.msg2),
+        ]
 
     @patch("univention.provisioning.prefill.prefill_service.datetime")
     async def test_handle_requests_to_prefill_moving_to_failures(self, mock_datetime, udm_prefill: PrefillService):
@@ -165,6 +181,27 @@ class TestUDMPreFill:
         mock_acknowledgements.acknowledge_message.assert_called_once()
         udm_prefill.mq.add_message.assert_called_once_with(PrefillFailuresQueue(), ANY)
 
+    async def test_prefill_publishing_fails(self, udm_prefill: PrefillService):
+        udm_prefill.settings.prefill_queue_size = 1
+        udm_prefill.udm.get_object_types = AsyncMock(return_value=[self.udm_modules])
+        udm_prefill.udm.list_objects = AsyncMock(return_value=[self.url] * 10)
+        udm_prefill.udm.get_object = AsyncMock(return_value=self.obj)
+
+        async def add_messages(queue, messages, window):
+            await anext(messages)
+            raise ConnectionError("NATS is gone")
+
+        udm_prefill.mq.add_messages.side_effect = add_messages
+
+        with pytest.raises(ConnectionError, match="NATS is gone") as exc_info:
+            await udm_prefill.handle_message(MQMESSAGE_PREFILL)
+
+        assert isinstance(exc_info.value.__cause__, ExceptionGroup)
+        assert udm_prefill.udm.get_object.call_count < 10
+        udm_prefill.update_sub_q_status.update_subscription_queue_status.assert_called_once_with(
+            SUBSCRIPTION_NAME, FillQueueStatus.running
+        )
+
     @patch("univention.provisioning.prefill.prefill_service.datetime")
     async def test_fetch_no_udm_module(self, mock_datetime, udm_prefill: PrefillService):
         mock_datetime.now.return_value = self.mocked_date
@@ -33,6 +33,10 @@ class EscapeLoopException(Exception): ...
 class PrefillSettingsFactory(ModelFactory[PrefillSettings]): ...
 
 
+async def publish(queue, messages, window) -> int:
+    return len([message async for message in messages])
+
+
 @pytest.fixture
 async def udm_prefill(httpserver, prefill_settings_factory: ModelFactory[PrefillSettings]) -> PrefillService:
     setup_logging(logging.INFO)
@@ -98,6 +102,7 @@ async def udm_prefill(httpserver, prefill_settings_factory: ModelFactory[Prefill
     async with UDMAdapter(settings) as udm:
         mq_mock = AsyncMock(spec_set=MessageQueuePort)
         mq_mock.initialize_subscription.return_value = QueueStatus.READY
+        mq_mock.add_messages.side_effect = publish
         udm_prefill = PrefillService(
             ack_manager=MessageAckManager(),
             mq=mq_mock,
@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from functools import lru_cache
+from typing import Optional
+
+from .config import app_settings
+
+
+class AccessTokenSigner:
+    """
+    Issues and verifies short-lived access tokens of subscriptions, signed with HMAC-SHA256.
+
+    `<base64(subscription name)>.<expiry>.<credentials fingerprint>.<base64(signature)>`
+
+    The credentials fingerprint is derived from the stored password hash of the subscription.
+    The hash is salted, so it changes when the password is changed or the subscription is deleted and recreated,
+    invalidating all tokens issued before.
+    """
+
+    def __init__(self, secret: bytes, ttl: int):
+        self.secret = secret
+        self.ttl = ttl
+
+    def issue(self, name: str, hashed_password: str) -> str:
+        payload = (
+            f"{self._encode(name.encode('utf-8'))}.{int(time.time()) + self.ttl}."
+            f"{self.credentials_fingerprint(hashed_password)}"
+        )
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str) -> Optional[tuple[str, str]]:
+        """
+        Return the name of the subscription the token was issued for and the fingerprint of its credentials at that
+        time, None if the token is invalid or expired.
+        """
+        payload, _, signature = token.rpartition(".")
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        try:
+            encoded_name, expiry, fingerprint = payload.split(".")
+            if int(expiry) < time.time():
+                return None
+            name = base64.urlsafe_b64decode(encoded_name + "=" * (-len(encoded_name) % 4)).decode("utf-8")
+        except (ValueError, binascii.Error):
+            return None
+        return name, fingerprint
+
+    def is_current(self, fingerprint: str, hashed_password: str) -> bool:
+        """Whether a token's credentials fingerprint belongs to the currently stored password hash."""
+        return hmac.compare_digest(fingerprint, self.credentials_fingerprint(hashed_password))
+
+    def credentials_fingerprint(self, hashed_password: str) -> str:
+        return self._encode(hmac.digest(self.secret, hashed_password.encode("utf-8"), hashlib.sha256)[:12])
+
+    def _sign(self, payload: str) -> str:
+        return self._encode(hmac.digest(self.secret, payload.encode("utf-8"), hashlib.sha256))
+
+    @staticmethod
+    def _encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+@lru_cache(maxsize=1)
+def access_token_signer() -> Optional[AccessTokenSigner]:
+    """Return None, if no `token_secret` is configured: access tokens are disabled."""
+    settings = app_settings()
+    if not settings.token_secret:
+        return None
+    return AccessTokenSigner(settings.token_secret.encode("utf-8"), settings.token_ttl)
@@ -35,6 +35,21 @@ class AppSettings(BaseSettings):
     admin_nats_user: str
     # Admin Nats password
     admin_nats_password: str
+    # Nats: number of connections for the message queue and the key-value store each,
+    # kept open for the lifetime of the application and shared by all requests
+    nats_connection_pool_size: int = 2
+
+    # Subscription authentication: number of threads hashing and verifying passwords (bcrypt)
+    password_hash_workers: int = 4
+    # Subscription authentication: maximum number of remembered successful password verifications
+    password_cache_size: int = 1024
+    # Subscription authentication: seconds a successful password verification is remembered
+    password_cache_ttl: float = 30.0
+    # Subscription authentication: secret to sign access tokens with. Must be the same for all instances
+    # of the Provisioning API. If empty, access tokens are disabled.
+    token_secret: str = ""
+    # Subscription authentication: seconds an access token is valid
+    token_ttl: int = 300
 
     # Prefill: username
     prefill_username: str
@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import itertools
+import logging
+from functools import lru_cache
+from typing import Callable, Optional, TypeVar, Union
+
+from .config import AppSettings, app_settings
+from .mq_adapter_nats import NatsMessageQueue
+from .subscriptions_db_adapter_nats import NatsSubscriptionsDB
+
+logger = logging.getLogger(__name__)
+
+Connection = TypeVar("Connection", bound=Union[NatsMessageQueue, NatsSubscriptionsDB])
+
+
+class NatsConnectionPool:
+    """
+    Long-lived NATS connections shared by all requests.
+
+    Holds `size` connected message queue and key-value store adapters each and hands them out round-robin.
+    A connection that was closed (e.g. after its reconnect attempts ran out) is replaced when it is handed out next.
+    """
+
+    def __init__(self, settings: Optional[AppSettings] = None, size: Optional[int] = None):
+        self.settings = settings or app_settings()
+        self.size = size or self.settings.nats_connection_pool_size
+        self._mqs: list[NatsMessageQueue] = []
+        self._kvs: list[NatsSubscriptionsDB] = []
+        self._mq_slots = itertools.cycle(range(self.size))
+        self._kv_slots = itertools.cycle(range(self.size))
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        async with self._lock:
+            if self._mqs:
+                return
+            for _ in range(self.size):
+                self._mqs.append(await self._connect(NatsMessageQueue))
+                self._kvs.append(await self._connect(NatsSubscriptionsDB))
+        logger.info("Opened %d NATS connections for the message queue and the key-value store each.", self.size)
+
+    async def close(self) -> None:
+        async with self._lock:
+            for connection in [*self._mqs, *self._kvs]:
+                if not connection.is_closed:
+                    await connection.__aexit__(None, None, None)
+            self._mqs.clear()
+            self._kvs.clear()
+
+    async def message_queue(self) -> NatsMessageQueue:
+        return await self._get(self._mqs, next(self._mq_slots), NatsMessageQueue)
+
+    async def subscriptions_db(self) -> NatsSubscriptionsDB:
+        return await self._get(self._kvs, next(self._kv_slots), NatsSubscriptionsDB)
+
+    async def _get(self, connections: list[Connection], slot: int, factory: Callable[..., Connection]) -> Connection:
+        if not connections:
+            await self.connect()
+        if not connections[slot].is_closed:
+            return connections[slot]
+        async with self._lock:
+            if connections[slot].is_closed:
+                logger.warning("Replacing closed NATS connection of %s.", factory.__name__)
+                connections[slot] = await self._connect(factory)
+            return connections[slot]
+
+    async def _connect(self, factory: Callable[..., Connection]) -> Connection:
+        connection = factory(self.settings)
+        await connection.__aenter__()
+        return connection
+
+
+@lru_cache(maxsize=1)
+def nats_connection_pool() -> NatsConnectionPool:
+    return NatsConnectionPool()
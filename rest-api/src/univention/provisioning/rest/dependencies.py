@@ -1,33 +1,75 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
+import binascii
 import secrets
-from typing import Annotated
+from base64 import b64decode
+from typing import Annotated, Optional, Union
 
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
+from fastapi.security.utils import get_authorization_scheme_param
 
 from .config import AppSettings, app_settings
-from .mq_adapter_nats import NatsMessageQueue
+from .connection_pool import nats_connection_pool
 from .mq_port import MessageQueuePort
-from .subscriptions_db_adapter_nats import NatsSubscriptionsDB
 from .subscriptions_db_port import SubscriptionsDBPort
 
 http_basic = HTTPBasic()
+optional_http_basic = HTTPBasic(auto_error=False)
+optional_http_bearer = HTTPBearer(auto_error=False)
 
+# HTTP Basic credentials or a bearer token of a subscription
+SubscriptionCredentials = Union[HTTPBasicCredentials, HTTPAuthorizationCredentials]
 
-async def _kv_dependency():
-    async with NatsSubscriptionsDB() as kv:
-        yield kv
 
+async def _kv_dependency() -> SubscriptionsDBPort:
+    return await nats_connection_pool().subscriptions_db()
 
-async def _mq_dependency():
-    async with NatsMessageQueue() as mq:
-        yield mq
+
+async def _mq_dependency() -> MessageQueuePort:
+    return await nats_connection_pool().message_queue()
+
+
+def subscription_credentials(
+    bearer: Annotated[Optional[HTTPAuthorizationCredentials], Depends(optional_http_bearer)],
+    basic: Annotated[Optional[HTTPBasicCredentials], Depends(optional_http_basic)],
+) -> SubscriptionCredentials:
+    """A bearer token (see `POST /v1/subscriptions/{name}/token`) or HTTP Basic credentials."""
+    if bearer:
+        return bearer
+    if basic:
+        return basic
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+
+def websocket_subscription_credentials(websocket: WebSocket) -> SubscriptionCredentials:
+    """
+    HTTP Basic credentials or a bearer token from the WebSocket handshake
+    (`HTTPBasic` and `HTTPBearer` only support HTTP requests).
+    """
+    scheme, param = get_authorization_scheme_param(websocket.headers.get("Authorization"))
+    if scheme.lower() == "bearer" and param:
+        return HTTPAuthorizationCredentials(scheme=scheme, credentials=param)
+    try:
+        if scheme.lower() != "basic":
+            raise ValueError("Not authenticated")
+        username, separator, password = b64decode(param).decode("ascii").partition(":")
+        if not separator:
+            raise ValueError("Invalid authentication credentials")
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+    return HTTPBasicCredentials(username=username, password=password)
 
 
 AppSettingsDep = Annotated[AppSettings, Depends(app_settings)]
 HttpBasicDep = Annotated[HTTPBasicCredentials, Depends(http_basic)]
+SubscriptionCredentialsDep = Annotated[SubscriptionCredentials, Depends(subscription_credentials)]
+WebSocketSubscriptionCredentialsDep = Annotated[SubscriptionCredentials, Depends(websocket_subscription_credentials)]
 KVDependency = Annotated[SubscriptionsDBPort, Depends(_kv_dependency)]
 MQDependency = Annotated[MessageQueuePort, Depends(_mq_dependency)]
 
@@ -17,8 +17,11 @@ from univention.provisioning.backends.nats_mq import IncomingQueue, PrefillQueue
 from univention.provisioning.utils.log import setup_logging
 
 from .config import app_settings
+from .connection_pool import nats_connection_pool
+from .message_waiters import message_waiters
 from .messages import router as messages_api_router
-from .mq_adapter_nats import NatsMessageQueue
+from .password_verifier import password_verifier
+from .subscription_cache import subscription_cache
 from .subscriptions import router as subscriptions_api_router
 
 logger = logging.getLogger(__name__)
@@ -72,11 +75,21 @@ add_exception_handlers(app)
 
 @app.on_event("startup")
 async def startup_task():
-    settings = app_settings()
-    async with NatsMessageQueue(settings) as mq:
-        logger.info("Checking MQ connectivity...")
-        await mq.create_queue(PrefillQueue())
-        await mq.create_queue(IncomingQueue(""))
+    pool = nats_connection_pool()
+    await pool.connect()
+    mq = await pool.message_queue()
+    logger.info("Checking MQ connectivity...")
+    await mq.create_queue(PrefillQueue())
+    await mq.create_queue(IncomingQueue(""))
+    await subscription_cache().start(pool.subscriptions_db)
+
+
+@app.on_event("shutdown")
+async def shutdown_task():
+    await subscription_cache().close()
+    await message_waiters().close()
+    await nats_connection_pool().close()
+    password_verifier().close()
 
 
 @app.exception_handler(RequestValidationError)
@@ -1,27 +1,55 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
+import asyncio
 import logging
 import time
-from typing import Optional
+from typing import Awaitable, Callable, Optional, TypeVar
 
 from univention.provisioning.backends.nats_mq import ConsumerQueue, PrefillConsumerQueue
-from univention.provisioning.models.message import MessageProcessingStatus, ProvisioningMessage
+from univention.provisioning.models.message import (
+    MessageProcessingStatus,
+    MessageProcessingStatusResult,
+    ProvisioningMessage,
+)
 from univention.provisioning.models.subscription import FillQueueStatus
 
+from .message_waiters import MessageWaiters, message_waiters
 from .mq_port import MessageQueuePort
+from .subscription_cache import SubscriptionCache
 from .subscription_service import SubscriptionService
 from .subscriptions_db_port import SubscriptionsDBPort
 
 logger = logging.getLogger(__name__)
 
+# How long a streaming delivery waits for new messages per request to NATS.
+STREAM_FETCH_TIMEOUT = 10
+# Seconds a pull request for the main queue is kept open, before waiting for a message to be published.
+PULL_TIMEOUT = 0.5
+# Maximum seconds after which the main queue is checked again while its consumer has unacknowledged messages,
+# even if no message was published: they are delivered again after the consumer's `ack_wait`.
+RECHECK_INTERVAL = 5.0
+
+T = TypeVar("T")
 
-class MessageService:
-    _subscription_prefill_done: dict[str, bool] = {}
 
-    def __init__(self, subscriptions_db: SubscriptionsDBPort, mq: MessageQueuePort):
+class MessageService:
+    def __init__(
+        self,
+        subscriptions_db: SubscriptionsDBPort,
+        mq: MessageQueuePort,
+        cache: Optional[SubscriptionCache] = None,
+        waiters: Optional[MessageWaiters] = None,
+    ):
         self.mq = mq
-        self.sub_service = SubscriptionService(subscriptions_db=subscriptions_db, mq=mq)
+        self.sub_service = SubscriptionService(subscriptions_db=subscriptions_db, mq=mq, cache=cache)
+        self._waiters = waiters
+
+    @property
+    def waiters(self) -> MessageWaiters:
+        if not self._waiters:
+            self._waiters = message_waiters()
+        return self._waiters
 
     async def get_next_message(
         self,
@@ -37,28 +65,20 @@ class MessageService:
         """
         timeout = max(timeout, 0.1)  # Timeout of 0 leads to internal server error
         t0 = time.perf_counter()
-        if self._subscription_prefill_done.get(subscription_name, False):
-            message = await self.mq.get_message(ConsumerQueue(subscription_name), timeout, pop)
+        if self.sub_service.cache.is_prefill_delivered(subscription_name):
+            main_queue = ConsumerQueue(subscription_name)
+            message = await self._wait_for_messages(
+                main_queue, timeout, lambda pull_timeout: self.mq.get_message(main_queue, pull_timeout, pop)
+            )
             queue = "main"
         else:
-            if (
-                await self.sub_service.check_subscription_queue_status(subscription_name, timeout)
-                != FillQueueStatus.done
-            ):  # take ~1.5ms
-                logger.warning(
-                    "Prefill status for subscription %r did not reach 'done' within the timeout period.",
-                    subscription_name,
-                )
+            if not await self._prefill_queue_ready(subscription_name, timeout):  # take ~1.5ms
                 return None
 
             message = await self.mq.get_message(PrefillConsumerQueue(subscription_name), timeout, pop)
             queue = "prefill"
             if message is None:
-                logger.info(
-                    "All messages from the prefill subject for %r have been delivered. Will not check again.",
-                    subscription_name,
-                )
-                self._subscription_prefill_done[subscription_name] = True
+                self._prefill_delivered(subscription_name)
         logger.debug(
             "Retrieved%s message from %s queue for %r. (%.1f ms)",
             " a" if message else " no",
@@ -68,6 +88,180 @@ class MessageService:
         )
         return message
 
+    async def get_messages(
+        self,
+        subscription_name: str,
+        timeout: float,
+        max_messages: int,
+        pop: bool,
+        sent: Optional[dict[str, int]] = None,
+    ) -> list[ProvisioningMessage]:
+        """Retrieve up to `max_messages` messages from the subscription's stream, in order.
+
+        :param str subscription_name: Name of the subscription.
+        :param float timeout: Max duration to wait for the first message.
+        :param int max_messages: Maximum number of messages to return.
+        :param bool pop: If the messages should be deleted after request.
+        :param dict sent: The highest sequence number returned before, per queue ("main" or "prefill").
+            Messages up to it are not returned again. It is updated with the returned messages.
+        """
+        timeout = max(timeout, 0.1)  # Timeout of 0 leads to internal server error
+        t0 = time.perf_counter()
+        sent = {} if sent is None else sent
+        if self.sub_service.cache.is_prefill_delivered(subscription_name):
+            main_queue = ConsumerQueue(subscription_name)
+            queue = "main"
+            after = sent.get(queue, 0)
+
+            async def pull(pull_timeout: float) -> list[ProvisioningMessage]:
+                return await self.mq.get_messages(main_queue, pull_timeout, max_messages, pop)
+
+            async def read(pull_timeout: float) -> list[ProvisioningMessage]:
+                return await self.mq.read_stream(main_queue, after, max_messages, pop)
+
+            # After messages were sent, the following ones are read from the stream. Pulling from the consumer
+            # would deliver the oldest unacknowledged message again and again, only to skip it.
+            messages = await self._wait_for_messages(
+                main_queue, timeout, read if after else pull, redeliveries=not after
+            )
+        else:
+            if not await self._prefill_queue_ready(subscription_name, timeout):
+                return []
+
+            queue = "prefill"
+            after = sent.get(queue, 0)
+            messages = await self.mq.get_messages(
+                PrefillConsumerQueue(subscription_name), timeout, max_messages, pop, after
+            )
+            if not messages:
+                self._prefill_delivered(subscription_name)
+            messages = [message for message in messages if message.sequence_number > after]
+        if messages:
+            sent[queue] = messages[-1].sequence_number
+        logger.debug(
+            "Retrieved %d messages from %s queue for %r. (%.1f ms)",
+            len(messages),
+            queue,
+            subscription_name,
+            (time.perf_counter() - t0) * 1000,
+        )
+        return messages
+
+    async def stream_messages(
+        self,
+        subscription_name: str,
+        window: int,
+        send: Callable[[ProvisioningMessage], Awaitable[None]],
+        receive_acknowledgements: Callable[[], Awaitable[list[int]]],
+    ) -> None:
+        """Push the subscription's messages to `send` as they arrive, until sending or receiving fails.
+
+        :param str subscription_name: Name of the subscription.
+        :param int window: Max number of messages sent but not acknowledged yet.
+        :param send: Delivers a message to the subscriber.
+        :param receive_acknowledgements: Waits for the sequence numbers of messages the subscriber processed.
+        """
+        unacknowledged: set[int] = set()
+        window_changed = asyncio.Condition()
+        # The highest sequence number sent, per queue. A message can still be read after its acknowledgement was
+        # received, until it is deleted: it must not be sent again.
+        sent: dict[str, int] = {}
+
+        async def deliver() -> None:
+            while True:
+                async with window_changed:
+                    await window_changed.wait_for(lambda: len(unacknowledged) < window)
+                    free = window - len(unacknowledged)
+                messages = await self.get_messages(subscription_name, STREAM_FETCH_TIMEOUT, free, pop=False, sent=sent)
+                for message in messages:
+                    unacknowledged.add(message.sequence_number)
+                    await send(message)
+
+        async def acknowledge() -> None:
+            while True:
+                seq_nums = await receive_acknowledgements()
+                results = await self.update_messages_status(subscription_name, seq_nums, MessageProcessingStatus.ok)
+                for result in results:
+                    if not result.ok:
+                        logger.warning(
+                            "Failed to acknowledge message %r of %r: %s",
+                            result.sequence_number,
+                            subscription_name,
+                            result.detail,
+                        )
+                async with window_changed:
+                    unacknowledged.difference_update(seq_nums)
+                    window_changed.notify()
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(deliver())
+            tg.create_task(acknowledge())
+
+    async def _wait_for_messages(
+        self, queue: ConsumerQueue, timeout: float, pull: Callable[[float], Awaitable[T]], redeliveries: bool = True
+    ) -> T:
+        """
+        Return the result of `pull(pull_timeout)` as soon as it is not empty, or after `timeout` seconds.
+
+        Instead of one pull request lasting `timeout` seconds, short pull requests are sent whenever a message was
+        published to the queue. Only while the queue's consumer has unacknowledged messages, they are also sent
+        after the queue's `ack_wait` (at most `RECHECK_INTERVAL`), when those messages are delivered again.
+        Without `redeliveries`, `pull` does not receive messages delivered again, so this is skipped.
+        """
+        deadline = time.monotonic() + timeout
+        recheck_interval = min(queue.ack_wait or RECHECK_INTERVAL, RECHECK_INTERVAL)
+        async with self.waiters.waiter(queue, self.mq) as published:
+            if not published:
+                return await pull(timeout)
+            while True:
+                published.clear()
+                result = await pull(min(max(deadline - time.monotonic(), 0.1), PULL_TIMEOUT))
+                remaining = deadline - time.monotonic()
+                if result or remaining <= 0:
+                    return result
+                recheck = redeliveries and await self._redelivery_pending(queue)
+                try:
+                    await asyncio.wait_for(published.wait(), min(remaining, recheck_interval) if recheck else remaining)
+                except TimeoutError:
+                    if not recheck:
+                        return result
+
+    async def _redelivery_pending(self, queue: ConsumerQueue) -> bool:
+        """Whether the consumer of `queue` has unacknowledged messages, which it will deliver again."""
+        try:
+            return await self.mq.get_num_ack_pending(queue) > 0
+        except Exception as exc:
+            logger.warning("Failed to get the unacknowledged messages of %r: %s", queue.consumer_name, exc)
+            return True
+
+    async def _prefill_queue_ready(self, subscription_name: str, timeout: float) -> bool:
+        if await self.sub_service.check_subscription_queue_status(subscription_name, timeout) == FillQueueStatus.done:
+            return True
+        logger.warning(
+            "Prefill status for subscription %r did not reach 'done' within the timeout period.",
+            subscription_name,
+        )
+        return False
+
+    def _prefill_delivered(self, subscription_name: str) -> None:
+        logger.info(
+            "All messages from the prefill subject for %r have been delivered. Will not check again.",
+            subscription_name,
+        )
+        self.sub_service.cache.prefill_delivered(subscription_name)
+
     async def update_message_status(self, subscription_name: str, seq_num: int, status: MessageProcessingStatus):
         if status == MessageProcessingStatus.ok:
             await self.mq.delete_message(ConsumerQueue(subscription_name), seq_num)
+
+    async def update_messages_status(
+        self, subscription_name: str, seq_nums: list[int], status: MessageProcessingStatus
+    ) -> list[MessageProcessingStatusResult]:
+        if status != MessageProcessingStatus.ok or not seq_nums:
+            return [MessageProcessingStatusResult(sequence_number=seq_num, ok=True) for seq_num in seq_nums]
+
+        errors = await self.mq.delete_messages(ConsumerQueue(subscription_name), seq_nums)
+        return [
+            MessageProcessingStatusResult(sequence_number=seq_num, ok=errors[seq_num] is None, detail=errors[seq_num])
+            for seq_num in seq_nums
+        ]
@@ -0,0 +1,131 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import contextlib
+import logging
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from univention.provisioning.backends.nats_mq import BaseQueue
+
+from .mq_port import MessageQueuePort
+
+logger = logging.getLogger(__name__)
+
+# Seconds a subscription to a subject is kept after its last waiter left.
+# Consumers poll again right after a request returned, so the subscription is usually reused.
+IDLE_TIMEOUT = 60.0
+
+
+class _Watch:
+    """The waiters for the messages of one subject, and the subscription waking them up."""
+
+    def __init__(self, mq: MessageQueuePort):
+        # The subscription lives on the connection of `mq`.
+        self.mq = mq
+        self.waiters: set[asyncio.Event] = set()
+        self.stop: Optional[Callable[[], Awaitable[None]]] = None
+        self.idle_timer: Optional[asyncio.TimerHandle] = None
+
+    async def notify(self) -> None:
+        for waiter in self.waiters:
+            waiter.set()
+
+
+class MessageWaiters:
+    """
+    Wakes up requests waiting for messages of a queue, when a message is published to it.
+
+    All requests of this process waiting for the same queue share one subscription to the queue's subject,
+    instead of each keeping a JetStream pull request open.
+    The subscription is made again, if the connection it was made with has been closed.
+    """
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        # {subject: watch}
+        self._watches: dict[str, _Watch] = {}
+        self._lock = asyncio.Lock()
+        self._stopping: set[asyncio.Task] = set()
+
+    @contextlib.asynccontextmanager
+    async def waiter(self, queue: BaseQueue, mq: MessageQueuePort) -> AsyncIterator[Optional[asyncio.Event]]:
+        """
+        Register a waiter for the messages of `queue`, subscribing with `mq` if required.
+
+        Yields an event that is set whenever a message is published to the queue, from now on.
+        Yields None if subscribing failed: the caller has to keep a pull request open instead.
+        """
+        watch = await self._watch(queue, mq)
+        if not watch:
+            yield None
+            return
+
+        waiter = asyncio.Event()
+        watch.waiters.add(waiter)
+        try:
+            yield waiter
+        finally:
+            watch.waiters.discard(waiter)
+            if not watch.waiters and not watch.idle_timer and self._watches.get(queue.message_subject) is watch:
+                watch.idle_timer = asyncio.get_running_loop().call_later(
+                    self.idle_timeout, self._expire, queue.message_subject
+                )
+
+    async def close(self) -> None:
+        watches, self._watches = self._watches, {}
+        for watch in watches.values():
+            await self._stop(watch)
+        if self._stopping:
+            await asyncio.wait(self._stopping)
+
+    async def _watch(self, queue: BaseQueue, mq: MessageQueuePort) -> Optional[_Watch]:
+        subject = queue.message_subject
+        watch = self._watches.get(subject)
+        if not watch or watch.mq.is_closed:
+            async with self._lock:
+                watch = self._watches.get(subject)
+                if watch and watch.mq.is_closed:
+                    logger.info("Connection watching for messages published to %r was closed.", subject)
+                    self._discard(subject)
+                    watch = None
+                if not watch:
+                    watch = _Watch(mq)
+                    try:
+                        watch.stop = await mq.watch_for_messages(queue, watch.notify)
+                    except Exception as exc:
+                        logger.warning("Failed to subscribe to messages published to %r: %s", subject, exc)
+                        return None
+                    self._watches[subject] = watch
+        if watch.idle_timer:
+            watch.idle_timer.cancel()
+            watch.idle_timer = None
+        return watch
+
+    def _expire(self, subject: str) -> None:
+        watch = self._watches.get(subject)
+        if watch and not watch.waiters:
+            self._discard(subject)
+
+    def _discard(self, subject: str) -> None:
+        """Stop and forget the watch of `subject`. Its remaining waiters are not woken up anymore."""
+        watch = self._watches.pop(subject)
+        task = asyncio.create_task(self._stop(watch))
+        self._stopping.add(task)
+        task.add_done_callback(self._stopping.discard)
+
+    @staticmethod
+    async def _stop(watch: _Watch) -> None:
+        if watch.idle_timer:
+            watch.idle_timer.cancel()
+            watch.idle_timer = None
+        try:
+            await watch.stop()
+        except Exception as exc:
+            logger.debug("Ignoring error while unsubscribing: %s", exc)
+
+
+@lru_cache(maxsize=1)
+def message_waiters() -> MessageWaiters:
+    return MessageWaiters()
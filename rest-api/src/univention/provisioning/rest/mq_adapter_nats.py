@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 from datetime import datetime
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 from nats.js.errors import NotFoundError
 
@@ -46,6 +46,10 @@ class NatsMessageQueue(MessageQueuePort):
         self.mq = None
         return False
 
+    @property
+    def is_closed(self) -> bool:
+        return self.mq is None or self.mq.is_closed
+
     async def add_message(self, queue: BaseQueue, message: Message) -> None:
         await self.mq.add_message(queue, message)
 
@@ -55,9 +59,36 @@ class NatsMessageQueue(MessageQueuePort):
         except NotFoundError as err:
             raise ProvisioningBackendError(str(err))
 
+    async def get_messages(
+        self, queue: BaseQueue, timeout: float, max_messages: int, pop: bool, after: int = 0
+    ) -> list[ProvisioningMessage]:
+        try:
+            return await self.mq.get_messages(queue, timeout, max_messages, pop, after)
+        except NotFoundError as err:
+            raise ProvisioningBackendError(str(err))
+
+    async def read_stream(
+        self, queue: BaseQueue, sequence_number: int, max_messages: int, pop: bool
+    ) -> list[ProvisioningMessage]:
+        try:
+            return await self.mq.read_stream(queue, sequence_number, max_messages, pop)
+        except NotFoundError as err:
+            raise ProvisioningBackendError(str(err))
+
+    async def watch_for_messages(
+        self, queue: BaseQueue, callback: Callable[[], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        return await self.mq.watch_for_messages(queue, callback)
+
+    async def get_num_ack_pending(self, queue: BaseQueue) -> int:
+        return await self.mq.get_num_ack_pending(queue)
+
     async def delete_message(self, queue: BaseQueue, seq_num: int):
         await self.mq.delete_message(queue, seq_num)
 
+    async def delete_messages(self, queue: BaseQueue, seq_nums: list[int]) -> dict[int, Optional[str]]:
+        return await self.mq.delete_messages(queue, seq_nums)
+
     async def create_queue(self, queue: BaseQueue):
         await self.mq.ensure_stream(queue)
 
@@ -76,6 +107,8 @@ class NatsMessageQueue(MessageQueuePort):
             publisher_name=PublisherName.consumer_registration,
             ts=datetime.now(),
             realms_topics=subscription.realms_topics,
+            filter=subscription.filter,
+            projection=subscription.projection,
             subscription_name=subscription.name,
         )
         await self.mq.add_message(PrefillQueue(), message)
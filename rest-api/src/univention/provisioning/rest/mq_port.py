@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import abc
-from typing import Optional, Self
+from typing import Awaitable, Callable, Optional, Self
 
 from univention.provisioning.backends.nats_mq import BaseQueue
 from univention.provisioning.models.message import Message, ProvisioningMessage
@@ -27,15 +27,58 @@ class MessageQueuePort(abc.ABC):
     @abc.abstractmethod
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> bool: ...
 
+    @property
+    @abc.abstractmethod
+    def is_closed(self) -> bool:
+        """Whether the connection was closed for good, e.g. after its reconnect attempts ran out."""
+
     @abc.abstractmethod
     async def add_message(self, queue: BaseQueue, message: Message) -> None: ...
 
     @abc.abstractmethod
     async def get_message(self, queue: BaseQueue, timeout: float, pop: bool) -> Optional[ProvisioningMessage]: ...
 
+    @abc.abstractmethod
+    async def get_messages(
+        self, queue: BaseQueue, timeout: float, max_messages: int, pop: bool, after: int = 0
+    ) -> list[ProvisioningMessage]:
+        """
+        Retrieve up to `max_messages` messages following sequence number `after`, in order.
+
+        The first message is returned even if it does not follow `after`: it tells that the queue is not empty.
+        """
+
+    @abc.abstractmethod
+    async def read_stream(
+        self, queue: BaseQueue, sequence_number: int, max_messages: int, pop: bool
+    ) -> list[ProvisioningMessage]:
+        """
+        Read up to `max_messages` messages following `sequence_number` directly from the stream, in order.
+
+        The consumer does not deliver them, so unacknowledged messages are not delivered again. Does not wait.
+        """
+
+    @abc.abstractmethod
+    async def watch_for_messages(
+        self, queue: BaseQueue, callback: Callable[[], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        """
+        Call `callback()` whenever a message is published to the queue, from now on.
+
+        :return: Async function that stops watching.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def get_num_ack_pending(self, queue: BaseQueue) -> int:
+        """Number of messages delivered by the queue's consumer that were not acknowledged yet."""
+
     @abc.abstractmethod
     async def delete_message(self, queue: BaseQueue, seq_num: int): ...
 
+    @abc.abstractmethod
+    async def delete_messages(self, queue: BaseQueue, seq_nums: list[int]) -> dict[int, Optional[str]]: ...
+
     @abc.abstractmethod
     async def create_queue(self, queue: BaseQueue): ...
 
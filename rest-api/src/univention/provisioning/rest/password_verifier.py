@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+import bcrypt
+import cachetools
+from passlib.context import CryptContext
+
+from .config import app_settings
+
+logger = logging.getLogger(__name__)
+password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Workaround for passlib bug https://github.com/pyca/bcrypt/issues/684
+# https://foss.heptapod.net/python-libs/passlib/-/issues/190
+if not hasattr(bcrypt, "__about__"):
+    bcrypt.__about__ = type("about", (object,), {"__version__": bcrypt.__version__})
+
+
+class PasswordVerifier:
+    """
+    Hashes and verifies subscription passwords without blocking the event loop.
+
+    bcrypt takes ~200ms per password and releases the GIL, so it runs in a pool of `workers` threads.
+    Successful verifications are remembered for `cache_ttl` seconds, at most `cache_size` of them (least recently used
+    are dropped first). The cache is keyed by an HMAC (with a random key per process) of the username, the password
+    and the stored hash: it holds no passwords, and entries become unreachable when the stored hash changes.
+    Concurrent verifications of the same credentials are done only once.
+    """
+
+    def __init__(self, workers: int = 4, cache_size: int = 1024, cache_ttl: float = 30.0):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-verifier")
+        self._secret = secrets.token_bytes(32)
+        # {cache key: username}
+        self._cache: cachetools.TTLCache[bytes, str] = cachetools.TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._in_flight: dict[bytes, asyncio.Future[tuple[bool, Optional[str]]]] = {}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, password_context.hash, password)
+
+    async def verify_and_update(self, username: str, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """
+        Verify `password` against `hashed_password`, like `CryptContext.verify_and_update()`.
+
+        :returns: whether the password is valid, and a new hash to store, if the stored one is deprecated.
+        """
+        key = self._cache_key(username, password, hashed_password)
+        if key in self._cache:
+            return True, None
+        if key in self._in_flight:
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, password_context.verify_and_update, password, hashed_password
+        )
+        self._in_flight[key] = future
+        try:
+            valid, new_hash = await asyncio.shield(future)
+        finally:
+            self._in_flight.pop(key, None)
+        if valid and not new_hash:
+            self._cache[key] = username
+        return valid, new_hash
+
+    def invalidate(self, username: str) -> None:
+        """Forget the successful verifications of `username`."""
+        for key in [key for key, name in self._cache.items() if name == username]:
+            self._cache.pop(key, None)
+
+    def _cache_key(self, username: str, password: str, hashed_password: str) -> bytes:
+        message = b"\0".join(value.encode("utf-8") for value in (username, password, hashed_password or ""))
+        return hmac.digest(self._secret, message, hashlib.sha256)
+
+
+@lru_cache(maxsize=1)
+def password_verifier() -> PasswordVerifier:
+    settings = app_settings()
+    return PasswordVerifier(
+        workers=settings.password_hash_workers,
+        cache_size=settings.password_cache_size,
+        cache_ttl=settings.password_cache_ttl,
+    )
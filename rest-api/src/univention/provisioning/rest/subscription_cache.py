@@ -0,0 +1,148 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import logging
+from collections import Counter
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional
+
+from univention.provisioning.models.subscription import FillQueueStatus, Subscription
+
+from .subscriptions_db_port import SubscriptionsDBPort
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before watching the key-value store again, after watching failed.
+WATCH_RETRY_DELAY = 1.0
+
+
+class SubscriptionCache:
+    """
+    Process-wide cache of the subscriptions and their password hashes, kept up to date by watching the key-value store.
+
+    While the watch is not running, e.g. before `start()` or while reconnecting, lookups go to the key-value store.
+    Requests waiting for a prefill to finish are woken up as soon as the status of the subscription changes.
+    """
+
+    def __init__(self):
+        self._subscriptions: dict[str, Subscription] = {}
+        self._hashed_passwords: dict[str, str] = {}
+        # Counts the changes of each password hash, so that a hash loaded during a change is not cached.
+        self._credential_changes: Counter[str] = Counter()
+        # Subscriptions whose prefill queue was delivered completely.
+        self._prefill_delivered: set[str] = set()
+        self._changed = asyncio.Condition()
+        self._synced = False
+        self._watch: Optional[asyncio.Task] = None
+
+    @property
+    def synced(self) -> bool:
+        """Whether the cache contains all subscriptions and is kept up to date."""
+        return self._synced
+
+    async def start(self, connect: Callable[[], Awaitable[SubscriptionsDBPort]]) -> None:
+        """Start watching the key-value store, connected to by `connect()`, in the background."""
+        if not self._watch:
+            self._watch = asyncio.create_task(self._run(connect))
+
+    async def close(self) -> None:
+        if self._watch:
+            self._watch.cancel()
+            await asyncio.wait([self._watch])
+            self._watch = None
+
+    async def _run(self, connect: Callable[[], Awaitable[SubscriptionsDBPort]]) -> None:
+        while True:
+            stop_watching_credentials = None
+            try:
+                subscriptions_db = await connect()
+                stop_watching_credentials = await subscriptions_db.watch_for_credential_changes(
+                    self.credentials_changed
+                )
+                await subscriptions_db.watch_for_subscription_changes(self.subscription_changed, self.initialized)
+            except Exception as exc:
+                logger.error("Watching the subscriptions failed, retrying in %.0fs: %s", WATCH_RETRY_DELAY, exc)
+            finally:
+                await self._reset()
+                if stop_watching_credentials:
+                    try:
+                        await stop_watching_credentials()
+                    except Exception as exc:
+                        logger.warning("Failed to stop watching the credentials: %s", exc)
+            await asyncio.sleep(WATCH_RETRY_DELAY)
+
+    async def _reset(self) -> None:
+        self._synced = False
+        self._subscriptions.clear()
+        self._hashed_passwords.clear()
+        self._prefill_delivered.clear()
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def initialized(self) -> None:
+        logger.info("Cached %d subscriptions.", len(self._subscriptions))
+        self._synced = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def subscription_changed(self, name: str, value: Optional[bytes]) -> None:
+        if value:
+            subscription = Subscription.model_validate_json(value)
+            self._subscriptions[name] = subscription
+            if subscription.prefill_queue_status != FillQueueStatus.done:
+                self._prefill_delivered.discard(name)
+        else:
+            self.forget(name)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def credentials_changed(self, name: str, revision: int) -> None:
+        self._hashed_passwords.pop(name, None)
+        self._credential_changes[name] += 1
+
+    def forget(self, name: str) -> None:
+        """Drop everything known about the subscription `name`, e.g. after it was deleted."""
+        self._subscriptions.pop(name, None)
+        self._hashed_passwords.pop(name, None)
+        self._prefill_delivered.discard(name)
+
+    async def load_subscription(self, name: str, load: Callable[[str], Awaitable[Subscription]]) -> Subscription:
+        """Return the subscription `name` from the cache or, if it is not cached, as returned by `load(name)`."""
+        if self._synced and name in self._subscriptions:
+            # A copy, the caller may change it.
+            return self._subscriptions[name].model_copy()
+        return await load(name)
+
+    async def load_hashed_password(self, name: str, load: Callable[[str], Awaitable[str]]) -> str:
+        """Return the password hash of `name` from the cache or as returned by `load(name)`, caching it."""
+        if self._synced and name in self._hashed_passwords:
+            return self._hashed_passwords[name]
+        changes = self._credential_changes[name]
+        hashed_password = await load(name)
+        if self._synced and hashed_password and changes == self._credential_changes[name]:
+            self._hashed_passwords[name] = hashed_password
+        return hashed_password
+
+    async def wait_for_prefill(self, name: str) -> None:
+        """Wait until the prefill of the subscription `name` is done, or the cache is not kept up to date anymore."""
+
+        def done() -> bool:
+            subscription = self._subscriptions.get(name)
+            return not self._synced or (
+                subscription is not None and subscription.prefill_queue_status == FillQueueStatus.done
+            )
+
+        async with self._changed:
+            await self._changed.wait_for(done)
+
+    def is_prefill_delivered(self, name: str) -> bool:
+        return name in self._prefill_delivered
+
+    def prefill_delivered(self, name: str) -> None:
+        self._prefill_delivered.add(name)
+
+
+@lru_cache(maxsize=1)
+def subscription_cache() -> SubscriptionCache:
+    return SubscriptionCache()
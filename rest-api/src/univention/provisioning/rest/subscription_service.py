@@ -3,56 +3,64 @@
 
 import asyncio
 import logging
-from typing import Optional
+from typing import Optional, Union
 
-import bcrypt
-import cachetools.func
 from fastapi import HTTPException, status
-from fastapi.security import HTTPBasicCredentials
-from passlib.context import CryptContext
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasicCredentials
 
-from univention.provisioning.models.subscription import FillQueueStatus, NewSubscription, Subscription
+from univention.provisioning.models.subscription import AccessToken, FillQueueStatus, NewSubscription, Subscription
 
 from ..backends.nats_mq import ConsumerQueue
+from .access_tokens import AccessTokenSigner, access_token_signer
 from .mq_port import MessageQueuePort
+from .password_verifier import PasswordVerifier, password_verifier
+from .subscription_cache import SubscriptionCache, subscription_cache
 from .subscriptions_db_port import NoSubscription, SubscriptionsDBPort
 
 logger = logging.getLogger(__name__)
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-PASSWORD_CACHE_TTL = 30.0
 REALM_TOPIC_TEMPLATE = "{realm}:{topic}"
 
 
-# Workaround for passlib bug https://github.com/pyca/bcrypt/issues/684
-# https://foss.heptapod.net/python-libs/passlib/-/issues/190
-if not hasattr(bcrypt, "__about__"):
-    bcrypt.__about__ = type("about", (object,), {"__version__": bcrypt.__version__})
-
-
-@cachetools.func.ttl_cache(maxsize=32, ttl=PASSWORD_CACHE_TTL)
-def verify_and_update_password(
-    cleartext_pw: str, hashed_pw: str, subscription_name: Optional[str] = None
-) -> tuple[bool, str | None]:
-    """
-    Caching wrapper around CryptContext.verify_and_update()
-
-    Caches all hits and exceptions!
-    But the caller (SubscriptionService.authenticate_user()) will delete negative hits, so we cache only positive hits.
-    """
-    return password_context.verify_and_update(cleartext_pw, hashed_pw)  # takes ~200ms
-
-
 class SubscriptionService:
-    def __init__(self, subscriptions_db: SubscriptionsDBPort, mq: MessageQueuePort):
+    def __init__(
+        self,
+        subscriptions_db: SubscriptionsDBPort,
+        mq: MessageQueuePort,
+        passwords: Optional[PasswordVerifier] = None,
+        tokens: Optional[AccessTokenSigner] = None,
+        cache: Optional[SubscriptionCache] = None,
+    ):
         self.sub_db = subscriptions_db
         self.mq = mq
+        self._passwords = passwords
+        self._tokens = tokens
+        self._cache = cache
+
+    @property
+    def passwords(self) -> PasswordVerifier:
+        if not self._passwords:
+            self._passwords = password_verifier()
+        return self._passwords
+
+    @property
+    def tokens(self) -> Optional[AccessTokenSigner]:
+        """None, if access tokens are disabled."""
+        if not self._tokens:
+            self._tokens = access_token_signer()
+        return self._tokens
+
+    @property
+    def cache(self) -> SubscriptionCache:
+        if not self._cache:
+            self._cache = subscription_cache()
+        return self._cache
 
     async def get_subscription(self, name: str) -> Subscription:
         """
         Get information about a registered subscription.
         """
         try:
-            return await self.sub_db.load_subscription(name)
+            return await self.cache.load_subscription(name, self.sub_db.load_subscription)
         except NoSubscription as exc:
             raise ValueError(str(exc))
 
@@ -63,9 +71,8 @@ class SubscriptionService:
         names = await self.sub_db.load_subscription_names()
         return [await self.get_subscription(name) for name in names]
 
-    @staticmethod
-    def hash_password(password: str) -> str:
-        return password_context.hash(password)
+    async def hash_password(self, password: str) -> str:
+        return await self.passwords.hash(password)
 
     async def is_subscriptions_matching(self, new_sub: NewSubscription, existing_sub: Subscription) -> bool:
         """
@@ -78,8 +85,11 @@ class SubscriptionService:
         if new_sub.realms_topics != existing_sub.realms_topics:
             return False
 
+        if new_sub.filter != existing_sub.filter or new_sub.projection != existing_sub.projection:
+            return False
+
         hashed_password = await self.sub_db.load_hashed_password(new_sub.name)
-        valid = password_context.verify(new_sub.password, hashed_password)
+        valid, _ = await self.passwords.verify_and_update(new_sub.name, new_sub.password, hashed_password)
         if not valid:
             return False
 
@@ -103,12 +113,15 @@ class SubscriptionService:
             return False
         except NoSubscription:
             logger.info(
-                "Registering new subscription (name: %r realms_topics: %r request_prefill: %r).",
+                "Registering new subscription "
+                "(name: %r realms_topics: %r request_prefill: %r filter: %r projection: %r).",
                 new_sub.name,
                 new_sub.realms_topics,
                 new_sub.request_prefill,
+                new_sub.filter,
+                new_sub.projection,
             )
-            encrypted_password = self.hash_password(new_sub.password)
+            encrypted_password = await self.hash_password(new_sub.password)
             await self.sub_db.store_hashed_password(new_sub.name, encrypted_password)
             await self.prepare_and_store_subscription_info(new_sub)
             logger.info("New subscription was registered: %r", new_sub.name)
@@ -125,6 +138,8 @@ class SubscriptionService:
             name=new_sub.name,
             realms_topics=new_sub.realms_topics,
             request_prefill=new_sub.request_prefill,
+            filter=new_sub.filter,
+            projection=new_sub.projection,
             prefill_queue_status=prefill_queue_status,
         )
 
@@ -190,6 +205,8 @@ class SubscriptionService:
         """
         _ = await self.get_subscription(name)
         await self.sub_db.delete_subscription(name)
+        self.passwords.invalidate(name)
+        self.cache.forget(name)
         await self.mq.delete_queue(ConsumerQueue(name))
 
     @staticmethod
@@ -200,24 +217,70 @@ class SubscriptionService:
             headers={"WWW-Authenticate": "Basic"},
         )
 
-    async def authenticate_user(self, credentials: HTTPBasicCredentials, subscription_name: Optional[str] = None):
+    async def authenticate_user(
+        self,
+        credentials: Union[HTTPBasicCredentials, HTTPAuthorizationCredentials],
+        subscription_name: Optional[str] = None,
+    ):
+        """
+        Authenticate a subscription with its password or a bearer token.
+
+        Bearer tokens are verified without a password check, against the cached password hash.
+        """
+        if isinstance(credentials, HTTPAuthorizationCredentials):
+            verified = self.tokens.verify(credentials.credentials) if self.tokens else None
+            if not verified:
+                self.handle_authentication_error("Invalid or expired token")
+            username, fingerprint = verified
+            if subscription_name and subscription_name != username:
+                self.handle_authentication_error("You do not have access to this data")
+            # The subscription was deleted, or its password was changed after the token was issued.
+            hashed_password = await self.cache.load_hashed_password(username, self.sub_db.load_hashed_password)
+            if not hashed_password or not self.tokens.is_current(fingerprint, hashed_password):
+                self.handle_authentication_error("Invalid or expired token")
+            return
+
         if subscription_name and subscription_name != credentials.username:
             self.handle_authentication_error("You do not have access to this data")
+        await self._authenticate_password(credentials)
 
-        hashed_password = await self.sub_db.load_hashed_password(credentials.username)
-        cached_func_args = (credentials.password, hashed_password, subscription_name)
-        valid, new_hash = verify_and_update_password(*cached_func_args)
-        if valid:
-            if new_hash:
-                logger.info("Storing new password hash for user %r.", credentials.username)
-                await self.sub_db.store_hashed_password(credentials.username, new_hash)
-        else:
-            # cache only positive authentication attempts -> remove cache entry for invalid password
-            cache_key = verify_and_update_password.cache_key(*cached_func_args)
-            verify_and_update_password.cache.pop(cache_key, None)
+    async def _authenticate_password(self, credentials: HTTPBasicCredentials) -> str:
+        """Verify the password of a subscription, return the current hash of the password."""
+        hashed_password = await self.cache.load_hashed_password(credentials.username, self.sub_db.load_hashed_password)
+        valid, new_hash = await self.passwords.verify_and_update(
+            credentials.username, credentials.password, hashed_password
+        )
+        if not valid:
             self.handle_authentication_error("Incorrect username or password")
+        if new_hash:
+            logger.info("Storing new password hash for user %r.", credentials.username)
+            await self.sub_db.store_hashed_password(credentials.username, new_hash)
+        return new_hash or hashed_password
+
+    async def issue_access_token(self, credentials: HTTPBasicCredentials, subscription_name: str) -> AccessToken:
+        """
+        Authenticate the subscription with its password and issue a short-lived bearer token for it.
+
+        The token is valid until it expires, the subscription is deleted, or its password is changed.
+        """
+        if not self.tokens:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Access tokens are disabled.")
+        if subscription_name != credentials.username:
+            self.handle_authentication_error("You do not have access to this data")
+        hashed_password = await self._authenticate_password(credentials)
+        return AccessToken(
+            access_token=self.tokens.issue(subscription_name, hashed_password), expires_in=self.tokens.ttl
+        )
 
     async def check_subscription_queue_status(self, subscription_name: str, timeout: float) -> FillQueueStatus:
+        """Wait up to `timeout` seconds for the prefill of the subscription to be done, return its status."""
+        if self.cache.synced:
+            try:
+                await asyncio.wait_for(self.cache.wait_for_prefill(subscription_name), timeout)
+            except TimeoutError:
+                pass
+            return await self.get_subscription_queue_status(subscription_name)
+
         loop = asyncio.get_event_loop()
         end_time = loop.time() + timeout
         while loop.time() < end_time:
@@ -6,16 +6,29 @@ import time
 from typing import Annotated, Optional
 
 import fastapi
-from fastapi import Depends, HTTPException, Response
-
-from univention.provisioning.models.message import MessageProcessingStatusReport, ProvisioningMessage
-from univention.provisioning.models.subscription import FillQueueStatusReport, NewSubscription, Subscription
+from fastapi import Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect, WebSocketException
+from pydantic import ValidationError
+
+from univention.provisioning.models.message import (
+    MessageProcessingStatusReport,
+    MessageProcessingStatusResult,
+    MessagesProcessingStatusReport,
+    ProvisioningMessage,
+)
+from univention.provisioning.models.subscription import (
+    AccessToken,
+    FillQueueStatusReport,
+    NewSubscription,
+    Subscription,
+)
 
 from .dependencies import (
     AppSettingsDep,
     HttpBasicDep,
     KVDependency,
     MQDependency,
+    SubscriptionCredentialsDep,
+    WebSocketSubscriptionCredentialsDep,
     authenticate_admin,
     authenticate_prefill,
 )
@@ -26,6 +39,9 @@ from .subscription_service import SubscriptionService
 router = fastapi.APIRouter(prefix="/v1/subscriptions", tags=["subscriptions"])
 logger = logging.getLogger(__name__)
 
+# Upper limit for the number of messages returned by a single request.
+MAX_MESSAGES_PER_REQUEST = 1000
+
 
 @router.get("", status_code=fastapi.status.HTTP_200_OK, dependencies=[Depends(authenticate_admin)])
 async def get_subscriptions(kv: KVDependency, mq: MQDependency) -> list[Subscription]:
@@ -36,7 +52,9 @@ async def get_subscriptions(kv: KVDependency, mq: MQDependency) -> list[Subscrip
 
 
 @router.get("/{name}", status_code=fastapi.status.HTTP_200_OK)
-async def get_subscription(name: str, credentials: HttpBasicDep, kv: KVDependency, mq: MQDependency) -> Subscription:
+async def get_subscription(
+    name: str, credentials: SubscriptionCredentialsDep, kv: KVDependency, mq: MQDependency
+) -> Subscription:
     """Return information about a subscription."""
 
     service = SubscriptionService(subscriptions_db=kv, mq=mq)
@@ -84,6 +102,18 @@ async def create_subscription(subscription: NewSubscription, kv: KVDependency, m
         await mq.request_prefill(subscription)
 
 
+@router.post("/{name}/token", status_code=fastapi.status.HTTP_200_OK)
+async def create_access_token(name: str, credentials: HttpBasicDep, kv: KVDependency, mq: MQDependency) -> AccessToken:
+    """
+    Exchange the credentials of a subscription for a short-lived bearer token.
+
+    The token can be used instead of the credentials to access the subscription and its messages.
+    """
+
+    service = SubscriptionService(subscriptions_db=kv, mq=mq)
+    return await service.issue_access_token(credentials, name)
+
+
 @router.patch("/{name}/prefill", status_code=fastapi.status.HTTP_200_OK)
 async def update_subscription_prefill_status(
     name: str,
@@ -104,7 +134,12 @@ async def update_subscription_prefill_status(
 
 @router.get("/{name}/messages/next", status_code=fastapi.status.HTTP_200_OK)
 async def get_next_message(
-    name: str, kv: KVDependency, mq: MQDependency, credentials: HttpBasicDep, timeout: float = 5, pop: bool = False
+    name: str,
+    kv: KVDependency,
+    mq: MQDependency,
+    credentials: SubscriptionCredentialsDep,
+    timeout: float = 5,
+    pop: bool = False,
 ) -> Optional[ProvisioningMessage]:
     """Return the next pending message for the given subscription."""
 
@@ -134,6 +169,102 @@ async def get_next_message(
     return msg
 
 
+@router.get("/{name}/messages", status_code=fastapi.status.HTTP_200_OK)
+async def get_messages(
+    name: str,
+    kv: KVDependency,
+    mq: MQDependency,
+    credentials: SubscriptionCredentialsDep,
+    max_messages: Annotated[int, Query(alias="max", ge=1, le=MAX_MESSAGES_PER_REQUEST)] = 100,
+    timeout: float = 5,
+    pop: bool = False,
+) -> list[ProvisioningMessage]:
+    """
+    Return up to `max` pending messages for the given subscription, in order.
+
+    Waits up to `timeout` seconds for the first message and returns the messages available at that moment.
+    """
+
+    sub_service = SubscriptionService(subscriptions_db=kv, mq=mq)
+    await sub_service.authenticate_user(credentials, name)
+
+    msg_service = MessageService(subscriptions_db=kv, mq=mq)
+    try:
+        messages = await msg_service.get_messages(name, timeout, max_messages, pop)
+    except ProvisioningBackendError as exc:
+        logger.error("Inconsistent message queue state in NATS: %s", exc)
+        raise fastapi.HTTPException(
+            fastapi.status.HTTP_500_INTERNAL_SERVER_ERROR, "Inconsistent message queue state in NATS"
+        )
+    logger.debug("Got %d messages for %r.", len(messages), name)
+    return messages
+
+
+@router.websocket("/{name}/messages/stream")
+async def stream_messages(
+    websocket: WebSocket,
+    name: str,
+    kv: KVDependency,
+    mq: MQDependency,
+    credentials: WebSocketSubscriptionCredentialsDep,
+    window: Annotated[int, Query(ge=1, le=MAX_MESSAGES_PER_REQUEST)] = 10,
+):
+    """
+    Push the pending messages of the given subscription over a WebSocket, as they arrive.
+
+    Each message is sent as a JSON text frame. At most `window` messages are unacknowledged at any time.
+    Messages are acknowledged with text frames in the format of the bulk status report.
+    """
+
+    sub_service = SubscriptionService(subscriptions_db=kv, mq=mq)
+    try:
+        await sub_service.authenticate_user(credentials, name)
+    except HTTPException as exc:
+        raise WebSocketException(code=fastapi.status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+    await websocket.accept()
+    logger.info("Streaming messages to %r.", name)
+
+    async def send(message: ProvisioningMessage) -> None:
+        await websocket.send_text(message.model_dump_json())
+
+    async def receive_acknowledgements() -> list[int]:
+        report = MessagesProcessingStatusReport.model_validate_json(await websocket.receive_text())
+        return report.all_sequence_numbers()
+
+    msg_service = MessageService(subscriptions_db=kv, mq=mq)
+    try:
+        await msg_service.stream_messages(name, window, send, receive_acknowledgements)
+    except* WebSocketDisconnect:
+        logger.info("Subscriber %r closed the message stream.", name)
+    except* ValidationError as exc:
+        logger.warning("Closing the message stream of %r after an invalid status report: %s", name, exc.exceptions[0])
+        await websocket.close(code=fastapi.status.WS_1007_INVALID_FRAME_PAYLOAD_DATA)
+    except* ProvisioningBackendError as exc:
+        logger.error("Inconsistent message queue state in NATS: %s", exc.exceptions[0])
+        await websocket.close(code=fastapi.status.WS_1011_INTERNAL_ERROR)
+
+
+@router.patch("/{name}/messages/status", status_code=fastapi.status.HTTP_200_OK)
+async def update_messages_status(
+    name: str,
+    report: MessagesProcessingStatusReport,
+    kv: KVDependency,
+    mq: MQDependency,
+    credentials: SubscriptionCredentialsDep,
+) -> list[MessageProcessingStatusResult]:
+    """Report on the processing of multiple messages, given as a list and/or a range of sequence numbers."""
+
+    sub_service = SubscriptionService(subscriptions_db=kv, mq=mq)
+    await sub_service.authenticate_user(credentials, name)
+
+    msg_service = MessageService(subscriptions_db=kv, mq=mq)
+    results = await msg_service.update_messages_status(name, report.all_sequence_numbers(), report.status)
+    failed = [result.sequence_number for result in results if not result.ok]
+    if failed:
+        logger.debug("Failed to post the status of messages %r.", failed)
+    return results
+
+
 @router.patch("/{name}/messages/{seq_num}/status", status_code=fastapi.status.HTTP_200_OK)
 async def update_message_status(
     name: str,
@@ -141,7 +272,7 @@ async def update_message_status(
     report: MessageProcessingStatusReport,
     kv: KVDependency,
     mq: MQDependency,
-    credentials: HttpBasicDep,
+    credentials: SubscriptionCredentialsDep,
 ):
     """Report on the processing of the given message."""
 
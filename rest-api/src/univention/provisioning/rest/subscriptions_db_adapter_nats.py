@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import json
-from typing import Optional, Union
+from typing import Awaitable, Callable, Optional, Union
 
 from univention.provisioning.backends import key_value_store
 from univention.provisioning.backends.key_value_db import KeyValueDB
@@ -41,6 +41,10 @@ class NatsSubscriptionsDB(SubscriptionsDBPort):
         self.kv = None
         return False
 
+    @property
+    def is_closed(self) -> bool:
+        return self.kv is None or self.kv.is_closed
+
     async def get_dict_value(self, name: str, bucket: BucketName) -> Optional[dict]:
         result = await self.kv.get_value(name, bucket)
         return json.loads(result) if result else None
@@ -86,4 +90,18 @@ class NatsSubscriptionsDB(SubscriptionsDBPort):
         await self.put_value(name, password, BucketName.credentials)
 
     async def store_subscription(self, name: str, subscription: Subscription) -> None:
-        await self.put_value(name, subscription.model_dump(), BucketName.subscriptions)
+        # Subscriptions without a filter or projection are stored like before those existed.
+        exclude = {field for field in ("filter", "projection") if getattr(subscription, field) is None}
+        await self.put_value(name, subscription.model_dump(exclude=exclude), BucketName.subscriptions)
+
+    async def watch_for_subscription_changes(
+        self,
+        callback: Callable[[str, Optional[bytes]], Awaitable[None]],
+        initialized: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        await self.kv.watch_for_subscription_changes(callback, initialized)
+
+    async def watch_for_credential_changes(
+        self, callback: Callable[[str, int], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        return await self.kv.watch_for_changes(BucketName.credentials, callback)
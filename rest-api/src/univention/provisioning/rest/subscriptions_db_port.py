@@ -2,7 +2,7 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import abc
-from typing import Optional, Self, Union
+from typing import Awaitable, Callable, Optional, Self, Union
 
 from univention.provisioning.models.constants import BucketName
 from univention.provisioning.models.subscription import Subscription
@@ -70,3 +70,27 @@ class SubscriptionsDBPort(abc.ABC):
 
     @abc.abstractmethod
     async def store_subscription(self, name: str, subscription: Subscription) -> None: ...
+
+    @abc.abstractmethod
+    async def watch_for_subscription_changes(
+        self,
+        callback: Callable[[str, Optional[bytes]], Awaitable[None]],
+        initialized: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        """
+        Call `callback(name, value)` for all subscriptions, then `initialized()`, then for every change, forever.
+
+        `value` is the JSON of the subscription, None if it was deleted.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def watch_for_credential_changes(
+        self, callback: Callable[[str, int], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        """
+        Call `callback(name, revision)` for every change of a password hash from now on.
+
+        :return: Async function that stops watching.
+        """
+        ...
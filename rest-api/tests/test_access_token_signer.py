@@ -0,0 +1,37 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+from unittest.mock import patch
+
+from univention.provisioning.rest.access_tokens import AccessTokenSigner
+
+
+def test_issue_and_verify():
+    signer = AccessTokenSigner(b"secret", ttl=60)
+
+    name, fingerprint = signer.verify(signer.issue("sub-ü.1", "hash"))
+
+    assert name == "sub-ü.1"
+    assert signer.is_current(fingerprint, "hash")
+    assert not signer.is_current(fingerprint, "new-hash")
+
+
+def test_expired_token():
+    signer = AccessTokenSigner(b"secret", ttl=60)
+    token = signer.issue("sub", "hash")
+
+    with patch("univention.provisioning.rest.access_tokens.time.time", return_value=10**10):
+        assert signer.verify(token) is None
+
+
+def test_invalid_tokens():
+    signer = AccessTokenSigner(b"secret", ttl=60)
+    name, expiry, fingerprint, signature = signer.issue("sub", "hash").split(".")
+
+    assert AccessTokenSigner(b"other-secret", ttl=60).verify(signer.issue("sub", "hash")) is None
+    assert signer.verify(f"{name}.{int(expiry) + 3600}.{fingerprint}.{signature}") is None
+    assert signer.verify(f"{signer.issue('other', 'hash').split('.')[0]}.{expiry}.{fingerprint}.{signature}") is None
+    other_fingerprint = signer.credentials_fingerprint("other-hash")
+    assert signer.verify(f"{name}.{expiry}.{other_fingerprint}.{signature}") is None
+    assert signer.verify("") is None
+    assert signer.verify("garbage") is None
@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from univention.provisioning.rest import connection_pool
+from univention.provisioning.rest.connection_pool import NatsConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, settings):
+        self.settings = settings
+        self.is_closed = True
+        self.__aenter__ = AsyncMock(side_effect=self._open)
+        self.__aexit__ = AsyncMock(side_effect=self._close)
+
+    async def _open(self):
+        self.is_closed = False
+        return self
+
+    async def _close(self, *args):
+        self.is_closed = True
+        return False
+
+
+@pytest.fixture
+def pool() -> NatsConnectionPool:
+    with (
+        patch.object(connection_pool, "NatsMessageQueue", FakeConnection),
+        patch.object(connection_pool, "NatsSubscriptionsDB", FakeConnection),
+    ):
+        yield NatsConnectionPool(settings=object(), size=2)
+
+
+@pytest.mark.anyio
+class TestNatsConnectionPool:
+    async def test_connect_opens_connections_once(self, pool: NatsConnectionPool):
+        await pool.connect()
+        await pool.connect()
+
+        assert len(pool._mqs) == 2
+        assert len(pool._kvs) == 2
+        for connection in [*pool._mqs, *pool._kvs]:
+            connection.__aenter__.assert_called_once_with()
+
+    async def test_connections_are_reused_round_robin(self, pool: NatsConnectionPool):
+        await pool.connect()
+
+        mqs = [await pool.message_queue() for _ in range(4)]
+        kvs = [await pool.subscriptions_db() for _ in range(4)]
+
+        assert mqs == [pool._mqs[0], pool._mqs[1], pool._mqs[0], pool._mqs[1]]
+        assert kvs == [pool._kvs[0], pool._kvs[1], pool._kvs[0], pool._kvs[1]]
+
+    async def test_connect_lazily(self, pool: NatsConnectionPool):
+        mq = await pool.message_queue()
+
+        assert mq is pool._mqs[0]
+        assert not mq.is_closed
+
+    async def test_closed_connection_is_replaced(self, pool: NatsConnectionPool):
+        await pool.connect()
+        closed = pool._mqs[0]
+        closed.is_closed = True
+
+        mq = await pool.message_queue()
+
+        assert mq is not closed
+        assert mq is pool._mqs[0]
+        assert not mq.is_closed
+
+    async def test_close(self, pool: NatsConnectionPool):
+        await pool.connect()
+        connections = [*pool._mqs, *pool._kvs]
+
+        await pool.close()
+
+        assert not pool._mqs
+        assert not pool._kvs
+        for connection in connections:
+            connection.__aexit__.assert_called_once_with(None, None, None)
@@ -1,16 +1,19 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
+import asyncio
 from unittest.mock import AsyncMock, call
 
 import pytest
-from test_helpers.mock_data import MESSAGE, SUBSCRIPTION_NAME
+from test_helpers.mock_data import MESSAGE, PROVISIONING_MESSAGE, SUBSCRIPTION_NAME
 
 from univention.provisioning.backends.nats_mq import ConsumerQueue, IncomingQueue, PrefillConsumerQueue
 from univention.provisioning.models.message import MessageProcessingStatus
 from univention.provisioning.models.subscription import FillQueueStatus
-from univention.provisioning.rest.message_service import MessageService
+from univention.provisioning.rest.message_service import PULL_TIMEOUT, MessageService
+from univention.provisioning.rest.message_waiters import MessageWaiters
 from univention.provisioning.rest.mq_adapter_nats import NatsMessageQueue
+from univention.provisioning.rest.subscription_cache import SubscriptionCache
 
 MESSAGE_PROCESSING_STATUS = MessageProcessingStatus.ok
 MESSAGE_PROCESSING_SEQ_ID = 1
@@ -18,9 +21,11 @@ MESSAGE_PROCESSING_SEQ_ID = 1
 
 @pytest.fixture
 def message_service() -> MessageService:
-    ms = MessageService(subscriptions_db=AsyncMock(), mq=AsyncMock())
-    ms._subscription_prefill_done.clear()
-    return ms
+    mq = AsyncMock()
+    mq.is_closed = False
+    mq.watch_for_messages = AsyncMock(return_value=AsyncMock())
+    mq.get_num_ack_pending = AsyncMock(return_value=0)
+    return MessageService(subscriptions_db=AsyncMock(), mq=mq, cache=SubscriptionCache(), waiters=MessageWaiters())
 
 
 @pytest.mark.anyio
@@ -49,14 +54,128 @@ class TestMessageService:
     async def test_get_next_message_from_main_subject(self, message_service: MessageService):
         message_service.sub_service.get_subscription_queue_status = AsyncMock(return_value=FillQueueStatus.done)
         message_service.mq.get_message = AsyncMock(return_value=MESSAGE)
-        message_service._subscription_prefill_done[SUBSCRIPTION_NAME] = True
+        message_service.sub_service.cache.prefill_delivered(SUBSCRIPTION_NAME)
 
         result = await message_service.get_next_message(SUBSCRIPTION_NAME, timeout=5, pop=True)
 
         message_service.sub_service.get_subscription_queue_status.assert_not_called()
-        message_service.mq.get_message.assert_has_calls([call(ConsumerQueue(SUBSCRIPTION_NAME), 5, True)])
+        message_service.mq.get_message.assert_has_calls([call(ConsumerQueue(SUBSCRIPTION_NAME), PULL_TIMEOUT, True)])
         assert result == MESSAGE
 
+    async def test_get_next_message_waits_for_published_message(self, message_service: MessageService):
+        message_service.sub_service.cache.prefill_delivered(SUBSCRIPTION_NAME)
+        message_service.mq.get_message = AsyncMock(side_effect=[None, MESSAGE])
+
+        request = asyncio.create_task(message_service.get_next_message(SUBSCRIPTION_NAME, timeout=5, pop=True))
+        while not message_service.mq.get_message.called:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        assert not request.done()
+        published = message_service.mq.watch_for_messages.call_args.args[1]
+        await published()
+
+        assert await asyncio.wait_for(request, 1) == MESSAGE
+        message_service.mq.watch_for_messages.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME), published)
+        assert message_service.mq.get_message.call_count == 2
+
+    async def test_get_next_message_checks_for_redeliveries_after_ack_wait(self, message_service: MessageService):
+        message_service.sub_service.cache.prefill_delivered(SUBSCRIPTION_NAME)
+        message_service.mq.get_message = AsyncMock(side_effect=[None, MESSAGE])
+        message_service.mq.get_num_ack_pending.return_value = 1
+
+        # No message is published: the unacknowledged message is delivered again after the consumer's ack_wait.
+        result = await asyncio.wait_for(
+            message_service.get_next_message(SUBSCRIPTION_NAME, timeout=30, pop=True),
+            ConsumerQueue.ack_wait + 1,
+        )
+
+        assert result == MESSAGE
+
+    async def test_get_next_message_idle_queue_is_pulled_once(self, message_service: MessageService):
+        message_service.sub_service.cache.prefill_delivered(SUBSCRIPTION_NAME)
+        message_service.mq.get_message = AsyncMock(return_value=None)
+
+        result = await message_service.get_next_message(
+            SUBSCRIPTION_NAME, timeout=ConsumerQueue.ack_wait * 2.5, pop=True
+        )
+
+        assert result is None
+        message_service.mq.get_message.assert_called_once()
+        message_service.mq.get_num_ack_pending.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME))
+
+    async def test_get_next_message_without_waiters(self, message_service: MessageService):
+        message_service.sub_service.cache.prefill_delivered(SUBSCRIPTION_NAME)
+        message_service.mq.watch_for_messages = AsyncMock(side_effect=ConnectionError())
+        message_service.mq.get_message = AsyncMock(return_value=None)
+
+        assert await message_service.get_next_message(SUBSCRIPTION_NAME, timeout=0.2, pop=True) is None
+
+        message_service.mq.get_message.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME), 0.2, True)
+
+    async def test_get_messages_from_prefill_subject(self, message_service: MessageService):
+        message_service.sub_service.get_subscription_queue_status = AsyncMock(return_value=FillQueueStatus.done)
+        message_service.mq.get_messages = AsyncMock(return_value=[PROVISIONING_MESSAGE, PROVISIONING_MESSAGE])
+
+        result = await message_service.get_messages(SUBSCRIPTION_NAME, timeout=5, max_messages=10, pop=False)
+
+        message_service.mq.get_messages.assert_called_once_with(
+            PrefillConsumerQueue(SUBSCRIPTION_NAME), 5, 10, False, 0
+        )
+        assert result == [PROVISIONING_MESSAGE, PROVISIONING_MESSAGE]
+        assert not message_service.sub_service.cache.is_prefill_delivered(SUBSCRIPTION_NAME)
+
+    async def test_get_messages_switches_to_main_subject(self, message_service: MessageService):
+        message_service.sub_service.get_subscription_queue_status = AsyncMock(return_value=FillQueueStatus.done)
+        message_service.mq.get_messages = AsyncMock(side_effect=[[], [PROVISIONING_MESSAGE]])
+
+        assert await message_service.get_messages(SUBSCRIPTION_NAME, timeout=5, max_messages=10, pop=False) == []
+        result = await message_service.get_messages(SUBSCRIPTION_NAME, timeout=5, max_messages=10, pop=False)
+
+        message_service.mq.get_messages.assert_has_calls(
+            [call(ConsumerQueue(SUBSCRIPTION_NAME), PULL_TIMEOUT, 10, False)]
+        )
+        assert result == [PROVISIONING_MESSAGE]
+
+    async def test_get_messages_prefill_running(self, message_service: MessageService):
+        message_service.sub_service.get_subscription_queue_status = AsyncMock(return_value=FillQueueStatus.running)
+
+        result = await message_service.get_messages(SUBSCRIPTION_NAME, timeout=1, max_messages=10, pop=False)
+
+        message_service.mq.get_messages.assert_not_called()
+        assert result == []
+
+    async def test_stream_messages_reads_past_sent_messages(self, message_service: MessageService):
+        message_service.sub_service.cache.prefill_delivered(SUBSCRIPTION_NAME)
+        messages = [PROVISIONING_MESSAGE.model_copy(update={"sequence_number": seq_num}) for seq_num in (1, 2, 3)]
+        message_service.mq.get_messages = AsyncMock(return_value=messages[:2])
+        message_service.mq.read_stream = AsyncMock(side_effect=[[messages[2]]] + [[]] * 100)
+        message_service.mq.delete_messages = AsyncMock(return_value={1: None})
+        sent = []
+        all_sent = asyncio.Event()
+
+        async def send(message):
+            sent.append(message.sequence_number)
+            if len(sent) == 3:
+                all_sent.set()
+
+        acknowledgements = asyncio.Queue()
+        acknowledgements.put_nowait([1])
+        streaming = asyncio.create_task(
+            message_service.stream_messages(SUBSCRIPTION_NAME, 2, send, acknowledgements.get)
+        )
+        try:
+            await asyncio.wait_for(all_sent.wait(), 1)
+        finally:
+            streaming.cancel()
+
+        assert sent == [1, 2, 3]
+        # Message 2 is not acknowledged: the consumer is not pulled again, it would deliver message 2 again.
+        message_service.mq.get_messages.assert_called_once_with(
+            ConsumerQueue(SUBSCRIPTION_NAME), PULL_TIMEOUT, 2, False
+        )
+        message_service.mq.read_stream.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME), 2, 1, False)
+        message_service.mq.get_num_ack_pending.assert_not_called()
+
     async def test_post_message_status(self, message_service: MessageService):
         message_service.mq.delete_message = AsyncMock()
 
@@ -70,8 +189,19 @@ class TestMessageService:
     async def test_add_live_message(self):
         mq = NatsMessageQueue()
         mq.mq = AsyncMock()
-        message_service = MessageService(subscriptions_db=AsyncMock(), mq=mq)
+        message_service = MessageService(subscriptions_db=AsyncMock(), mq=mq, cache=SubscriptionCache())
 
         await message_service.mq.add_message(IncomingQueue(""), MESSAGE)
 
         message_service.mq.mq.add_message.assert_called_once_with(IncomingQueue(""), MESSAGE)
+
+    async def test_update_messages_status(self, message_service: MessageService):
+        message_service.mq.delete_messages = AsyncMock(return_value={1: None, 2: "no message found"})
+
+        result = await message_service.update_messages_status(SUBSCRIPTION_NAME, [1, 2], MESSAGE_PROCESSING_STATUS)
+
+        message_service.mq.delete_messages.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME), [1, 2])
+        assert [(r.sequence_number, r.ok, r.detail) for r in result] == [
+            (1, True, None),
+            (2, False, "no message found"),
+        ]
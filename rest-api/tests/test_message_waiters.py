@@ -0,0 +1,87 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from test_helpers.mock_data import SUBSCRIPTION_NAME
+
+from univention.provisioning.backends.nats_mq import ConsumerQueue
+from univention.provisioning.rest.message_waiters import MessageWaiters
+from univention.provisioning.rest.mq_port import MessageQueuePort
+
+
+@pytest.fixture
+def mq() -> AsyncMock:
+    mq = AsyncMock(spec_set=MessageQueuePort)
+    mq.is_closed = False
+    mq.watch_for_messages.return_value = AsyncMock()
+    return mq
+
+
+@pytest.mark.anyio
+class TestMessageWaiters:
+    queue = ConsumerQueue(SUBSCRIPTION_NAME)
+
+    async def test_waiters_share_a_subscription(self, mq):
+        waiters = MessageWaiters()
+
+        async with waiters.waiter(self.queue, mq) as first, waiters.waiter(self.queue, mq) as second:
+            mq.watch_for_messages.assert_called_once()
+            assert not first.is_set() and not second.is_set()
+
+            await mq.watch_for_messages.call_args.args[1]()
+
+            assert first.is_set() and second.is_set()
+
+    async def test_idle_subscription_is_stopped(self, mq):
+        waiters = MessageWaiters(idle_timeout=0.01)
+
+        async with waiters.waiter(self.queue, mq):
+            pass
+        async with waiters.waiter(self.queue, mq):
+            pass
+        mq.watch_for_messages.assert_called_once()
+        await asyncio.sleep(0.05)
+
+        mq.watch_for_messages.return_value.assert_called_once_with()
+        async with waiters.waiter(self.queue, mq):
+            assert mq.watch_for_messages.call_count == 2
+        await waiters.close()
+
+    async def test_closed_connection_is_replaced(self, mq):
+        waiters = MessageWaiters()
+        other_mq = AsyncMock(spec_set=MessageQueuePort)
+        other_mq.is_closed = False
+        other_mq.watch_for_messages.return_value = AsyncMock()
+
+        async with waiters.waiter(self.queue, mq) as old:
+            mq.is_closed = True
+            async with waiters.waiter(self.queue, other_mq) as new:
+                other_mq.watch_for_messages.assert_called_once()
+                await asyncio.sleep(0)
+                mq.watch_for_messages.return_value.assert_called_once_with()
+
+                await other_mq.watch_for_messages.call_args.args[1]()
+
+                assert new.is_set() and not old.is_set()
+        await waiters.close()
+
+        other_mq.watch_for_messages.return_value.assert_called_once_with()
+
+    async def test_subscribing_fails(self, mq):
+        mq.watch_for_messages.side_effect = ConnectionError()
+        waiters = MessageWaiters()
+
+        async with waiters.waiter(self.queue, mq) as published:
+            assert published is None
+
+    async def test_close(self, mq):
+        waiters = MessageWaiters()
+        async with waiters.waiter(self.queue, mq):
+            pass
+
+        await waiters.close()
+
+        mq.watch_for_messages.return_value.assert_called_once_with()
@@ -0,0 +1,84 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from univention.provisioning.rest.password_verifier import PasswordVerifier, password_context
+
+
+@pytest.fixture
+def verifier():
+    verifier = PasswordVerifier(workers=2, cache_size=2, cache_ttl=30)
+    yield verifier
+    verifier.close()
+
+
+@pytest.fixture(scope="module")
+def hashed_password() -> str:
+    return password_context.hash("secret")
+
+
+@pytest.mark.anyio
+class TestPasswordVerifier:
+    async def test_verify(self, verifier: PasswordVerifier, hashed_password: str):
+        assert await verifier.verify_and_update("user", "secret", hashed_password) == (True, None)
+        assert await verifier.verify_and_update("user", "wrong", hashed_password) == (False, None)
+
+    async def test_hash(self, verifier: PasswordVerifier):
+        hashed = await verifier.hash("secret")
+
+        assert password_context.verify("secret", hashed)
+
+    async def test_only_successful_verifications_are_cached(self, verifier: PasswordVerifier, hashed_password: str):
+        with patch.object(password_context, "verify_and_update", wraps=password_context.verify_and_update) as verify:
+            for _ in range(2):
+                await verifier.verify_and_update("user", "secret", hashed_password)
+                await verifier.verify_and_update("user", "wrong", hashed_password)
+
+        assert [c.args[0] for c in verify.mock_calls] == ["secret", "wrong", "wrong"]
+
+    async def test_cache_is_keyed_by_the_stored_hash(self, verifier: PasswordVerifier, hashed_password: str):
+        await verifier.verify_and_update("user", "secret", hashed_password)
+
+        other_hash = password_context.hash("other")
+        assert await verifier.verify_and_update("user", "secret", other_hash) == (False, None)
+        assert await verifier.verify_and_update("other-user", "secret", hashed_password) == (True, None)
+
+    async def test_concurrent_verifications_are_done_once(self, verifier: PasswordVerifier, hashed_password: str):
+        with patch.object(password_context, "verify_and_update", wraps=password_context.verify_and_update) as verify:
+            results = await asyncio.gather(
+                *(verifier.verify_and_update("user", "secret", hashed_password) for _ in range(5))
+            )
+
+        assert results == [(True, None)] * 5
+        verify.assert_called_once()
+
+    async def test_invalidate(self, verifier: PasswordVerifier, hashed_password: str):
+        await verifier.verify_and_update("user", "secret", hashed_password)
+        await verifier.verify_and_update("other-user", "secret", hashed_password)
+
+        verifier.invalidate("user")
+
+        with patch.object(password_context, "verify_and_update", wraps=password_context.verify_and_update) as verify:
+            await verifier.verify_and_update("user", "secret", hashed_password)
+            await verifier.verify_and_update("other-user", "secret", hashed_password)
+
+        verify.assert_called_once()
+
+    async def test_event_loop_is_not_blocked(self, verifier: PasswordVerifier, hashed_password: str):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticker = asyncio.create_task(tick())
+        await verifier.verify_and_update("user", "secret", hashed_password)
+        ticker.cancel()
+
+        assert ticks > 1
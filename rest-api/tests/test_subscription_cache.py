@@ -0,0 +1,127 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from test_helpers.mock_data import SUBSCRIPTION_INFO, SUBSCRIPTION_NAME
+
+from univention.provisioning.models.subscription import FillQueueStatus, Subscription
+from univention.provisioning.rest.subscription_cache import SubscriptionCache
+from univention.provisioning.rest.subscriptions_db_port import SubscriptionsDBPort
+
+
+def subscription_json(prefill_queue_status: FillQueueStatus = FillQueueStatus.done) -> bytes:
+    return (
+        Subscription.model_validate({**SUBSCRIPTION_INFO, "prefill_queue_status": prefill_queue_status})
+        .model_dump_json()
+        .encode()
+    )
+
+
+@pytest.fixture
+async def cache() -> SubscriptionCache:
+    cache = SubscriptionCache()
+    await cache.subscription_changed(SUBSCRIPTION_NAME, subscription_json())
+    await cache.initialized()
+    return cache
+
+
+@pytest.mark.anyio
+class TestSubscriptionCache:
+    async def test_load_subscription_from_cache(self, cache):
+        load = AsyncMock()
+
+        subscription = await cache.load_subscription(SUBSCRIPTION_NAME, load)
+
+        load.assert_not_called()
+        assert subscription.name == SUBSCRIPTION_NAME
+        subscription.prefill_queue_status = FillQueueStatus.failed
+        assert (await cache.load_subscription(SUBSCRIPTION_NAME, load)).prefill_queue_status == FillQueueStatus.done
+
+    async def test_load_subscription_not_cached(self, cache):
+        load = AsyncMock(return_value="other")
+
+        assert await cache.load_subscription("other", load) == "other"
+        load.assert_called_once_with("other")
+
+    async def test_load_subscription_not_synced(self):
+        cache = SubscriptionCache()
+        await cache.subscription_changed(SUBSCRIPTION_NAME, subscription_json())
+        load = AsyncMock(return_value="loaded")
+
+        assert await cache.load_subscription(SUBSCRIPTION_NAME, load) == "loaded"
+        load.assert_called_once_with(SUBSCRIPTION_NAME)
+
+    async def test_deleted_subscription_is_forgotten(self, cache):
+        cache.prefill_delivered(SUBSCRIPTION_NAME)
+
+        await cache.subscription_changed(SUBSCRIPTION_NAME, None)
+
+        load = AsyncMock(return_value="loaded")
+        assert await cache.load_subscription(SUBSCRIPTION_NAME, load) == "loaded"
+        assert not cache.is_prefill_delivered(SUBSCRIPTION_NAME)
+
+    async def test_prefill_delivered_is_reset_by_new_prefill(self, cache):
+        cache.prefill_delivered(SUBSCRIPTION_NAME)
+        await cache.subscription_changed(SUBSCRIPTION_NAME, subscription_json(FillQueueStatus.done))
+        assert cache.is_prefill_delivered(SUBSCRIPTION_NAME)
+
+        await cache.subscription_changed(SUBSCRIPTION_NAME, subscription_json(FillQueueStatus.pending))
+        assert not cache.is_prefill_delivered(SUBSCRIPTION_NAME)
+
+    async def test_hashed_password_is_cached_until_changed(self, cache):
+        load = AsyncMock(side_effect=["hash1", "hash2"])
+
+        assert await cache.load_hashed_password(SUBSCRIPTION_NAME, load) == "hash1"
+        assert await cache.load_hashed_password(SUBSCRIPTION_NAME, load) == "hash1"
+        load.assert_called_once_with(SUBSCRIPTION_NAME)
+
+        await cache.credentials_changed(SUBSCRIPTION_NAME, 2)
+
+        assert await cache.load_hashed_password(SUBSCRIPTION_NAME, load) == "hash2"
+        assert load.call_count == 2
+
+    async def test_hashed_password_changed_while_loading_is_not_cached(self, cache):
+        async def load(name: str) -> str:
+            await cache.credentials_changed(name, 2)
+            return "old-hash"
+
+        assert await cache.load_hashed_password(SUBSCRIPTION_NAME, load) == "old-hash"
+
+        assert await cache.load_hashed_password(SUBSCRIPTION_NAME, AsyncMock(return_value="new-hash")) == "new-hash"
+
+    async def test_wait_for_prefill_is_woken_up(self, cache):
+        await cache.subscription_changed(SUBSCRIPTION_NAME, subscription_json(FillQueueStatus.running))
+        waiter = asyncio.create_task(cache.wait_for_prefill(SUBSCRIPTION_NAME))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await cache.subscription_changed(SUBSCRIPTION_NAME, subscription_json(FillQueueStatus.done))
+
+        await asyncio.wait_for(waiter, 1)
+
+    async def test_start_watches_until_closed(self):
+        subscriptions_db = AsyncMock(spec_set=SubscriptionsDBPort)
+        stop_watching_credentials = AsyncMock()
+        subscriptions_db.watch_for_credential_changes.return_value = stop_watching_credentials
+        watching = asyncio.Event()
+
+        async def watch(callback, initialized):
+            await callback(SUBSCRIPTION_NAME, subscription_json())
+            await initialized()
+            watching.set()
+            await asyncio.Event().wait()
+
+        subscriptions_db.watch_for_subscription_changes.side_effect = watch
+        cache = SubscriptionCache()
+
+        await cache.start(AsyncMock(return_value=subscriptions_db))
+        await asyncio.wait_for(watching.wait(), 1)
+        assert cache.synced
+        assert (await cache.load_subscription(SUBSCRIPTION_NAME, AsyncMock())).name == SUBSCRIPTION_NAME
+
+        await cache.close()
+        assert not cache.synced
+        stop_watching_credentials.assert_called_once_with()
@@ -2,10 +2,11 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 from copy import deepcopy
-from unittest.mock import AsyncMock, call
+from unittest.mock import AsyncMock, call, patch
 
 import pytest
 from fastapi import HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasicCredentials
 from test_helpers.mock_data import (
     CONSUMER_HASHED_PASSWORD,
     GROUPS_REALMS_TOPICS,
@@ -22,8 +23,11 @@ from univention.provisioning.backends.nats_mq import ConsumerQueue
 from univention.provisioning.models.constants import BucketName
 from univention.provisioning.models.message import RealmTopic
 from univention.provisioning.models.subscription import FillQueueStatus, NewSubscription, Subscription
+from univention.provisioning.rest.access_tokens import AccessTokenSigner
 from univention.provisioning.rest.config import AppSettings
 from univention.provisioning.rest.mq_port import MessageQueuePort
+from univention.provisioning.rest.password_verifier import PasswordVerifier
+from univention.provisioning.rest.subscription_cache import SubscriptionCache
 from univention.provisioning.rest.subscriptions import SubscriptionService
 from univention.provisioning.rest.subscriptions_db_adapter_nats import NatsSubscriptionsDB
 
@@ -31,7 +35,11 @@ from univention.provisioning.rest.subscriptions_db_adapter_nats import NatsSubsc
 @pytest.fixture
 def sub_service() -> SubscriptionService:
     service = SubscriptionService(
-        subscriptions_db=NatsSubscriptionsDB(AsyncMock(spec_set=AppSettings)), mq=AsyncMock(spec_set=MessageQueuePort)
+        subscriptions_db=NatsSubscriptionsDB(AsyncMock(spec_set=AppSettings)),
+        mq=AsyncMock(spec_set=MessageQueuePort),
+        passwords=PasswordVerifier(),
+        tokens=AccessTokenSigner(b"secret", ttl=60),
+        cache=SubscriptionCache(),
     )
     service.sub_db.kv = AsyncMock(spec_set=NatsKeyValueDB)
     return service
@@ -362,3 +370,62 @@ class TestSubscriptionService:
         # Verify rollback was attempted despite failures
         sub_service.mq.delete_consumer.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME))
         sub_service.mq.delete_queue.assert_called_once_with(ConsumerQueue(SUBSCRIPTION_NAME))
+
+    async def test_authenticate_with_access_token(self, sub_service: SubscriptionService):
+        sub_service.sub_db.get_str_value = AsyncMock(return_value=CONSUMER_HASHED_PASSWORD)
+        await sub_service.cache.initialized()
+
+        token = await sub_service.issue_access_token(
+            HTTPBasicCredentials(username=SUBSCRIPTION_NAME, password="password"), SUBSCRIPTION_NAME
+        )
+        sub_service.sub_db.get_str_value.reset_mock()
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token.access_token)
+
+        await sub_service.authenticate_user(credentials, SUBSCRIPTION_NAME)
+        sub_service.sub_db.get_str_value.assert_not_called()
+        with pytest.raises(HTTPException) as exc_info:
+            await sub_service.authenticate_user(credentials, "other-subscription")
+        assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+        with pytest.raises(HTTPException):
+            await sub_service.authenticate_user(
+                HTTPAuthorizationCredentials(scheme="Bearer", credentials=token.access_token + "x"), SUBSCRIPTION_NAME
+            )
+
+    async def test_access_token_is_invalidated_by_new_password(self, sub_service: SubscriptionService):
+        sub_service.sub_db.get_str_value = AsyncMock(return_value=CONSUMER_HASHED_PASSWORD)
+        await sub_service.cache.initialized()
+        token = await sub_service.issue_access_token(
+            HTTPBasicCredentials(username=SUBSCRIPTION_NAME, password="password"), SUBSCRIPTION_NAME
+        )
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token.access_token)
+
+        # The subscription was deleted and created again, with the same password.
+        sub_service.sub_db.get_str_value.return_value = await sub_service.passwords.hash("password")
+        await sub_service.cache.credentials_changed(SUBSCRIPTION_NAME, 2)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await sub_service.authenticate_user(credentials, SUBSCRIPTION_NAME)
+        assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_access_tokens_disabled(self, sub_service: SubscriptionService):
+        sub_service._tokens = None
+
+        with patch("univention.provisioning.rest.subscription_service.access_token_signer", return_value=None):
+            with pytest.raises(HTTPException) as exc_info:
+                await sub_service.issue_access_token(
+                    HTTPBasicCredentials(username=SUBSCRIPTION_NAME, password="password"), SUBSCRIPTION_NAME
+                )
+            assert exc_info.value.status_code == status.HTTP_404_NOT_FOUND
+            with pytest.raises(HTTPException) as exc_info:
+                await sub_service.authenticate_user(
+                    HTTPAuthorizationCredentials(scheme="Bearer", credentials="token"), SUBSCRIPTION_NAME
+                )
+            assert exc_info.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_issue_access_token_with_wrong_password(self, sub_service: SubscriptionService):
+        sub_service.sub_db.get_str_value = AsyncMock(return_value=CONSUMER_HASHED_PASSWORD)
+
+        with pytest.raises(HTTPException):
+            await sub_service.issue_access_token(
+                HTTPBasicCredentials(username=SUBSCRIPTION_NAME, password="wrong"), SUBSCRIPTION_NAME
+            )
@@ -10,6 +10,7 @@ from test_helpers.mock_data import FLAT_MESSAGE_ENCODED, MSG, SUBSCRIPTION_NAME,
 from univention.provisioning.backends.nats_mq import ConsumerQueue, json_decoder
 from univention.provisioning.dispatcher.config import DispatcherSettings
 from univention.provisioning.dispatcher.mq_adapter_nats import NatsMessageQueueAdapter
+from univention.provisioning.dispatcher.routing import RoutingIndex
 from univention.provisioning.dispatcher.service import DispatcherService, MessageAckManager
 from univention.provisioning.dispatcher.subscriptions_adapter_nats import NatsSubscriptionsAdapter
 
@@ -45,7 +46,9 @@ class TestDispatcher:
         """
 
         # trigger dispatcher to retrieve event from incoming queue
-        dispatcher_service._subscriptions = SUBSCRIPTIONS
+        dispatcher_service._subscriptions = RoutingIndex(
+            sub for topics in SUBSCRIPTIONS.values() for subscriptions in topics.values() for sub in subscriptions
+        )
 
         with pytest.raises(ExceptionGroup) as exception_group:
             await dispatcher_service.run()
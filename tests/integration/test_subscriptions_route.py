@@ -2,15 +2,21 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 
+import base64
 import uuid
+from unittest.mock import AsyncMock, Mock
 
 import httpx
 import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+from nats.js.errors import NotFoundError
 from test_helpers.mock_data import (
     CONSUMER_PASSWORD,
     FLAT_BODY,
     GROUPS_REALMS_TOPICS,
     GROUPS_TOPIC,
+    MSG,
     PUBLISHER_NAME,
     REALM,
     SUBSCRIPTION_NAME,
@@ -20,6 +26,7 @@ from test_helpers.mock_data import (
 from univention.provisioning.models.message import MessageProcessingStatus
 from univention.provisioning.models.subscription import FillQueueStatus
 from univention.provisioning.rest.config import app_settings
+from univention.provisioning.rest.main import app
 
 MESSAGE_PROCESSING_STATUS = MessageProcessingStatus.ok
 MESSAGE_PROCESSING_SEQ_ID = 1
@@ -123,6 +130,56 @@ class TestSubscriptionsRoute:
         assert data["publisher_name"] == PUBLISHER_NAME
         assert data["sequence_number"] == 1
 
+    async def test_get_messages(self, client: httpx.AsyncClient, mock_nats_mq_adapter):
+        mock_nats_mq_adapter._js.get_msg = AsyncMock(side_effect=NotFoundError)
+
+        response = await client.get(
+            f"{self.subscriptions_url}/{SUBSCRIPTION_NAME}/messages",
+            params={"max": 10, "timeout": 1},
+            auth=(SUBSCRIPTION_NAME, CONSUMER_PASSWORD),
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 1
+        assert data[0]["topic"] == GROUPS_TOPIC
+        assert data[0]["sequence_number"] == 1
+
+    async def test_get_messages_max_out_of_range(self, client: httpx.AsyncClient):
+        response = await client.get(
+            f"{self.subscriptions_url}/{SUBSCRIPTION_NAME}/messages",
+            params={"max": 0},
+            auth=(SUBSCRIPTION_NAME, CONSUMER_PASSWORD),
+        )
+        assert response.status_code == 422
+
+    async def test_stream_messages(self, mock_nats_mq_adapter):
+        async def get_msg(stream_name, seq, subject, next):
+            if seq > 2:
+                raise NotFoundError
+            return Mock(seq=2, data=MSG.data)
+
+        # The consumer keeps delivering message 1, it is not sent again.
+        mock_nats_mq_adapter._js.get_msg = AsyncMock(side_effect=get_msg)
+        auth = base64.b64encode(f"{SUBSCRIPTION_NAME}:{CONSUMER_PASSWORD}".encode()).decode()
+
+        with TestClient(app).websocket_connect(
+            f"{self.subscriptions_url}/{SUBSCRIPTION_NAME}/messages/stream?window=1",
+            headers={"Authorization": f"Basic {auth}"},
+        ) as websocket:
+            data = websocket.receive_json()
+            assert data["topic"] == GROUPS_TOPIC
+            assert data["sequence_number"] == 1
+            websocket.send_json({"status": MESSAGE_PROCESSING_STATUS.value, "sequence_numbers": [1]})
+            assert websocket.receive_json()["sequence_number"] == 2
+
+        assert mock_nats_mq_adapter._js.delete_msg.call_args_list[0].args[-1] == 1
+
+    async def test_stream_messages_unauthenticated(self):
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with TestClient(app).websocket_connect(f"{self.subscriptions_url}/{SUBSCRIPTION_NAME}/messages/stream"):
+                pass
+        assert exc_info.value.code == 1008
+
     async def test_update_messages_status(self, client: httpx.AsyncClient):
         response = await client.patch(
             f"{self.subscriptions_url}/{SUBSCRIPTION_NAME}/messages/{MESSAGE_PROCESSING_SEQ_ID}/status",
@@ -130,3 +187,26 @@ class TestSubscriptionsRoute:
             auth=(SUBSCRIPTION_NAME, CONSUMER_PASSWORD),
         )
         assert response.status_code == 200
+
+    async def test_update_messages_status_bulk(self, client: httpx.AsyncClient, mock_nats_mq_adapter):
+        error = NotFoundError()
+        error.description = "no message found"
+        mock_nats_mq_adapter._js.delete_msg = AsyncMock(side_effect=[True, True, error, True])
+
+        response = await client.patch(
+            f"{self.subscriptions_url}/{SUBSCRIPTION_NAME}/messages/status",
+            json={
+                "status": MESSAGE_PROCESSING_STATUS.value,
+                "sequence_numbers": [9],
+                "first_sequence_number": 1,
+                "last_sequence_number": 3,
+            },
+            auth=(SUBSCRIPTION_NAME, CONSUMER_PASSWORD),
+        )
+        assert response.status_code == 200
+        assert response.json() == [
+            {"sequence_number": 1, "ok": True, "detail": None},
+            {"sequence_number": 2, "ok": True, "detail": None},
+            {"sequence_number": 3, "ok": False, "detail": "no message found"},
+            {"sequence_number": 9, "ok": True, "detail": None},
+        ]
@@ -1,20 +1,31 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
-import json
-from typing import Any, Optional
+import logging
+from typing import Any, Awaitable, Callable, Optional
 
 from univention.provisioning.backends import key_value_store
+from univention.provisioning.backends.key_value_db import BucketLimits, UpdateConflict
 from univention.provisioning.models.constants import BucketName
 
-from .cache_port import Cache
+from . import cache_codec
+from .cache_port import Cache, CacheStats
 from .config import UDMTransformerSettings, udm_transformer_settings
+from .lru import LRUCache
+
+logger = logging.getLogger(__name__)
 
 
 class CacheNats(Cache):
     """
     Store and retrieve data in a cache.
-    This adapter implements it using the NATS k/v store.
+    This adapter implements it using the NATS k/v store, in the binary format of `cache_codec`.
+
+    Recently used entries are additionally kept in memory, limited by `cache_lru_max_entries` and
+    `cache_lru_max_size`. Stored entries are written through to the k/v store. The bucket is watched
+    to drop entries from memory that were changed by other processes.
+
+    The size, history and TTL of the bucket are limited by `cache_max_bytes`, `cache_history` and `cache_ttl`.
 
     Use as an asynchronous context manager to ensure DB connection gets closed after usage.
     """
@@ -29,6 +40,13 @@ class CacheNats(Cache):
             user=self.settings.nats_user,
             password=self.settings.nats_password,
         )
+        self._lru = LRUCache(self.settings.cache_lru_max_entries, self.settings.cache_lru_max_size)
+        # Keys currently read from or written to the k/v store, with the latest revision seen by the watcher.
+        self._in_flight: dict[str, int] = {}
+        self._stop_watching: Optional[Callable[[], Awaitable[None]]] = None
+        self._hits = 0
+        self._memory_hits = 0
+        self._misses = 0
 
     async def __aenter__(self) -> Cache:
         await self.connect()
@@ -39,14 +57,96 @@ class CacheNats(Cache):
         return False
 
     async def connect(self) -> None:
-        await self._kv_store.init(buckets=[self._bucket_name])
+        await self._kv_store.init(buckets=[])
+        await self._kv_store.create_kv_store(
+            self._bucket_name,
+            BucketLimits(
+                max_bytes=self.settings.cache_max_bytes,
+                history=self.settings.cache_history,
+                ttl=self.settings.cache_ttl,
+            ),
+        )
+        if self._lru.enabled:
+            self._stop_watching = await self._kv_store.watch_for_changes(self._bucket_name, self.changed)
 
     async def close(self) -> None:
+        if self._stop_watching:
+            await self._stop_watching()
+            self._stop_watching = None
+        self._lru.clear()
         await self._kv_store.close()
 
     async def retrieve(self, key: str) -> dict[str, Any]:
-        result = await self._kv_store.get_value(key, self._bucket_name)
-        return json.loads(result) if result else {}
+        value = await self._retrieve(key)
+        if value:
+            self._hits += 1
+        else:
+            self._misses += 1
+        return cache_codec.decode(value) if value else {}
+
+    async def _retrieve(self, key: str) -> Optional[bytes]:
+        if not self._stop_watching:
+            result = await self._kv_store.get_bytes_with_revision(key, self._bucket_name)
+            return result[0] if result else None
+
+        if entry := self._lru.get(key):
+            self._memory_hits += 1
+            return entry.value
+        self._in_flight.setdefault(key, 0)
+        try:
+            result = await self._kv_store.get_bytes_with_revision(key, self._bucket_name)
+        finally:
+            changed_revision = self._in_flight.pop(key, 0)
+        if not result:
+            return None
+        value, revision = result
+        if revision >= changed_revision:
+            self._lru.put(key, value, revision)
+        return value
+
+    async def store(self, key: str, value: dict[str, Any]) -> None:
+        data = cache_codec.encode(value, self.settings.cache_compression_threshold)
+        if not self._stop_watching:
+            await self._kv_store.put_value(key, data, self._bucket_name)
+            return
+
+        self._lru.pop(key)
+        self._in_flight.setdefault(key, 0)
+        try:
+            revision = await self._kv_store.put_value(key, data, self._bucket_name)
+        finally:
+            changed_revision = self._in_flight.pop(key, 0)
+        if revision and revision >= changed_revision:
+            self._lru.put(key, data, revision)
+
+    async def create(self, key: str, value: dict[str, Any]) -> bool:
+        """Store `value` only if `key` is not in the cache yet. Returns whether it was stored."""
+        data = cache_codec.encode(value, self.settings.cache_compression_threshold)
+        try:
+            await self._kv_store.put_value(key, data, self._bucket_name, revision=0)
+        except UpdateConflict:
+            return False
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._lru.pop(key)
+        await self._kv_store.delete_kv_pair(key, self._bucket_name)
+
+    async def stats(self) -> CacheStats:
+        bucket_stats = await self._kv_store.get_bucket_stats(self._bucket_name)
+        return CacheStats(
+            entries=bucket_stats.values,
+            bytes=bucket_stats.bytes,
+            hits=self._hits,
+            misses=self._misses,
+            memory_hits=self._memory_hits,
+        )
 
-    async def store(self, key: str, value: str) -> None:
-        await self._kv_store.put_value(key, value, self._bucket_name)
+    async def changed(self, key: str, revision: int) -> None:
+        """Drop `key` from memory, if it was changed in the k/v store by someone else."""
+        if key in self._in_flight:
+            self._in_flight[key] = max(self._in_flight[key], revision)
+        entry = self._lru.peek(key)
+        if entry and entry.revision < revision:
+            logger.debug("Cache entry %r was changed (revision %d), dropping it from memory.", key, revision)
+            self._lru.pop(key)
@@ -0,0 +1,39 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+"""
+Binary format of the cache entries.
+
+The first byte of an entry is its format, followed by the data in that format.
+Entries written as JSON text by older versions start with "{" and are still read.
+"""
+
+import json
+import zlib
+from typing import Any
+
+import msgpack
+
+FORMAT_MSGPACK = 0x01
+FORMAT_MSGPACK_ZLIB = 0x02
+# Compressing fast is more important than compressing well on the transformer's hot path.
+ZLIB_LEVEL = 1
+
+
+def encode(obj: dict[str, Any], compression_threshold: int) -> bytes:
+    """Serialize `obj`, compressing it if it is larger than `compression_threshold` bytes."""
+    data = msgpack.packb(obj)
+    if len(data) > compression_threshold:
+        return bytes([FORMAT_MSGPACK_ZLIB]) + zlib.compress(data, ZLIB_LEVEL)
+    return bytes([FORMAT_MSGPACK]) + data
+
+
+def decode(data: bytes) -> dict[str, Any]:
+    if not data:
+        return {}
+    body = memoryview(data)[1:]
+    if data[0] == FORMAT_MSGPACK:
+        return msgpack.unpackb(body)
+    if data[0] == FORMAT_MSGPACK_ZLIB:
+        return msgpack.unpackb(zlib.decompress(body))
+    return json.loads(data)
@@ -2,11 +2,25 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import abc
-from typing import Optional, Self
+from typing import NamedTuple, Optional, Self
 
 from .config import UDMTransformerSettings
 
 
+class CacheStats(NamedTuple):
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    # hits served from memory, included in `hits`
+    memory_hits: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
 class Cache(abc.ABC):
     """
     Store and retrieve data in a cache.
@@ -32,4 +46,17 @@ class Cache(abc.ABC):
     async def retrieve(self, key: str) -> dict: ...
 
     @abc.abstractmethod
-    async def store(self, key: str, value: str): ...
+    async def store(self, key: str, value: dict): ...
+
+    @abc.abstractmethod
+    async def create(self, key: str, value: dict) -> bool:
+        """Store `value` only if `key` is not in the cache yet. Returns whether it was stored."""
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str): ...
+
+    @abc.abstractmethod
+    async def stats(self) -> CacheStats:
+        """Number and size of the entries in the cache, and hits and misses of `retrieve()` since connecting."""
+        ...
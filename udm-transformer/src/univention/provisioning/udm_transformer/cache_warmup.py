@@ -0,0 +1,90 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from .cache_port import Cache
+from .ldap2udm_adapter import Ldap2UdmAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmup:
+    """
+    Writes UDM objects to the cache, before the udm-transformer needs them.
+
+    The objects are keyed by their "uuid" (the entryUUID of the LDAP object) and converted to the representation
+    of the udm-transformer. Objects that are in the cache already are not overwritten, as they may be newer.
+    Up to `concurrency` objects are written at the same time.
+    """
+
+    def __init__(self, cache: Cache, concurrency: int = 32, progress_interval: float = 10.0):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.stored = 0
+        self.skipped = 0
+        self.failed = 0
+        self._started = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.stored + self.skipped + self.failed
+
+    async def warm_up(self, udm_objs: AsyncIterator[dict[str, Any]]) -> None:
+        self._started = time.monotonic()
+        slots = asyncio.Semaphore(self.concurrency)
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                async for udm_obj in udm_objs:
+                    await slots.acquire()
+                    task = task_group.create_task(self.store(udm_obj))
+                    task.add_done_callback(lambda _: slots.release())
+        finally:
+            reporter.cancel()
+        self.log_progress("Finished cache warm-up")
+
+    async def store(self, udm_obj: dict[str, Any]) -> None:
+        try:
+            key = udm_obj["uuid"]
+            created = await self.cache.create(key, Ldap2UdmAdapter.udm_object(udm_obj))
+        except Exception as exc:
+            logger.error("Failed to store %r in the cache: %r", udm_obj.get("dn"), exc)
+            self.failed += 1
+            return
+        if created:
+            self.stored += 1
+        else:
+            self.skipped += 1
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.log_progress("Warming up the cache")
+
+    def log_progress(self, msg: str) -> None:
+        duration = time.monotonic() - self._started
+        logger.info(
+            "%s: %d objects in %.0f s (%.0f objects/s), %d stored, %d already cached, %d failed.",
+            msg,
+            self.processed,
+            duration,
+            self.processed / duration if duration else 0,
+            self.stored,
+            self.skipped,
+            self.failed,
+        )
+
+
+async def udm_objects_from_file(path: Path) -> AsyncIterator[dict[str, Any]]:
+    """Yield the UDM objects of a file with one JSON object (as returned by the UDM REST API) per line."""
+    with path.open() as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
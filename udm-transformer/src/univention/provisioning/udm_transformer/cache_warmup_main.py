@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Sequence
+
+from univention.provisioning.utils.log import setup_logging
+
+from .cache_adapter_nats import CacheNats
+from .cache_warmup import CacheWarmup, udm_objects_from_file
+from .config import UDMTransformerSettings, udm_transformer_settings
+from .udm_objects_adapter import UDMObjectsAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write all UDM objects to the cache of the udm-transformer, that are not in it yet."
+    )
+    parser.add_argument(
+        "--file",
+        type=Path,
+        help="Read the UDM objects from a file with one JSON object per line, instead of the UDM REST API.",
+    )
+    parser.add_argument(
+        "--object-type",
+        action="append",
+        dest="object_types",
+        help="UDM object type to read from the UDM REST API, can be repeated. Default: all object types.",
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum number of concurrent cache writes.")
+    parser.add_argument("--page-size", type=int, default=500, help="Number of objects per UDM REST API request.")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Seconds between progress reports.")
+    return parser.parse_args(argv)
+
+
+async def main(settings: UDMTransformerSettings, arguments: argparse.Namespace) -> int:
+    if settings.cache_mode != "udm":
+        logger.error("Cache warm-up is only supported with the cache mode 'udm'.")
+        return 1
+    async with CacheNats(settings.model_copy(update={"cache_lru_max_entries": 0})) as cache:
+        warmup = CacheWarmup(cache, arguments.concurrency, arguments.progress_interval)
+        if arguments.file:
+            await warmup.warm_up(udm_objects_from_file(arguments.file))
+        else:
+            async with UDMObjectsAdapter(settings, arguments.page_size) as udm:
+                await warmup.warm_up(udm.get_all_objects(arguments.object_types))
+    return 1 if warmup.failed else 0
+
+
+def run():
+    arguments = parse_args(sys.argv[1:])
+    settings = udm_transformer_settings()
+    setup_logging(settings.log_level)
+    sys.exit(asyncio.run(main(settings, arguments)))
+
+
+if __name__ == "__main__":
+    run()
@@ -41,6 +41,38 @@ class UDMTransformerSettings(BaseSettings):
     udm_path_prefix: str = "/univention"
     # UDM: needs reload - meaning: should reload UDM REST API on each extended_attributes change, used for Kubernetes only
     udm_needs_reload: bool = True
+    # UDM: maximum number of concurrent requests (and kept alive connections) to the UDM REST API
+    udm_max_connections: int = 10
+    # UDM: maximum number of LDAP objects unmapped with one request, 1 disables batching.
+    # Only concurrently transformed LDAP changes are batched, see `pipeline_size`.
+    udm_unmap_batch_size: int = 1
+    # UDM: maximum time in seconds an LDAP object waits for more objects to fill an unmap batch
+    udm_unmap_batch_delay: float = 0.005
+
+    # Number of LDAP changes transformed concurrently.
+    # Changes of the same LDAP object (entryUUID) are still transformed in order. 1 transforms one after the other.
+    pipeline_size: int = 1
+
+    # Cache: maximum number of recently used cache entries kept in memory, 0 disables the in-memory cache
+    cache_lru_max_entries: int = 10_000
+    # Cache: maximum size in bytes of all cache entries kept in memory
+    cache_lru_max_size: int = 128 * 1024 * 1024
+    # Cache: content of the cache entries. "udm": the UDM object of the last change of an LDAP object.
+    # "ldap": additionally the hash of the LDAP object, so the UDM object is never outdated.
+    # A modification of an object missing in the cache still needs two unmap requests, for the old and the new
+    # LDAP object, sent concurrently: the UDM REST API has no batch endpoint.
+    cache_mode: Literal["udm", "ldap"] = "udm"
+    # Cache: cache entries larger than this number of bytes are stored compressed
+    cache_compression_threshold: int = 4096
+    # Cache: maximum size in bytes of the cache bucket, the oldest entries are discarded when it is reached.
+    # 0: unlimited
+    cache_max_bytes: int = 0
+    # Cache: number of revisions kept per cache entry
+    cache_history: int = 1
+    # Cache: seconds after which cache entries that were not changed are discarded, 0: never
+    cache_ttl: float = 0
+    # Cache: seconds between log messages with the cache statistics, 0: never
+    cache_stats_interval: float = 600
 
     # Provisioning REST API: host
     provisioning_api_host: str
@@ -1,81 +1,193 @@
-# Callable | NoneSPDX-License-Identifier: AGPL-3.0-only
+# SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
-import base64
+import asyncio
+import binascii
 import logging
 import urllib.parse
-from typing import Optional
+import uuid
+from typing import Any, Optional, Union
 
-import dns.resolver
-import requests
+import aiohttp
+import dns.asyncresolver
 
-from univention.admin.rest.client import UDM, ServerError, ServiceUnavailable, UnprocessableEntity
+from univention.admin.rest.client import ConnectionError as UDMConnectionError
+from univention.admin.rest.client import HTTPError, ServerError, ServiceUnavailable, UnprocessableEntity
 
 from .config import UDMTransformerSettings
-from .ldap2udm_port import Ldap2Udm
+from .ldap2udm_port import UDM_MODULES_RELOAD_TRIGGER, Ldap2Udm
 
 logger = logging.getLogger(__name__)
 
+# Like the synchronous UDM REST API client: retry requests while the service is unavailable.
+MAX_SERVICE_UNAVAILABLE_RETRIES = 5
+MAX_RETRY_AFTER = 5
 
-UDM_MODULES_RELOAD_TRIGGER = {
-    "settings/extended_attribute",
+HTTP_ERRORS: dict[int, type[HTTPError]] = {
+    422: UnprocessableEntity,
+    500: ServerError,
+    503: ServiceUnavailable,
 }
 
 
 class Ldap2UdmAdapter(Ldap2Udm):
+    """
+    Transforms LDAP objects to UDM objects with the UDM REST API, without blocking the event loop.
+
+    Connections are kept alive and reused, at most `udm_max_connections` requests are sent concurrently.
+
+    Use as an asynchronous context manager to ensure the connections get closed after usage.
+    """
+
     def __init__(self, settings: Optional[UDMTransformerSettings] = None):
         Ldap2Udm.__init__(self, settings)
-        self.udm_url = settings.udm_url
-        self.udm_auth = (settings.udm_username, settings.udm_password)
-        self.udm_needs_reload = settings.udm_needs_reload
-        self.udm_path_prefix = settings.udm_path_prefix
-        self.udm = UDM.http(self.udm_url, *self.udm_auth)
+        self.udm_url = self.settings.udm_url.rstrip("/")
+        self.udm_auth = aiohttp.BasicAuth(self.settings.udm_username, self.settings.udm_password)
+        self.udm_needs_reload = self.settings.udm_needs_reload
+        self.udm_path_prefix = self.settings.udm_path_prefix
+        self.udm_max_connections = self.settings.udm_max_connections
+        # Cleared when the UDM REST API turns out not to provide the batch endpoint.
+        self.udm_batch_supported = True
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def connect(self) -> None:
+        if not self._session:
+            self._session = aiohttp.ClientSession(
+                auth=self.udm_auth,
+                connector=aiohttp.TCPConnector(limit=self.udm_max_connections),
+                headers={"Accept": "application/json"},
+            )
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.close()
+            self._session = None
 
-    def discover_pods_ips(self):
+    async def discover_pods_ips(self) -> list[str]:
         # kubernetes magic
         hostname = urllib.parse.urlparse(self.udm_url).hostname
-        udm_api_ips = dns.resolver.resolve(hostname, "A", search=True)
+        udm_api_ips = await dns.asyncresolver.resolve(hostname, "A", search=True)
         return [ip.address for ip in udm_api_ips]
 
-    def reload_udm_if_required(self, obj: dict) -> None:
+    async def reload_udm_if_required(self, obj: dict) -> None:
         if not self.udm_needs_reload:
             return
         if obj.get("objectType") not in UDM_MODULES_RELOAD_TRIGGER:
             return
         logger.info("Reload of UDM modules triggered by change of %r object.", obj["objectType"])
-        for ip in self.discover_pods_ips():
+        for ip in await self.discover_pods_ips():
             # ATTENTION: credentials via HTTP. okay as this is meant to be done only inside "kubernetes VPN"
-            (
-                requests.get(
-                    "http://%s:9979%s/udm/-/reload" % (ip, self.udm_path_prefix),
-                    auth=self.udm_auth,
-                    headers={"Accept": "application/json"},
-                ),
+            async with self._session.get("http://%s:9979%s/udm/-/reload" % (ip, self.udm_path_prefix)):
+                pass
+
+    async def ldap_to_udm(self, entry: dict) -> dict:
+        try:
+            data = await self.request(
+                "POST", f"{self.udm_url}/directory/unmap-ldap-attributes", self.unmap_payload(entry)
             )
+            return self.udm_object(data)
+        except HTTPError as exc:
+            self.log_unmap_error(exc)
+            raise
+
+    async def ldap_to_udm_batch(self, entries: list[dict]) -> list[Union[dict, Exception]]:
+        """
+        Transform multiple LDAP objects with a single request to the batch endpoint of the UDM REST API.
+
+        Request: `{"entries": [<payload of unmap-ldap-attributes>, ...]}`
+        Response: `{"entries": [{"status": 200, "object": <UDM object>} | {"status": 422, "error": {...}}, ...]}`,
+        in the order of the request.
+
+        Falls back to one request per entry, if the UDM REST API does not provide the batch endpoint.
+        """
+        if self.udm_batch_supported:
+            try:
+                data = await self.request(
+                    "POST",
+                    f"{self.udm_url}/directory/unmap-ldap-attributes/batch",
+                    {"entries": [self.unmap_payload(entry) for entry in entries]},
+                )
+            except HTTPError as exc:
+                if exc.code not in (404, 405):
+                    self.log_unmap_error(exc)
+                    raise
+                logger.warning("UDM REST API does not support unmapping in batches, sending single requests.")
+                self.udm_batch_supported = False
+            else:
+                return [self.batch_result(result) for result in data["entries"]]
+        return await super().ldap_to_udm_batch(entries)
 
-    def ldap_to_udm(self, entry: dict) -> dict:
-        dn = entry["entryDN"][0].decode("utf-8")
+    def batch_result(self, result: dict[str, Any]) -> Union[dict, Exception]:
+        status = result.get("status", 200)
+        if status < 399:
+            return self.udm_object(result["object"])
+        error_details = result.get("error") or {}
+        msg = f"POST {self.udm_url}/directory/unmap-ldap-attributes/batch: {status}"
+        if error_details.get("message"):
+            msg += f"\n{error_details['message']}"
+        exc = HTTP_ERRORS.get(status, HTTPError)(status, msg, None, error_details=error_details)
+        self.log_unmap_error(exc)
+        return exc
+
+    @staticmethod
+    def unmap_payload(entry: dict) -> dict[str, Any]:
         # the UDM REST API expects only base64 encoded attributes
-        attributes = {k: [base64.b64encode(_v).decode("utf-8") for _v in v] for k, v in entry.items()}
-        payload = {
-            "dn": dn,
-            "attributes": attributes,
+        b2a = binascii.b2a_base64
+        return {
+            "dn": entry["entryDN"][0].decode("utf-8"),
+            "attributes": {k: [b2a(_v, newline=False).decode("ascii") for _v in v] for k, v in entry.items()},
         }
 
-        try:
-            data = self.udm.client.request(
-                "POST", self.udm.uri + "/directory/unmap-ldap-attributes", data=payload, expect_json=True
-            )
-            # TODO: remove if we use the new UDM REST endpoint with id==univentionObjectIdentifier
-            data["id"] = data["properties"].get("univentionObjectIdentifier", "")
-            del data["uuid"]
-            return data
-        except UnprocessableEntity as exc:
+    @staticmethod
+    def udm_object(data: dict[str, Any]) -> dict[str, Any]:
+        # TODO: remove if we use the new UDM REST endpoint with id==univentionObjectIdentifier
+        data["id"] = data["properties"].get("univentionObjectIdentifier", "")
+        del data["uuid"]
+        return data
+
+    @staticmethod
+    def log_unmap_error(exc: HTTPError) -> None:
+        if isinstance(exc, UnprocessableEntity):
             logger.error("Could not unmap LDAP attributes: %s ", exc)
-            raise
-        except ServiceUnavailable as exc:
+        elif isinstance(exc, ServiceUnavailable):
             logger.error("UDM REST service not available to unmap LDAP attributes: %s ", exc)
-            raise
-        except ServerError as exc:
+        elif isinstance(exc, ServerError):
             logger.error("UDM REST Server error while unmapping LDAP attributes: %s ", exc)
-            raise
+
+    async def request(self, method: str, url: str, payload: dict[str, Any]) -> Any:
+        """Send a request to the UDM REST API, raising the errors of the synchronous UDM REST API client."""
+        for attempt in range(MAX_SERVICE_UNAVAILABLE_RETRIES + 1):
+            try:
+                async with self._session.request(
+                    method, url, json=payload, headers={"X-Request-Id": uuid.uuid4().hex}
+                ) as response:
+                    if response.status == 503 and attempt < MAX_SERVICE_UNAVAILABLE_RETRIES:
+                        await asyncio.sleep(self.retry_after(response))
+                        continue
+                    return await self.eval_response(method, response)
+            except aiohttp.ClientConnectionError as exc:
+                raise UDMConnectionError(exc) from exc
+
+    @staticmethod
+    def retry_after(response: aiohttp.ClientResponse) -> int:
+        try:
+            return min(MAX_RETRY_AFTER, int(response.headers.get("Retry-After", 1)))
+        except ValueError:
+            return 1
+
+    @staticmethod
+    async def eval_response(method: str, response: aiohttp.ClientResponse) -> Any:
+        if response.status >= 399:
+            msg = f"{method} {response.url}: {response.status}"
+            error_details = None
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                pass
+            else:
+                if isinstance(body, dict):
+                    error_details = body.get("error", {})
+                    if error_details and error_details.get("message"):
+                        msg += f"\n{error_details['message']}"
+            raise HTTP_ERRORS.get(response.status, HTTPError)(response.status, msg, None, error_details=error_details)
+        return await response.json(content_type=None)
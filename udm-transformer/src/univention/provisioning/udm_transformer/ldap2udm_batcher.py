@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import logging
+from typing import Any, Optional, Union
+
+from .ldap2udm_port import Ldap2Udm
+
+logger = logging.getLogger(__name__)
+
+
+class Ldap2UdmBatcher(Ldap2Udm):
+    """
+    Collects concurrent `ldap_to_udm()` calls into micro-batches for `ldap_to_udm_batch()` of another `Ldap2Udm`.
+
+    A batch is sent when it has `batch_size` entries, or `max_delay` seconds after its first entry was added.
+    """
+
+    def __init__(self, ldap2udm: Ldap2Udm, batch_size: int, max_delay: float):
+        super().__init__(ldap2udm.settings)
+        self.ldap2udm = ldap2udm
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._batch: list[tuple[dict[str, Any], asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._requests: set[asyncio.Task] = set()
+
+    async def connect(self) -> None:
+        await self.ldap2udm.connect()
+
+    async def close(self) -> None:
+        self._flush()
+        if self._requests:
+            await asyncio.wait(self._requests)
+        await self.ldap2udm.close()
+
+    async def reload_udm_if_required(self, obj: dict[str, Any]) -> None:
+        await self.ldap2udm.reload_udm_if_required(obj)
+
+    async def ldap_to_udm(self, entry: dict[str, Any]) -> dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((entry, future))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+        elif not self._flush_timer:
+            self._flush_timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    async def ldap_to_udm_batch(self, entries: list[dict[str, Any]]) -> list[Union[dict[str, Any], Exception]]:
+        return await self.ldap2udm.ldap_to_udm_batch(entries)
+
+    def _flush(self) -> None:
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            request = asyncio.create_task(self._unmap(batch))
+            self._requests.add(request)
+            request.add_done_callback(self._requests.discard)
+
+    async def _unmap(self, batch: list[tuple[dict[str, Any], asyncio.Future]]) -> None:
+        logger.debug("Unmapping a batch of %d LDAP objects.", len(batch))
+        try:
+            results = await self.ldap2udm.ldap_to_udm_batch([entry for entry, _ in batch])
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,16 +1,47 @@
-# Callable | NoneSPDX-License-Identifier: AGPL-3.0-only
+# SPDX-License-Identifier: AGPL-3.0-only
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
-from typing import Any, Optional
+import asyncio
+from typing import Any, Optional, Self, Union
 
 from .config import UDMTransformerSettings, udm_transformer_settings
 
+# Changes of objects of these UDM modules change the UDM objects of other modules.
+UDM_MODULES_RELOAD_TRIGGER = {
+    "settings/extended_attribute",
+}
+
 
 class Ldap2Udm:
+    """
+    Transforms LDAP objects to UDM objects.
+
+    Use as an asynchronous context manager to ensure the connections get closed after usage.
+    """
+
     def __init__(self, settings: Optional[UDMTransformerSettings] = None):
         self.settings = settings or udm_transformer_settings()
 
-    @staticmethod
-    def reload_udm_if_required(obj: dict[str, Any]) -> None: ...
+    async def __aenter__(self) -> Self:
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> bool:
+        await self.close()
+        return False
+
+    async def connect(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def reload_udm_if_required(self, obj: dict[str, Any]) -> None: ...
+
+    async def ldap_to_udm(self, entry: dict[str, Any]) -> dict[str, Any]: ...
+
+    async def ldap_to_udm_batch(self, entries: list[dict[str, Any]]) -> list[Union[dict[str, Any], Exception]]:
+        """
+        Transform multiple LDAP objects.
 
-    def ldap_to_udm(self, entry: dict[str, Any]) -> dict[str, Any]: ...
+        Returns the UDM object for each entry, or the exception `ldap_to_udm()` would have raised for it.
+        """
+        return await asyncio.gather(*(self.ldap_to_udm(entry) for entry in entries), return_exceptions=True)
@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Union
+
+
+class LRUEntry(NamedTuple):
+    value: Union[str, bytes]
+    revision: int
+
+
+class LRUCache:
+    """
+    In-memory mapping of keys to values and their revisions, evicting the least recently used entries.
+
+    Limited by the number of entries and by the sum of the lengths of the values.
+    A limit of 0 disables the cache.
+    """
+
+    def __init__(self, max_entries: int, max_size: int):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self._entries: OrderedDict[str, LRUEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_size > 0
+
+    def get(self, key: str) -> Optional[LRUEntry]:
+        """Get the entry of `key` and mark it as recently used."""
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+        return entry
+
+    def peek(self, key: str) -> Optional[LRUEntry]:
+        """Get the entry of `key` without changing the order of eviction."""
+        return self._entries.get(key)
+
+    def put(self, key: str, value: Union[str, bytes], revision: int) -> None:
+        self.pop(key)
+        if len(value) > self.max_size or not self.enabled:
+            return
+        self._entries[key] = LRUEntry(value, revision)
+        self.size += len(value)
+        while len(self._entries) > self.max_entries or self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.value)
+
+    def pop(self, key: str) -> Optional[LRUEntry]:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.size -= len(entry.value)
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
@@ -10,9 +10,12 @@ from univention.provisioning.backends.message_queue import MessageAckManager
 from univention.provisioning.utils.log import setup_logging
 
 from .cache_adapter_nats import CacheNats
+from .cache_port import Cache
 from .config import UDMTransformerSettings, udm_transformer_settings
 from .event_sender_adapter_messages_api import MessagesRestApiEventSender
 from .ldap2udm_adapter import Ldap2UdmAdapter
+from .ldap2udm_batcher import Ldap2UdmBatcher
+from .ldap2udm_port import Ldap2Udm
 from .subscriptions_adapter_nats import NatsSubscriptions
 from .transformer_service import TransformerService
 
@@ -21,6 +24,32 @@ UDM_TRANSFORMER_CONSUMER_NAME = "udm-transformer"
 logger = logging.getLogger(__name__)
 
 
+def ldap2udm_adapter(settings: UDMTransformerSettings) -> Ldap2Udm:
+    ldap2udm = Ldap2UdmAdapter(settings)
+    if settings.udm_unmap_batch_size > 1:
+        return Ldap2UdmBatcher(ldap2udm, settings.udm_unmap_batch_size, settings.udm_unmap_batch_delay)
+    return ldap2udm
+
+
+async def log_cache_stats(cache: Cache, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stats = await cache.stats()
+        except Exception as exc:
+            logger.warning("Failed to get the cache statistics: %r", exc)
+            continue
+        logger.info(
+            "Cache: %d entries, %d bytes, %d hits (%d from memory), %d misses, hit ratio: %.1f%%.",
+            stats.entries,
+            stats.bytes,
+            stats.hits,
+            stats.memory_hits,
+            stats.misses,
+            stats.hit_ratio * 100,
+        )
+
+
 async def main(settings: UDMTransformerSettings):
     with Daemonizer():
         async with (
@@ -29,15 +58,25 @@ async def main(settings: UDMTransformerSettings):
                 settings.provisioning_api_url, settings.events_username_udm, settings.events_password_udm
             ) as event_sender,
             NatsSubscriptions(settings) as subscriptions,
+            ldap2udm_adapter(settings) as ldap2udm,
         ):
-            await TransformerService(
-                ack_manager=MessageAckManager(),
-                cache=cache,
-                event_sender=event_sender,
-                ldap2udm=Ldap2UdmAdapter(settings),
-                subscriptions=subscriptions,
-                settings=settings,
-            ).listen_for_ldap_events()
+            stats_logger = (
+                asyncio.create_task(log_cache_stats(cache, settings.cache_stats_interval))
+                if settings.cache_stats_interval
+                else None
+            )
+            try:
+                await TransformerService(
+                    ack_manager=MessageAckManager(),
+                    cache=cache,
+                    event_sender=event_sender,
+                    ldap2udm=ldap2udm,
+                    subscriptions=subscriptions,
+                    settings=settings,
+                ).listen_for_ldap_events()
+            finally:
+                if stats_logger:
+                    stats_logger.cancel()
 
 
 def run():
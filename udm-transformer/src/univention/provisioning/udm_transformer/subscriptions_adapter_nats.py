@@ -54,3 +54,6 @@ class NatsSubscriptions(SubscriptionsPort):
 
     async def get_one_message(self, timeout: float) -> tuple[MQMessage, Acknowledgements]:
         return await self.mq.get_one_message(timeout=timeout, binary_decoder=messagepack_decoder)
+
+    async def get_message_batch(self, max_messages: int, timeout: float) -> list[tuple[MQMessage, Acknowledgements]]:
+        return await self.mq.get_message_batch(max_messages, timeout=timeout, binary_decoder=messagepack_decoder)
@@ -37,3 +37,8 @@ class SubscriptionsPort(abc.ABC):
 
     @abc.abstractmethod
     async def get_one_message(self, timeout: float) -> tuple[MQMessage, Acknowledgements]: ...
+
+    @abc.abstractmethod
+    async def get_message_batch(
+        self, max_messages: int, timeout: float
+    ) -> list[tuple[MQMessage, Acknowledgements]]: ...
@@ -2,21 +2,30 @@
 # SPDX-FileCopyrightText: 2024 Univention GmbH
 
 import datetime
-import json
+import hashlib
 import logging
-from typing import Any, Optional
+from typing import Any, Hashable, Optional
 
+import msgpack
 from pydantic import ValidationError
 
 from univention.admin.rest.client import ServiceUnavailable, UnprocessableEntity
+from univention.provisioning.backends.message_pipeline import BARRIER, KeyedMessagePipeline
 from univention.provisioning.backends.message_queue import Empty, MessageAckManager, QueueStatus
 from univention.provisioning.backends.nats_mq import LdapQueue
-from univention.provisioning.models.message import Body, EmptyBodyError, Message, NoUDMTypeError
+from univention.provisioning.models.message import (
+    LDAP_OBJECT_TYPE_FIELD,
+    Body,
+    EmptyBodyError,
+    Message,
+    MQMessage,
+    NoUDMTypeError,
+)
 
 from .cache_port import Cache
 from .config import UDMTransformerSettings, udm_transformer_settings
 from .event_sender_port import EventSender
-from .ldap2udm_port import Ldap2Udm
+from .ldap2udm_port import UDM_MODULES_RELOAD_TRIGGER, Ldap2Udm
 from .subscriptions_port import SubscriptionsPort
 
 UDM_OBJECT_TYPE_FIELD = "objectType"
@@ -42,10 +51,15 @@ class TransformerService:
         self.settings = settings or udm_transformer_settings()
 
     async def listen_for_ldap_events(self) -> None:
-        status = await self.subscriptions.initialize_subscription(LdapQueue())
+        status = await self.subscriptions.initialize_subscription(
+            LdapQueue(max_ack_pending=self.settings.pipeline_size)
+        )
         if status != QueueStatus.READY:
             raise NotImplementedError(f"Migration not supported in udm-transformer. Status: {status}")
 
+        if self.settings.pipeline_size > 1:
+            return await self.listen_for_ldap_events_pipelined()
+
         loop = True
         while loop:
             logger.debug("Listening for new LDAP messages.")
@@ -78,6 +92,71 @@ class TransformerService:
             else:
                 await acknowledgements.acknowledge_message()
 
+    async def listen_for_ldap_events_pipelined(self) -> None:
+        """
+        Transform up to `pipeline_size` LDAP changes concurrently, keeping the order of the changes of an LDAP object.
+
+        Like `listen_for_ldap_events()`, it stops when UDM is unavailable and raises unexpected errors,
+        after the changes that were already started are finished.
+        """
+        failures: list[Exception] = []
+
+        async def handle(message: MQMessage) -> None:
+            try:
+                await self.handle_message(message.data)
+            except Exception as exc:
+                failures.append(exc)
+                raise
+
+        async with KeyedMessagePipeline(
+            handle, self.message_key, self.settings.pipeline_size, self.ack_manager
+        ) as pipeline:
+            while not failures:
+                logger.debug("Listening for new LDAP messages.")
+                try:
+                    batch = await self.subscriptions.get_message_batch(self.settings.pipeline_size, timeout=10)
+                except Empty:
+                    logger.debug("No new LDAP messages found in the queue, continuing to wait.")
+                    continue
+                for message, acknowledgements in batch:
+                    if failures:
+                        await acknowledgements.acknowledge_message_negatively()
+                        continue
+                    data = message.data
+                    logger.info(
+                        "Received message to handle (Publisher: %r Realm: %r Topic: %r TS: %s).",
+                        data.get("publisher_name"),
+                        data.get("realm"),
+                        data.get("topic"),
+                        data.get("ts"),
+                    )
+                    logger.debug("Message content: %r", data)
+                    await pipeline.submit(message, acknowledgements)
+
+        unexpected = [exc for exc in failures if not isinstance(exc, ServiceUnavailable)]
+        if unexpected:
+            raise unexpected[0]
+
+    @staticmethod
+    def message_key(message: MQMessage) -> Hashable:
+        """
+        Changes with the same key are transformed in order: the entryUUID of the LDAP object.
+
+        Changes of objects that trigger a reload of UDM are transformed alone, between all earlier and all later
+        changes: they change how the LDAP objects of other changes are transformed.
+        """
+        body = message.data.get("body") or {}
+        for ldap_obj in (body.get("new"), body.get("old")):
+            for object_type in (ldap_obj or {}).get(LDAP_OBJECT_TYPE_FIELD) or []:
+                if isinstance(object_type, bytes):
+                    object_type = object_type.decode("utf-8", "replace")
+                if object_type in UDM_MODULES_RELOAD_TRIGGER:
+                    return BARRIER
+        for ldap_obj in (body.get("new"), body.get("old")):
+            if ldap_obj and ldap_obj.get("entryUUID"):
+                return ldap_obj["entryUUID"][0]
+        return None
+
     async def handle_message(self, data: dict[str, Any]):
         try:
             validated_message = Message.model_validate(data)
@@ -103,32 +182,39 @@ class TransformerService:
     async def handle_change(
         self, new_ldap_obj: dict[str, Any], old_ldap_obj: dict[str, Any], ts: datetime.datetime
     ) -> None:
-        old_udm_obj = await self.old_ldap_to_udm_obj(old_ldap_obj)
-        new_udm_obj = await self.new_ldap_to_udm_obj(new_ldap_obj)
+        if self.settings.cache_mode == "ldap":
+            new_udm_obj, old_udm_obj = await self.ldap_to_udm_objs(new_ldap_obj, old_ldap_obj)
+        else:
+            old_udm_obj = await self.old_ldap_to_udm_obj(old_ldap_obj)
+            new_udm_obj = await self.new_ldap_to_udm_obj(new_ldap_obj)
 
         if not new_udm_obj and not old_udm_obj:
             raise EmptyBodyError("Both 'new' and 'old' UDM objects empty.")
 
-        self.ldap2udm.reload_udm_if_required(new_udm_obj or old_udm_obj)
+        await self.ldap2udm.reload_udm_if_required(new_udm_obj or old_udm_obj)
 
         message = self.objects_to_message(new_udm_obj, old_udm_obj, ts)
         logger.debug("Sending the message with body: %r", message.body)
         await self.event_sender.send_event(message)
         logger.info("Message was sent: %r", new_udm_obj.get("dn") or old_udm_obj.get("dn"))
 
+        if not new_ldap_obj:
+            # The object was removed, only after sending the event, as a redelivered change needs the cache entry.
+            await self.cache.delete(old_ldap_obj["entryUUID"][0].decode())
+
     async def old_ldap_to_udm_obj(self, old_ldap_obj: dict[str, Any]) -> dict[str, Any]:
         if not old_ldap_obj:
             return {}
         result = await self.cache.retrieve(old_ldap_obj["entryUUID"][0].decode())
         if not result:
             logger.info("Did not find old_ldap_object in the cache. Falling back to new ldap object.")
-            result = self.ldap2udm.ldap_to_udm(old_ldap_obj)
+            result = await self.ldap2udm.ldap_to_udm(old_ldap_obj)
         else:
-            # TODO: we changed the udm representation (id=univentionObjectIdentifier, removed uuid)
-            # What about the old udm cache?
-            # A simple fix would be just to do the same here for the old udm object,
-            # but maybe we should store the LDAP representation in the cache to always get an
-            # up-do-date udm representation for the old object?
+            if "ldap_hash" in result:
+                # written in cache mode "ldap"
+                result = result["udm"]
+            # A cached UDM object may be outdated, e.g. after the UDM representation changed.
+            # Cache mode "ldap" (see `ldap_to_udm_objs()`) uses it only if its LDAP object is unchanged.
             if "uuid" in result:
                 # cache is still udm v1, convert to v2
                 del result["uuid"]
@@ -139,12 +225,52 @@ class TransformerService:
 
     async def new_ldap_to_udm_obj(self, new_ldap_obj: dict[str, Any]) -> dict[str, Any]:
         if new_ldap_obj:
-            new_udm_obj = self.ldap2udm.ldap_to_udm(new_ldap_obj)
+            new_udm_obj = await self.ldap2udm.ldap_to_udm(new_ldap_obj)
             if new_udm_obj:
-                await self.cache.store(new_ldap_obj["entryUUID"][0].decode(), json.dumps(new_udm_obj))
+                await self.cache.store(new_ldap_obj["entryUUID"][0].decode(), new_udm_obj)
             return new_udm_obj
         return {}
 
+    async def ldap_to_udm_objs(
+        self, new_ldap_obj: dict[str, Any], old_ldap_obj: dict[str, Any]
+    ) -> tuple[dict[str, Any], dict[str, Any]]:
+        """
+        Transform the new and the old LDAP object, using the cache in mode "ldap".
+
+        The cache holds the hash of the last LDAP object and its UDM object. A cached UDM object is used only if it
+        was transformed from an identical LDAP object, so it is never outdated. The remaining LDAP objects are
+        transformed together by `ldap_to_udm_batch()`: concurrently, one request each, as long as the UDM REST API
+        has no batch endpoint.
+        """
+        entry_uuid = (new_ldap_obj or old_ldap_obj)["entryUUID"][0].decode()
+        cached = await self.cache.retrieve(entry_uuid)
+        cached_udm_obj = cached.get("udm") if cached.get("ldap_hash") else None
+
+        ldap_objs = [ldap_obj for ldap_obj in (new_ldap_obj, old_ldap_obj) if ldap_obj]
+        hashes = [self.ldap_hash(ldap_obj) for ldap_obj in ldap_objs]
+        udm_objs = [cached_udm_obj if ldap_hash == cached.get("ldap_hash") else None for ldap_hash in hashes]
+        missing = [i for i, udm_obj in enumerate(udm_objs) if udm_obj is None]
+        if missing:
+            logger.debug("Transforming %d of %d LDAP objects not found in the cache.", len(missing), len(ldap_objs))
+            results = await self.ldap2udm.ldap_to_udm_batch([ldap_objs[i] for i in missing])
+            for i, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    raise result
+                udm_objs[i] = result
+
+        new_udm_obj = udm_objs[0] if new_ldap_obj else {}
+        old_udm_obj = udm_objs[-1] if old_ldap_obj else {}
+        if old_ldap_obj and not old_udm_obj:
+            raise RuntimeError("Cannot live transform old ldap object")
+        if new_udm_obj and hashes[0] != cached.get("ldap_hash"):
+            await self.cache.store(entry_uuid, {"ldap_hash": hashes[0], "udm": new_udm_obj})
+        return new_udm_obj, old_udm_obj
+
+    @staticmethod
+    def ldap_hash(ldap_obj: dict[str, Any]) -> str:
+        """Hash of the attributes of an LDAP object, independent of their order."""
+        return hashlib.sha256(msgpack.packb(sorted(ldap_obj.items()))).hexdigest()
+
     def objects_to_message(
         self, new_udm_obj: dict[str, Any], old_udm_obj: dict[str, Any], ts: datetime.datetime
     ) -> Message:
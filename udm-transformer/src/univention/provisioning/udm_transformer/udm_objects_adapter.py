@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import logging
+from typing import Any, AsyncIterator, Optional
+
+import aiohttp
+
+from .config import UDMTransformerSettings, udm_transformer_settings
+
+logger = logging.getLogger(__name__)
+
+
+class UDMObjectsAdapter:
+    """
+    Reads all objects from the UDM REST API, page by page.
+
+    Use as an asynchronous context manager to ensure the connections get closed after usage.
+    """
+
+    def __init__(self, settings: Optional[UDMTransformerSettings] = None, page_size: int = 500):
+        self.settings = settings or udm_transformer_settings()
+        self.udm_url = self.settings.udm_url.rstrip("/")
+        self.page_size = page_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "UDMObjectsAdapter":
+        self._session = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(self.settings.udm_username, self.settings.udm_password),
+            headers={"Accept": "application/json"},
+            raise_for_status=True,
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> bool:
+        await self._session.close()
+        return False
+
+    async def get_object_types(self) -> list[str]:
+        async with self._session.get(f"{self.udm_url}/") as response:
+            data = await response.json()
+        return [object_type["name"] for object_type in data["_links"]["udm:object-types"]]
+
+    async def get_objects(self, object_type: str) -> AsyncIterator[dict[str, Any]]:
+        """Yield all objects of `object_type` with all their properties."""
+        params = {"scope": "sub", "hidden": "true", "properties": "*", "limit": str(self.page_size)}
+        page = 1
+        while True:
+            async with self._session.get(
+                f"{self.udm_url}/{object_type}/", params={**params, "page": str(page)}
+            ) as response:
+                data = await response.json()
+            udm_objs = data.get("_embedded", {}).get("udm:object", [])
+            for udm_obj in udm_objs:
+                udm_obj.pop("_links", None)
+                udm_obj.pop("_embedded", None)
+                yield udm_obj
+            if len(udm_objs) < self.page_size:
+                return
+            page += 1
+
+    async def get_all_objects(self, object_types: Optional[list[str]] = None) -> AsyncIterator[dict[str, Any]]:
+        """Yield all objects of `object_types`, of all object types if None."""
+        for object_type in object_types or await self.get_object_types():
+            logger.info("Reading objects of type %r.", object_type)
+            async for udm_obj in self.get_objects(object_type):
+                yield udm_obj
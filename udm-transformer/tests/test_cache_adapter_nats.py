@@ -0,0 +1,169 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from univention.provisioning.backends.key_value_db import BucketLimits, BucketStats, UpdateConflict
+from univention.provisioning.models.constants import BucketName, PublisherName
+from univention.provisioning.udm_transformer import cache_codec
+from univention.provisioning.udm_transformer.cache_adapter_nats import CacheNats
+from univention.provisioning.udm_transformer.cache_port import CacheStats
+from univention.provisioning.udm_transformer.config import UDMTransformerSettings
+from univention.provisioning.udm_transformer.lru import LRUCache
+
+OBJ = {"dn": "cn=test,dc=example,dc=com", "properties": {"name": "test"}}
+ENCODED_OBJ = cache_codec.encode(OBJ, compression_threshold=4096)
+
+
+def settings(**kwargs) -> UDMTransformerSettings:
+    return UDMTransformerSettings(
+        log_level="DEBUG",
+        nats_user="test_user",
+        nats_password="test_password",
+        nats_host="localhost",
+        nats_port=4222,
+        ldap_publisher_name=PublisherName.udm_listener,
+        events_username_udm="test_events",
+        events_password_udm="test_events_pw",
+        udm_url="http://localhost:9979/udm",
+        udm_username="cn=admin",
+        udm_password="test_ldap_pw",
+        provisioning_api_host="localhost",
+        provisioning_api_port=8000,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+async def cache() -> CacheNats:
+    cache = CacheNats(settings())
+    cache._kv_store = AsyncMock()
+    cache._kv_store.get_bytes_with_revision.return_value = (ENCODED_OBJ, 5)
+    cache._kv_store.put_value.return_value = 6
+    await cache.connect()
+    return cache
+
+
+@pytest.mark.anyio
+async def test_retrieve_keeps_entries_in_memory(cache):
+    assert await cache.retrieve("1234-uuid") == OBJ
+    assert await cache.retrieve("1234-uuid") == OBJ
+
+    cache._kv_store.get_bytes_with_revision.assert_called_once_with("1234-uuid", BucketName.cache)
+    cache._kv_store.watch_for_changes.assert_called_once_with(BucketName.cache, cache.changed)
+
+
+@pytest.mark.anyio
+async def test_store_writes_through(cache):
+    await cache.store("1234-uuid", OBJ)
+
+    cache._kv_store.put_value.assert_called_once_with("1234-uuid", ENCODED_OBJ, BucketName.cache)
+    assert await cache.retrieve("1234-uuid") == OBJ
+    cache._kv_store.get_bytes_with_revision.assert_not_called()
+    # The change event of the own write keeps the entry.
+    await cache.changed("1234-uuid", 6)
+    assert "1234-uuid" in cache._lru
+
+
+@pytest.mark.anyio
+async def test_changes_by_others_drop_entries(cache):
+    await cache.retrieve("1234-uuid")
+
+    await cache.changed("1234-uuid", 7)
+
+    assert "1234-uuid" not in cache._lru
+    await cache.retrieve("1234-uuid")
+    assert cache._kv_store.get_bytes_with_revision.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_change_during_retrieve_is_not_cached(cache):
+    async def get_bytes_with_revision(key, bucket):
+        await cache.changed(key, 7)
+        return ENCODED_OBJ, 5
+
+    cache._kv_store.get_bytes_with_revision.side_effect = get_bytes_with_revision
+
+    assert await cache.retrieve("1234-uuid") == OBJ
+    assert "1234-uuid" not in cache._lru
+
+
+@pytest.mark.anyio
+async def test_disabled_in_memory_cache():
+    cache = CacheNats(settings(cache_lru_max_entries=0))
+    cache._kv_store = AsyncMock()
+    # Entries written as JSON by older versions.
+    cache._kv_store.get_bytes_with_revision.return_value = (json.dumps(OBJ).encode(), 5)
+    await cache.connect()
+
+    assert await cache.retrieve("1234-uuid") == OBJ
+    assert await cache.retrieve("1234-uuid") == OBJ
+
+    assert cache._kv_store.get_bytes_with_revision.call_count == 2
+    cache._kv_store.watch_for_changes.assert_not_called()
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2, max_size=10)
+    lru.put("a", "1", 1)
+    lru.put("b", "22", 1)
+    lru.get("a")
+    lru.put("c", "333", 1)
+
+    assert "b" not in lru
+    assert (len(lru), lru.size) == (2, 4)
+
+    lru.put("d", "12345678", 1)
+    assert list(lru._entries) == ["d"]
+    assert lru.size == 8
+
+    lru.put("e", "12345678901", 1)
+    assert "e" not in lru
+
+
+@pytest.mark.anyio
+async def test_create_does_not_overwrite(cache):
+    assert await cache.create("1234-uuid", OBJ)
+    cache._kv_store.put_value.assert_called_once_with("1234-uuid", ENCODED_OBJ, BucketName.cache, revision=0)
+
+    cache._kv_store.put_value.side_effect = UpdateConflict("exists")
+    assert not await cache.create("1234-uuid", OBJ)
+
+
+@pytest.mark.anyio
+async def test_connect_applies_bucket_limits():
+    cache = CacheNats(settings(cache_max_bytes=1024, cache_ttl=3600))
+    cache._kv_store = AsyncMock()
+
+    await cache.connect()
+
+    cache._kv_store.create_kv_store.assert_called_once_with(
+        BucketName.cache, BucketLimits(max_bytes=1024, history=1, ttl=3600)
+    )
+
+
+@pytest.mark.anyio
+async def test_delete(cache):
+    await cache.retrieve("1234-uuid")
+
+    await cache.delete("1234-uuid")
+
+    assert "1234-uuid" not in cache._lru
+    cache._kv_store.delete_kv_pair.assert_called_once_with("1234-uuid", BucketName.cache)
+
+
+@pytest.mark.anyio
+async def test_stats(cache):
+    cache._kv_store.get_bucket_stats.return_value = BucketStats(values=10, bytes=2048)
+    await cache.retrieve("1234-uuid")
+    await cache.retrieve("1234-uuid")
+    cache._kv_store.get_bytes_with_revision.return_value = None
+    await cache.retrieve("5678-uuid")
+
+    stats = await cache.stats()
+
+    assert stats == CacheStats(entries=10, bytes=2048, hits=2, misses=1, memory_hits=1)
+    assert stats.hit_ratio == 2 / 3
@@ -0,0 +1,42 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import json
+
+import pytest
+
+from univention.provisioning.udm_transformer import cache_codec
+
+GROUP = {
+    "dn": "cn=big,cn=groups,dc=example,dc=com",
+    "objectType": "groups/group",
+    "properties": {
+        "name": "big",
+        "users": [f"uid=user{i},cn=users,dc=example,dc=com" for i in range(1000)],
+        "gidNumber": 5000,
+        "sambaRID": None,
+        "allowedEmailGroups": [],
+        "isActive": True,
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "threshold,expected_format", ((1024 * 1024, cache_codec.FORMAT_MSGPACK), (1024, cache_codec.FORMAT_MSGPACK_ZLIB))
+)
+def test_round_trip(threshold, expected_format):
+    data = cache_codec.encode(GROUP, compression_threshold=threshold)
+
+    assert data[0] == expected_format
+    assert cache_codec.decode(data) == GROUP
+
+
+def test_compression():
+    data = cache_codec.encode(GROUP, compression_threshold=1024)
+
+    assert len(data) < len(json.dumps(GROUP)) / 10
+
+
+def test_decode_json():
+    assert cache_codec.decode(json.dumps(GROUP).encode()) == GROUP
+    assert cache_codec.decode(b"") == {}
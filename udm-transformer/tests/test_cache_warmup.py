@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+import json
+from typing import Any, AsyncIterator
+from unittest.mock import AsyncMock
+
+import pytest
+
+from univention.provisioning.models.constants import PublisherName
+from univention.provisioning.udm_transformer.cache_warmup import CacheWarmup, udm_objects_from_file
+from univention.provisioning.udm_transformer.config import UDMTransformerSettings
+from univention.provisioning.udm_transformer.udm_objects_adapter import UDMObjectsAdapter
+
+
+def udm_obj(number: int) -> dict[str, Any]:
+    return {
+        "dn": f"cn=group{number},cn=groups,dc=example,dc=com",
+        "uuid": f"uuid-{number}",
+        "objectType": "groups/group",
+        "properties": {"name": f"group{number}", "univentionObjectIdentifier": f"uoid-{number}"},
+    }
+
+
+async def udm_objs(count: int) -> AsyncIterator[dict[str, Any]]:
+    for number in range(count):
+        yield udm_obj(number)
+
+
+@pytest.mark.anyio
+async def test_warm_up():
+    cache = AsyncMock()
+    cache.create.side_effect = [True, False, RuntimeError("NATS is gone"), True]
+
+    warmup = CacheWarmup(cache, concurrency=2)
+    await warmup.warm_up(udm_objs(4))
+
+    assert (warmup.stored, warmup.skipped, warmup.failed) == (2, 1, 1)
+    cache.create.assert_any_call(
+        "uuid-0",
+        {
+            "dn": "cn=group0,cn=groups,dc=example,dc=com",
+            "id": "uoid-0",
+            "objectType": "groups/group",
+            "properties": {"name": "group0", "univentionObjectIdentifier": "uoid-0"},
+        },
+    )
+
+
+@pytest.mark.anyio
+async def test_warm_up_limits_concurrent_writes():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def create(key: str, value: dict) -> bool:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return True
+
+    warmup = CacheWarmup(AsyncMock(create=AsyncMock(side_effect=create)), concurrency=3)
+    await warmup.warm_up(udm_objs(20))
+
+    assert warmup.stored == 20
+    assert max_in_flight == 3
+
+
+@pytest.mark.anyio
+async def test_udm_objects_from_file(tmp_path):
+    path = tmp_path / "udm.jsonl"
+    path.write_text(f"{json.dumps(udm_obj(1))}\n\n{json.dumps(udm_obj(2))}\n")
+
+    assert [obj async for obj in udm_objects_from_file(path)] == [udm_obj(1), udm_obj(2)]
+
+
+@pytest.mark.anyio
+async def test_udm_objects_adapter_reads_all_pages(httpserver):
+    # The session scoped server may have been stopped by another test.
+    if not httpserver.is_running():
+        httpserver.start()
+    settings = UDMTransformerSettings(
+        log_level="DEBUG",
+        nats_user="test_user",
+        nats_password="test_password",
+        nats_host="localhost",
+        nats_port=4222,
+        ldap_publisher_name=PublisherName.udm_listener,
+        events_username_udm="test_events",
+        events_password_udm="test_events_pw",
+        udm_url=httpserver.url_for("/udm/"),
+        udm_username="cn=admin",
+        udm_password="test_ldap_pw",
+        provisioning_api_host="localhost",
+        provisioning_api_port=8000,
+    )
+    httpserver.expect_request("/udm/").respond_with_json({"_links": {"udm:object-types": [{"name": "groups/group"}]}})
+    for page, numbers in ((1, (1, 2)), (2, (3,))):
+        httpserver.expect_request(
+            "/udm/groups/group/",
+            query_string={"scope": "sub", "hidden": "true", "properties": "*", "limit": "2", "page": str(page)},
+        ).respond_with_json({"_embedded": {"udm:object": [dict(udm_obj(number), _links={}) for number in numbers]}})
+
+    async with UDMObjectsAdapter(settings, page_size=2) as udm:
+        result = [obj async for obj in udm.get_all_objects()]
+
+    assert result == [udm_obj(1), udm_obj(2), udm_obj(3)]
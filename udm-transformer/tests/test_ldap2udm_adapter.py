@@ -0,0 +1,160 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import base64
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from werkzeug import Request, Response
+
+from univention.admin.rest.client import ServerError, ServiceUnavailable, UnprocessableEntity
+from univention.provisioning.models.constants import PublisherName
+from univention.provisioning.udm_transformer.config import UDMTransformerSettings
+from univention.provisioning.udm_transformer.ldap2udm_adapter import Ldap2UdmAdapter
+
+UNMAP_PATH = "/udm/directory/unmap-ldap-attributes"
+UNMAP_BATCH_PATH = "/udm/directory/unmap-ldap-attributes/batch"
+LDAP_OBJ = {
+    "entryDN": [b"cn=test-group,cn=groups,dc=example,dc=com"],
+    "entryUUID": [b"test-uuid"],
+    "cn": [b"test-group"],
+}
+UDM_OBJ = {
+    "dn": "cn=test-group,cn=groups,dc=example,dc=com",
+    "uuid": "test-uuid",
+    "objectType": "groups/group",
+    "properties": {"name": "test-group", "univentionObjectIdentifier": "1234-uoid"},
+}
+
+
+@pytest.fixture
+async def ldap2udm(httpserver):
+    # The session scoped server may have been stopped by another test.
+    if not httpserver.is_running():
+        httpserver.start()
+    settings = UDMTransformerSettings(
+        log_level="DEBUG",
+        nats_user="test_user",
+        nats_password="test_password",
+        nats_host="localhost",
+        nats_port=4222,
+        ldap_publisher_name=PublisherName.udm_listener,
+        events_username_udm="test_events",
+        events_password_udm="test_events_pw",
+        udm_url=httpserver.url_for("/udm/"),
+        udm_username="cn=admin",
+        udm_password="test_ldap_pw",
+        provisioning_api_host="localhost",
+        provisioning_api_port=8000,
+    )
+    async with Ldap2UdmAdapter(settings) as adapter:
+        yield adapter
+
+
+@pytest.mark.anyio
+async def test_ldap_to_udm(ldap2udm, httpserver):
+    httpserver.expect_oneshot_request(
+        UNMAP_PATH,
+        method="POST",
+        json={
+            "dn": "cn=test-group,cn=groups,dc=example,dc=com",
+            "attributes": {k: [base64.b64encode(v[0]).decode()] for k, v in LDAP_OBJ.items()},
+        },
+        headers={"Authorization": "Basic " + base64.b64encode(b"cn=admin:test_ldap_pw").decode()},
+    ).respond_with_json(UDM_OBJ)
+
+    result = await ldap2udm.ldap_to_udm(LDAP_OBJ)
+
+    assert result["id"] == "1234-uoid"
+    assert "uuid" not in result
+    assert result["properties"]["name"] == "test-group"
+    httpserver.check_assertions()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("status,error", [(422, UnprocessableEntity), (500, ServerError)])
+async def test_ldap_to_udm_errors(ldap2udm, httpserver, status, error):
+    httpserver.expect_request(UNMAP_PATH, method="POST").respond_with_json(
+        {"error": {"message": "Something went wrong"}}, status=status
+    )
+
+    with pytest.raises(error, match="Something went wrong"):
+        await ldap2udm.ldap_to_udm(LDAP_OBJ)
+
+
+@pytest.mark.anyio
+@patch("asyncio.sleep", new_callable=AsyncMock)
+async def test_ldap_to_udm_retries_while_unavailable(mock_sleep, ldap2udm, httpserver):
+    httpserver.expect_ordered_request(UNMAP_PATH, method="POST").respond_with_response(
+        Response(status=503, headers={"Retry-After": "3"})
+    )
+    httpserver.expect_ordered_request(UNMAP_PATH, method="POST").respond_with_json(UDM_OBJ)
+
+    result = await ldap2udm.ldap_to_udm(LDAP_OBJ)
+
+    assert result["id"] == "1234-uoid"
+    mock_sleep.assert_called_once_with(3)
+
+
+@pytest.mark.anyio
+@patch("asyncio.sleep", new_callable=AsyncMock)
+async def test_ldap_to_udm_unavailable(mock_sleep, ldap2udm, httpserver):
+    httpserver.expect_request(UNMAP_PATH, method="POST").respond_with_response(Response(status=503))
+
+    with pytest.raises(ServiceUnavailable):
+        await ldap2udm.ldap_to_udm(LDAP_OBJ)
+
+    assert mock_sleep.call_count == 5
+
+
+def unmap_batch(request: Request) -> Response:
+    """Local stand-in for the batch endpoint of the UDM REST API."""
+    results = []
+    for payload in request.json["entries"]:
+        name = base64.b64decode(payload["attributes"]["cn"][0]).decode()
+        if name == "invalid":
+            results.append({"status": 422, "error": {"message": "Invalid object"}})
+        else:
+            results.append({"status": 200, "object": dict(UDM_OBJ, dn=payload["dn"], properties={"name": name})})
+    return Response(json.dumps({"entries": results}), content_type="application/json")
+
+
+def ldap_obj(name: str) -> dict:
+    return dict(LDAP_OBJ, entryDN=[f"cn={name},cn=groups,dc=example,dc=com".encode()], cn=[name.encode()])
+
+
+@pytest.mark.anyio
+async def test_ldap_to_udm_batch(ldap2udm, httpserver):
+    httpserver.expect_oneshot_request(UNMAP_BATCH_PATH, method="POST").respond_with_handler(unmap_batch)
+
+    result = await ldap2udm.ldap_to_udm_batch([ldap_obj("one"), ldap_obj("invalid"), ldap_obj("two")])
+
+    assert [obj["properties"]["name"] for obj in (result[0], result[2])] == ["one", "two"]
+    assert result[0]["dn"] == "cn=one,cn=groups,dc=example,dc=com"
+    assert "uuid" not in result[0]
+    assert isinstance(result[1], UnprocessableEntity)
+    assert "Invalid object" in str(result[1])
+    httpserver.check_assertions()
+
+
+@pytest.mark.anyio
+async def test_ldap_to_udm_batch_falls_back_to_single_requests(ldap2udm, httpserver):
+    httpserver.expect_oneshot_request(UNMAP_BATCH_PATH, method="POST").respond_with_json({}, status=404)
+    httpserver.expect_request(UNMAP_PATH, method="POST").respond_with_json(UDM_OBJ)
+
+    result = await ldap2udm.ldap_to_udm_batch([ldap_obj("one"), ldap_obj("two")])
+    assert [obj["id"] for obj in result] == ["1234-uoid", "1234-uoid"]
+
+    # The batch endpoint is not requested again.
+    await ldap2udm.ldap_to_udm_batch([ldap_obj("three")])
+    assert [request.path for request, _ in httpserver.log].count(UNMAP_BATCH_PATH) == 1
+
+
+@pytest.mark.anyio
+async def test_reload_udm_not_required(ldap2udm, httpserver):
+    ldap2udm.discover_pods_ips = AsyncMock()
+
+    await ldap2udm.reload_udm_if_required({"objectType": "groups/group"})
+
+    ldap2udm.discover_pods_ips.assert_not_called()
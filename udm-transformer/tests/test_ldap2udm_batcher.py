@@ -0,0 +1,71 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from univention.admin.rest.client import ServiceUnavailable, UnprocessableEntity
+from univention.provisioning.udm_transformer.ldap2udm_batcher import Ldap2UdmBatcher
+
+
+def entry(name: str) -> dict:
+    return {"cn": [name.encode()]}
+
+
+@pytest.fixture
+def ldap2udm() -> Mock:
+    ldap2udm = Mock()
+    ldap2udm.ldap_to_udm_batch = AsyncMock(
+        side_effect=lambda entries: [
+            UnprocessableEntity(422, "invalid") if e["cn"][0] == b"invalid" else {"name": e["cn"][0].decode()}
+            for e in entries
+        ]
+    )
+    return ldap2udm
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_are_batched(ldap2udm):
+    batcher = Ldap2UdmBatcher(ldap2udm, batch_size=10, max_delay=0.01)
+
+    results = await asyncio.gather(*(batcher.ldap_to_udm(entry(name)) for name in ("a", "b", "c")))
+
+    assert results == [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+    ldap2udm.ldap_to_udm_batch.assert_called_once_with([entry("a"), entry("b"), entry("c")])
+
+
+@pytest.mark.anyio
+async def test_full_batch_is_sent_without_delay(ldap2udm):
+    batcher = Ldap2UdmBatcher(ldap2udm, batch_size=2, max_delay=60)
+
+    async with asyncio.timeout(1):
+        results = await asyncio.gather(*(batcher.ldap_to_udm(entry(name)) for name in ("a", "b", "c", "d")))
+
+    assert [r["name"] for r in results] == ["a", "b", "c", "d"]
+    assert ldap2udm.ldap_to_udm_batch.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_errors_are_raised_per_entry(ldap2udm):
+    batcher = Ldap2UdmBatcher(ldap2udm, batch_size=2, max_delay=0.01)
+
+    results = await asyncio.gather(
+        batcher.ldap_to_udm(entry("invalid")), batcher.ldap_to_udm(entry("a")), return_exceptions=True
+    )
+
+    assert isinstance(results[0], UnprocessableEntity)
+    assert results[1] == {"name": "a"}
+
+
+@pytest.mark.anyio
+async def test_failed_batch_raises_for_all_entries(ldap2udm):
+    ldap2udm.ldap_to_udm_batch.side_effect = ServiceUnavailable(503, "unavailable")
+    batcher = Ldap2UdmBatcher(ldap2udm, batch_size=2, max_delay=0.01)
+
+    results = await asyncio.gather(
+        batcher.ldap_to_udm(entry("a")), batcher.ldap_to_udm(entry("b")), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ServiceUnavailable) for result in results)
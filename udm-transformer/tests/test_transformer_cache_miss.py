@@ -21,7 +21,7 @@ def mock_cache():
 @pytest.fixture
 def mock_ldap2udm():
     ldap2udm = Mock()
-    ldap2udm.ldap_to_udm = Mock(
+    ldap2udm.ldap_to_udm = AsyncMock(
         return_value={
             "dn": "cn=test-group,cn=groups,dc=example,dc=com",
             "id": "1234-uoid",
@@ -29,7 +29,7 @@ def mock_ldap2udm():
             "properties": {"name": "test-group"},
         }
     )
-    ldap2udm.reload_udm_if_required = Mock()
+    ldap2udm.reload_udm_if_required = AsyncMock()
     return ldap2udm
 
 
@@ -225,3 +225,86 @@ async def test_handle_change_with_cache_miss(transformer_service, mock_cache, mo
 
     assert sent_message.body.old == old_udm_obj
     assert sent_message.body.new == new_udm_obj
+
+
+OLD_LDAP_OBJ = {
+    "entryUUID": [b"test-uuid-789"],
+    "entryDN": [b"cn=modified-group,cn=groups,dc=example,dc=com"],
+    "univentionObjectType": [b"groups/group"],
+    "cn": [b"old-name"],
+}
+NEW_LDAP_OBJ = dict(OLD_LDAP_OBJ, cn=[b"new-name"])
+OLD_UDM_OBJ = {
+    "dn": "cn=modified-group,cn=groups,dc=example,dc=com",
+    "id": "1234-uoid",
+    "objectType": "groups/group",
+    "properties": {"name": "old-name"},
+}
+NEW_UDM_OBJ = dict(OLD_UDM_OBJ, properties={"name": "new-name"})
+
+
+@pytest.fixture
+def ldap_cache_mode(transformer_service, mock_ldap2udm):
+    transformer_service.settings.cache_mode = "ldap"
+    udm_objs = {b"old-name": OLD_UDM_OBJ, b"new-name": NEW_UDM_OBJ}
+    mock_ldap2udm.ldap_to_udm_batch = AsyncMock(side_effect=lambda ldap_objs: [udm_objs[o["cn"][0]] for o in ldap_objs])
+
+
+@pytest.mark.anyio
+async def test_ldap_cache_mode_hit(transformer_service, mock_cache, mock_ldap2udm, mock_event_sender, ldap_cache_mode):
+    ts = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    mock_cache.retrieve.return_value = {
+        "ldap_hash": TransformerService.ldap_hash(dict(reversed(OLD_LDAP_OBJ.items()))),
+        "udm": OLD_UDM_OBJ,
+    }
+
+    await transformer_service.handle_change(NEW_LDAP_OBJ, OLD_LDAP_OBJ, ts)
+
+    mock_ldap2udm.ldap_to_udm_batch.assert_called_once_with([NEW_LDAP_OBJ])
+    mock_cache.store.assert_called_once_with(
+        "test-uuid-789",
+        {"ldap_hash": TransformerService.ldap_hash(NEW_LDAP_OBJ), "udm": NEW_UDM_OBJ},
+    )
+    sent_message = mock_event_sender.send_event.call_args[0][0]
+    assert sent_message.body.old == OLD_UDM_OBJ
+    assert sent_message.body.new == NEW_UDM_OBJ
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("cached", ({}, {"dn": "cn=modified-group,cn=groups,dc=example,dc=com"}, {"ldap_hash": "1"}))
+async def test_ldap_cache_mode_miss_transforms_in_one_request(
+    transformer_service, mock_cache, mock_ldap2udm, mock_event_sender, ldap_cache_mode, cached
+):
+    mock_cache.retrieve.return_value = cached
+
+    await transformer_service.handle_change(NEW_LDAP_OBJ, OLD_LDAP_OBJ, datetime.datetime(2024, 1, 1, 12, 0, 0))
+
+    mock_ldap2udm.ldap_to_udm_batch.assert_called_once_with([NEW_LDAP_OBJ, OLD_LDAP_OBJ])
+    mock_ldap2udm.ldap_to_udm.assert_not_called()
+    sent_message = mock_event_sender.send_event.call_args[0][0]
+    assert sent_message.body.old == OLD_UDM_OBJ
+    assert sent_message.body.new == NEW_UDM_OBJ
+
+
+@pytest.mark.anyio
+async def test_ldap_cache_mode_entry_read_in_udm_mode(transformer_service, mock_cache, mock_ldap2udm):
+    mock_cache.retrieve.return_value = {"ldap_hash": "1", "udm": copy.deepcopy(OLD_UDM_OBJ)}
+
+    result = await transformer_service.old_ldap_to_udm_obj(OLD_LDAP_OBJ)
+
+    assert result == OLD_UDM_OBJ
+    mock_ldap2udm.ldap_to_udm.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_handle_change_remove_deletes_cache_entry(
+    transformer_service, mock_cache, mock_ldap2udm, mock_event_sender
+):
+    mock_cache.retrieve.return_value = copy.deepcopy(OLD_UDM_OBJ)
+    mock_event_sender.send_event.side_effect = lambda message: mock_cache.delete.assert_not_called()
+
+    await transformer_service.handle_change({}, OLD_LDAP_OBJ, datetime.datetime(2024, 1, 1, 12, 0, 0))
+
+    mock_event_sender.send_event.assert_called_once()
+    mock_cache.delete.assert_called_once_with("test-uuid-789")
+    mock_cache.store.assert_not_called()
@@ -0,0 +1,201 @@
+# SPDX-License-Identifier: AGPL-3.0-only
+# SPDX-FileCopyrightText: 2025 Univention GmbH
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from univention.admin.rest.client import ServiceUnavailable
+from univention.provisioning.backends.message_pipeline import BARRIER
+from univention.provisioning.backends.message_queue import Acknowledgements, Empty, MessageAckManager, QueueStatus
+from univention.provisioning.backends.nats_mq import LdapQueue
+from univention.provisioning.models.constants import PublisherName
+from univention.provisioning.models.message import MQMessage
+from univention.provisioning.udm_transformer.config import UDMTransformerSettings
+from univention.provisioning.udm_transformer.transformer_service import TransformerService
+
+
+def ldap_message(sequence_number: int, entry_uuid: bytes, cn: bytes, object_type: bytes = b"groups/group") -> MQMessage:
+    ldap_obj = {
+        "entryUUID": [entry_uuid],
+        "entryDN": [b"cn=" + cn + b",cn=groups,dc=example,dc=com"],
+        "univentionObjectType": [object_type],
+        "cn": [cn],
+    }
+    return MQMessage(
+        subject="ldap-producer",
+        reply="",
+        data={
+            "publisher_name": "udm-listener",
+            "ts": "2025-01-01T12:00:00",
+            "realm": "ldap",
+            "topic": "ldap",
+            "body": {"old": {}, "new": ldap_obj},
+        },
+        headers=None,
+        num_delivered=1,
+        sequence_number=sequence_number,
+    )
+
+
+def acknowledgements() -> Acknowledgements:
+    return Acknowledgements(AsyncMock(), AsyncMock(), AsyncMock())
+
+
+@pytest.fixture
+def transformer_service() -> TransformerService:
+    settings = UDMTransformerSettings(
+        log_level="DEBUG",
+        nats_user="test_user",
+        nats_password="test_password",
+        nats_host="localhost",
+        nats_port=4222,
+        ldap_publisher_name=PublisherName.udm_listener,
+        events_username_udm="test_events",
+        events_password_udm="test_events_pw",
+        udm_url="http://localhost:9979/udm",
+        udm_username="cn=admin",
+        udm_password="test_ldap_pw",
+        provisioning_api_host="localhost",
+        provisioning_api_port=8000,
+        pipeline_size=4,
+    )
+    ldap2udm = AsyncMock()
+    ldap2udm.ldap_to_udm = AsyncMock(side_effect=ldap_to_udm)
+    subscriptions = AsyncMock()
+    subscriptions.initialize_subscription.return_value = QueueStatus.READY
+    return TransformerService(
+        ack_manager=MessageAckManager(),
+        cache=AsyncMock(),
+        event_sender=AsyncMock(),
+        ldap2udm=ldap2udm,
+        subscriptions=subscriptions,
+        settings=settings,
+    )
+
+
+def fetch_once(messages: list[tuple[MQMessage, Acknowledgements]]) -> AsyncMock:
+    batches = [messages]
+
+    async def get_message_batch(max_messages: int, timeout: float):
+        if batches:
+            return batches.pop()
+        await asyncio.sleep(0.01)
+        raise Empty()
+
+    return AsyncMock(side_effect=get_message_batch)
+
+
+async def ldap_to_udm(ldap_obj: dict) -> dict:
+    name = ldap_obj["cn"][0].decode()
+    if name == "slow":
+        await asyncio.sleep(0.05)
+    elif name == "unavailable":
+        raise ServiceUnavailable(503, "UDM REST API is restarting")
+    elif name == "broken":
+        raise RuntimeError("unexpected")
+    return {"dn": ldap_obj["entryDN"][0].decode(), "objectType": "groups/group", "properties": {"name": name}}
+
+
+@pytest.mark.anyio
+async def test_pipelined_transformation_keeps_order_per_object(transformer_service):
+    messages = [
+        (ldap_message(1, b"uuid-1", b"slow"), acknowledgements()),
+        (ldap_message(2, b"uuid-2", b"other"), acknowledgements()),
+        (ldap_message(3, b"uuid-1", b"after-slow"), acknowledgements()),
+        (ldap_message(4, b"uuid-3", b"unavailable"), acknowledgements()),
+    ]
+    transformer_service.subscriptions.get_message_batch = fetch_once(messages)
+
+    # Stops when UDM is unavailable, after the other changes were handled.
+    await transformer_service.listen_for_ldap_events()
+
+    transformer_service.subscriptions.initialize_subscription.assert_called_once_with(LdapQueue(max_ack_pending=4))
+    sent = [
+        call.args[0].body.new["properties"]["name"] for call in transformer_service.event_sender.send_event.mock_calls
+    ]
+    assert sent.index("other") < sent.index("slow") < sent.index("after-slow")
+    for _, acks in messages[:3]:
+        acks.acknowledge_message.assert_called_once_with()
+    messages[3][1].acknowledge_message_negatively.assert_called_once_with()
+
+
+@pytest.mark.anyio
+async def test_pipelined_transformation_of_reload_triggers_is_serialized(transformer_service):
+    messages = [
+        (ldap_message(1, b"uuid-1", b"slow"), acknowledgements()),
+        (ldap_message(2, b"uuid-2", b"other"), acknowledgements()),
+        (ldap_message(3, b"uuid-3", b"attribute", b"settings/extended_attribute"), acknowledgements()),
+        (ldap_message(4, b"uuid-4", b"after-attribute"), acknowledgements()),
+        (ldap_message(5, b"uuid-5", b"unavailable"), acknowledgements()),
+    ]
+    transformer_service.subscriptions.get_message_batch = fetch_once(messages)
+
+    await transformer_service.listen_for_ldap_events()
+
+    sent = [
+        call.args[0].body.new["properties"]["name"] for call in transformer_service.event_sender.send_event.mock_calls
+    ]
+    assert sent == ["other", "slow", "attribute", "after-attribute"]
+    transformer_service.ldap2udm.reload_udm_if_required.assert_any_call(
+        {
+            "dn": "cn=attribute,cn=groups,dc=example,dc=com",
+            "objectType": "groups/group",
+            "properties": {"name": "attribute"},
+        }
+    )
+    for _, acks in messages[:4]:
+        acks.acknowledge_message.assert_called_once_with()
+    messages[4][1].acknowledge_message_negatively.assert_called_once_with()
+
+
+@pytest.mark.anyio
+async def test_pipelined_transformation_raises_unexpected_errors(transformer_service):
+    messages = [
+        (ldap_message(1, b"uuid-1", b"broken"), acknowledgements()),
+        (ldap_message(2, b"uuid-2", b"other"), acknowledgements()),
+    ]
+    transformer_service.subscriptions.get_message_batch = fetch_once(messages)
+
+    with pytest.raises(RuntimeError, match="unexpected"):
+        await transformer_service.listen_for_ldap_events()
+
+    messages[0][1].acknowledge_message_negatively.assert_called_once_with()
+    messages[1][1].acknowledge_message.assert_called_once_with()
+
+
+@pytest.mark.anyio
+async def test_pipelined_transformation_keeps_order_per_object_after_failure(transformer_service):
+    # The failed change is negatively acknowledged only after the slow one, the later change of the same object
+    # must not overtake it while the pipeline is full.
+    transformer_service.settings.pipeline_size = 2
+    messages = [
+        (ldap_message(1, b"uuid-2", b"slow"), acknowledgements()),
+        (ldap_message(2, b"uuid-1", b"broken"), acknowledgements()),
+        (ldap_message(3, b"uuid-1", b"after-broken"), acknowledgements()),
+    ]
+    transformer_service.subscriptions.get_message_batch = fetch_once(messages)
+
+    with pytest.raises(RuntimeError, match="unexpected"):
+        await transformer_service.listen_for_ldap_events()
+
+    sent = [
+        call.args[0].body.new["properties"]["name"] for call in transformer_service.event_sender.send_event.mock_calls
+    ]
+    assert sent == ["slow"]
+    messages[0][1].acknowledge_message.assert_called_once_with()
+    messages[1][1].acknowledge_message_negatively.assert_called_once_with()
+    messages[2][1].acknowledge_message_negatively.assert_called_once_with()
+    messages[2][1].acknowledge_message.assert_not_called()
+
+
+def test_message_key():
+    message = ldap_message(1, b"uuid-1", b"name")
+    assert TransformerService.message_key(message) == b"uuid-1"
+
+    message.data["body"] = {"old": message.data["body"]["new"], "new": {}}
+    assert TransformerService.message_key(message) == b"uuid-1"
+
+    message = ldap_message(2, b"uuid-2", b"attribute", b"settings/extended_attribute")
+    assert TransformerService.message_key(message) is BARRIER